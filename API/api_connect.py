@@ -1,39 +1,27 @@
 from crypt import methods
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 import json
-import threading
 import datetime
 import pandas as pd
-from time import sleep
 from flask_cors import CORS, cross_origin
 
-from Strategy.five_ema import FiveEMA
-from Strategy.short_straddle import ShortStraddle
-from Broker.main_broker import Zerodha
+from API.engine_link import EngineUnavailable
 import settings
 
 app = Flask(__name__)
 cors = CORS(app)
 app.config['CORS_HEADERS'] = 'Content-Type'
 
-broker_instance = Zerodha()
-five_ema_strategy_instance = FiveEMA(broker_instance)
-short_straddle_strategy_instance = ShortStraddle(broker_instance)
-short_straddle_thread = threading.Thread(target=short_straddle_strategy_instance.run_short_straddle)
-short_straddle_thread.start()
+if settings.ENGINE_MODE == "remote":    # Engine runs in its own process, started with python main.py engine
+    from API.remote_engine import RemoteEngine
+    engine = RemoteEngine()
+else:
+    from API.trading_engine import TradingEngine
+    engine = TradingEngine()
 
-def update_broker_instance_on_new_day():
-    """
-    Updates broker instance at the start of the day
-    """
-    global broker_instance
-    while True:
-        if datetime.datetime.now().time() >= datetime.time(9, 15, 15, 0) and datetime.datetime.now().time() <= datetime.time(9, 16, 0, 0):
-            broker_instance = Zerodha()
-        sleep(20)
-
-broker_replacement_thread = threading.Thread(target=update_broker_instance_on_new_day)
-broker_replacement_thread.start()
+@app.errorhandler(EngineUnavailable)
+def engine_unavailable(e):
+    return f"TRADING ENGINE UNAVAILABLE : {e}", 503
 
 
 @app.route("/", methods=['GET'])
@@ -53,29 +41,19 @@ def change_params():
     "stoploss": new_params['STOPLOSS'],
     "paper_trading": new_params['PAPER_TRADING']
     }   
-    with open(settings.ACTION_PROPERTIES_FILE, 'w') as file:
-        file.write(json.dumps(new_properties, indent=4))
+    engine.change_params(new_properties)
     return "PARAMS UPDATED", 200
 
 @app.route("/make_bot_active", methods=['POST'])
 @cross_origin()
 def make_bot_active():
-    global five_ema_strategy_instance
     bot_status = json.loads(request.data)
-    if bot_status['STATUS'] == "ACTIVE":
-        strategy_instance_thread = threading.Thread(target=five_ema_strategy_instance.run_5ema)
-        strategy_instance_thread.start()
-    else:
-        if five_ema_strategy_instance != None:
-            five_ema_strategy_instance.strategy_active_flag = False
+    engine.set_bot_active(bot_status['STATUS'] == "ACTIVE")
     return "BOT STATUS UPDATED", 200
 
 @app.route("/get_bot_status", methods=['GET'])
 def get_bot_status():
-    global five_ema_strategy_instance
-    if five_ema_strategy_instance == None:
-        return "0", 200
-    if five_ema_strategy_instance.strategy_active_flag == True:
+    if engine.bot_status() == True:
         return "1", 200
     else:
         return "0", 200
@@ -83,13 +61,11 @@ def get_bot_status():
 @app.route('/fetch_attributes', methods=['GET'])
 @cross_origin()
 def fetch_attributes():
-    global broker_instance
-
     month_mapping = {1:"JAN", 2:"FEB", 3:"MAR", 4:"APR", 5:"MAY", 6:"JUN", 7:"JUL", 8:"AUG", 9:"SEP", 10:"OCT", 11:"NOV", 12:"DEC"}
     month = month_mapping[datetime.date.today().month]
     year = (datetime.date.today().year)%100
     tradingsymbol = f"BANKNIFTY{year}{month}FUT"
-    if broker_instance.check_trading_symbol(tradingsymbol) != True:
+    if engine.check_trading_symbol(tradingsymbol) != True:
         month = month_mapping[(datetime.date.today().month + 1)%12]
         if datetime.date.today().month == 12:
             year = year+1
@@ -106,37 +82,91 @@ def fetch_attributes():
 @app.route('/positions', methods=['GET'])
 @cross_origin()
 def fetch_positions():
-    global five_ema_strategy_instance, short_straddle_strategy_instance
-    response_five_ema = five_ema_strategy_instance.get_positions()
-    response_short_straddle = short_straddle_strategy_instance.get_positions()
-    response = response_five_ema + response_short_straddle
-    response = [x for x in response if x != None]
-    return jsonify(response), 200
-
-@app.route('/tradebook', methods=['GET'])
+    """
+    Open positions of all the strategies with live PnL, served from the prebuilt payload of the
+    positions view. A request with If-None-Match of the current version gets 304. With wait=<sec> as
+    well, it is held till the positions change or the wait (POSITIONS_LONG_POLL_TIMEOUT at most) expires.
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), settings.POSITIONS_LONG_POLL_TIMEOUT)
+    except ValueError as e:
+        return f"Invalid positions query : {e}", 400
+
+    etag = request.headers.get('If-None-Match')
+    current_etag, payload = engine.positions(etag, wait)
+    if current_etag == etag:
+        return Response(status=304, headers={"ETag": current_etag})
+    return Response(payload, mimetype="application/json", headers={"ETag": current_etag, "Cache-Control": "no-cache"})
+
+@app.route('/stream', methods=['GET'])
 @cross_origin()
-def fetch_tradebook():
-    import csv
-    with open(settings.CSV_LOGS_FILE, mode='r') as infile:
-        reader = csv.reader(infile)
-        counter = 0
-        response = []
-
-        keys = ['orderID', 'dateTimes', 'instrumentType', 'orderType', 'quantity', 'target', 'stoploss', 'trailingSL', 'bankFutPrice', 'paperTrade']
-        for row in reader:
-            if counter == 0:
-                pass
-            else:
-                new_dict = {}
-                for i in range(len(keys)):
-                    new_dict[keys[i]] = row[i]
-                response.append(new_dict)
-            counter += 1
-
-    json_response = json.dumps(response, indent=4)
-    print(json_response)
-    return json_response, 200
+def stream_events():
+    """
+    Server-Sent Events stream of the live state : "positions" (same payload as /positions), "ltp"
+    ({instrument_token: last_price}) and "strategy" (state transitions of the strategies). A new
+    client gets the current positions and LTPs first. The stream ends when the broker is replaced for
+    the next day or the client falls behind, the browser then reconnects to the current one with the
+    id of the last strategy event it got (Last-Event-ID) and gets the recent events it missed.
+    """
+    return Response(engine.stream(request.headers.get('Last-Event-ID')), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    
+@app.route('/risk', methods=['GET'])
+@cross_origin()
+def fetch_risk():
+    """
+    Portfolio risk of the open legs of all the strategies : MTM (realized, unrealized, per strategy),
+    peak MTM, max loss and margin at risk of the day, and whether the portfolio rules halted trading
+    """
+    return jsonify(engine.risk()), 200
 
+def tradebook_entry(fill):
+    """
+    Returns the fill in the form shown by the dashboard tradebook
+    """
+    return {
+        "id": fill['id'],
+        "orderID": fill['order_id'],
+        "dateTimes": fill['date_time'],
+        "strategy": fill['strategy'],
+        "instrumentType": fill['tradingsymbol'],
+        "orderType": fill['transaction_type'],
+        "quantity": fill['quantity'],
+        "price": fill['price'],
+        "target": fill['target'],
+        "stoploss": fill['stoploss'],
+        "trailingSL": fill['trailing_sl'],
+        "bankFutPrice": fill['underlying_price'],
+        "paperTrade": bool(fill['paper_trade']),
+        "reason": fill['reason']
+    }
 
+@app.route('/tradebook', methods=['GET'])
+@cross_origin()
+def fetch_tradebook():
+    """
+    Fills of the trade journal, newest first, one page per request. Query parameters (all optional):
+    from, to (YYYY-MM-DD), strategy, symbol, paper (true/false), limit, cursor (next_cursor of the
+    previous page). Response : {"fills": [...], "next_cursor": id or null}, streamed as it is read.
+    """
+    try:
+        from_date = datetime.datetime.strptime(request.args['from'], "%Y-%m-%d").date() if 'from' in request.args else None
+        to_date = datetime.datetime.strptime(request.args['to'], "%Y-%m-%d").date() if 'to' in request.args else None
+        paper_trade = request.args['paper'].lower() == "true" if 'paper' in request.args else None
+        limit = max(1, min(int(request.args.get('limit', settings.TRADEBOOK_PAGE_SIZE)), settings.TRADEBOOK_MAX_PAGE_SIZE))  # SQLite reads LIMIT -1 as no limit
+        cursor = int(request.args['cursor']) if 'cursor' in request.args else None
+    except ValueError as e:
+        return f"Invalid tradebook query : {e}", 400
+
+    fills = engine.journal.iter_fills(
+        limit, from_date, to_date, request.args.get('strategy'), request.args.get('symbol'), paper_trade, cursor
+    )
+
+    def generate():
+        yield '{"fills": ['
+        count, last_id = 0, None
+        for fill in fills:
+            yield ("," if count > 0 else "") + json.dumps(tradebook_entry(fill))
+            count, last_id = count + 1, fill['id']
+        yield f'], "next_cursor": {json.dumps(last_id if count == limit else None)}}}'
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
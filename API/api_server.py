@@ -0,0 +1,38 @@
+# WEB
+from gunicorn.app.base import BaseApplication
+
+# CUSTOM
+import settings
+
+
+class APIServer(BaseApplication):
+    """
+    Gunicorn server of the API in remote engine mode : API_WORKER_PROCESSES pre-forked workers with
+    API_WORKER_THREADS threads each, so /stream clients and /positions long-polls only hold a thread.
+    The app is imported in every worker, which keeps its connection to the engine snapshot for its
+    lifetime.
+    """
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from API.api_connect import app
+        return app
+
+
+def serve():
+    """
+    Runs the API server till it is stopped
+    """
+    APIServer({
+        "bind": settings.API_BIND,
+        "workers": settings.API_WORKER_PROCESSES,
+        "worker_class": "gthread",
+        "threads": settings.API_WORKER_THREADS,
+        "timeout": settings.API_WORKER_TIMEOUT
+    }).run()
@@ -0,0 +1,131 @@
+# SYSTEM
+import struct
+import threading
+import logging
+from time import time, sleep
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import Listener, Client
+
+# CUSTOM
+import settings
+
+SEQUENCE = struct.Struct("<Q")  # Odd while a snapshot is being written
+LENGTH = struct.Struct("<Q")
+HEADER_SIZE = 16    # Sequence, length of the snapshot, then the snapshot
+
+
+class EngineUnavailable(Exception):
+    """
+    The engine process is not running or not answering
+    """
+
+
+class SharedSnapshot:
+    """
+    Latest state published by the engine process in a shared memory segment, read by any number of
+    API processes without a round trip to the engine. The writer makes the sequence odd before and
+    even after writing (seqlock), a reader retries a copy that overlapped a write.
+    """
+    def __init__(self, create=False, name=settings.ENGINE_SNAPSHOT_NAME, size=settings.ENGINE_SNAPSHOT_SIZE):
+        self.owner = create
+        if create:
+            try:    # Left behind by an engine which was killed
+                stale = shared_memory.SharedMemory(name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+            SEQUENCE.pack_into(self.memory.buf, 0, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(self.memory._name, "shared_memory")    # The segment is removed by the engine only
+        self.sequence = 0
+
+    def write(self, payload):
+        """
+        Publishes the snapshot (bytes). Engine process only, from a single thread.
+        """
+        if HEADER_SIZE + len(payload) > self.memory.size:
+            raise ValueError(f"Snapshot of {len(payload)} bytes does not fit ENGINE_SNAPSHOT_SIZE")
+        buffer = self.memory.buf
+        SEQUENCE.pack_into(buffer, 0, self.sequence + 1)
+        buffer[HEADER_SIZE:HEADER_SIZE + len(payload)] = payload
+        LENGTH.pack_into(buffer, SEQUENCE.size, len(payload))
+        self.sequence += 2
+        SEQUENCE.pack_into(buffer, 0, self.sequence)
+
+    def read(self):
+        """
+        Returns (sequence, snapshot bytes) of the latest snapshot, snapshot is None if nothing was
+        published yet or the writer did not finish within a second
+        """
+        buffer = self.memory.buf
+        deadline = time() + 1
+        while time() < deadline:
+            sequence = SEQUENCE.unpack_from(buffer, 0)[0]
+            if sequence % 2 == 1:
+                sleep(0.001)
+                continue
+            length = LENGTH.unpack_from(buffer, SEQUENCE.size)[0]
+            payload = bytes(buffer[HEADER_SIZE:HEADER_SIZE + length])
+            if SEQUENCE.unpack_from(buffer, 0)[0] == sequence:
+                return sequence, (payload if sequence > 0 else None)
+        return 0, None
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class CommandServer:
+    """
+    Serves the commands (name, kwargs) of the API processes with the handlers of the engine, each
+    connection on its own thread. Replies are ("OK", result) or ("ERROR", message).
+    """
+    def __init__(self, handlers, logger=None, address=settings.ENGINE_COMMAND_ADDRESS):
+        self.handlers = handlers
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.listener = Listener(address, authkey=settings.ENGINE_AUTHKEY)
+        self.thread = threading.Thread(target=self.run, name="CommandServer", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except Exception as e:  # Failed authentication
+                self.logger.error("Command connection refused", exc_info=True)
+                continue
+            threading.Thread(target=self.serve_connection, args=(connection,), daemon=True).start()
+
+    def serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    name, kwargs = connection.recv()
+                except EOFError:
+                    return
+                try:
+                    reply = ("OK", self.handlers[name](**kwargs))
+                except Exception as e:
+                    self.logger.error(f"Command {name} failed", exc_info=True)
+                    reply = ("ERROR", f"{type(e).__name__}: {e}")
+                connection.send(reply)
+
+
+def send_command(name, **kwargs):
+    """
+    Runs the command on the engine process and returns its result. Raises EngineUnavailable if the
+    engine cannot be reached, RuntimeError if the command failed.
+    """
+    try:
+        with Client(settings.ENGINE_COMMAND_ADDRESS, authkey=settings.ENGINE_AUTHKEY) as connection:
+            connection.send((name, kwargs))
+            status, result = connection.recv()
+    except (OSError, EOFError) as e:
+        raise EngineUnavailable(f"Engine command channel unavailable : {e}")
+    if status != "OK":
+        raise RuntimeError(result)
+    return result
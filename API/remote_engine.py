@@ -0,0 +1,122 @@
+# SYSTEM
+import json
+import threading
+from time import time, sleep
+
+# CUSTOM
+from API.engine_link import SharedSnapshot, EngineUnavailable, send_command
+from Broker.event_stream import sse_frame, parse_event_id
+from Broker.trade_journal import get_journal
+import settings
+
+
+class RemoteEngine:
+    """
+    Same surface as TradingEngine for an API process when the engine runs in its own process. State
+    is read from the shared snapshot, commands are forwarded over the command channel and the
+    tradebook is read from the journal database directly.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None    # Attached on first use, after the engine has created it
+        self.sequence = None
+        self.state = None
+        self.positions_payload = None   # (etag, payload) serialized once per positions version
+
+    @property
+    def journal(self):
+        return get_journal(settings.TRADE_JOURNAL_FILE)
+
+    def read(self):
+        """
+        Returns the latest snapshot of the engine (dictionary), parsed once per version. Raises
+        EngineUnavailable if the engine is not publishing.
+        """
+        with self.lock:
+            if self.snapshot == None:
+                try:
+                    self.snapshot = SharedSnapshot()
+                except FileNotFoundError:
+                    raise EngineUnavailable("Engine snapshot not found, is the engine process running?")
+            sequence, payload = self.snapshot.read()
+            if payload != None and sequence != self.sequence:
+                self.sequence, self.state = sequence, json.loads(payload)
+            if payload == None or time() - self.state['published_at'] > settings.ENGINE_SNAPSHOT_STALE:
+                self.snapshot.close()   # Engine stopped, a restarted engine creates a new segment
+                self.snapshot, self.sequence, self.state = None, None, None
+                raise EngineUnavailable("Engine snapshot is stale, is the engine process running?")
+            return self.state
+
+    # =================================================================================================================
+    # COMMANDS
+    def change_params(self, params):
+        send_command("change_params", params=params)
+
+    def set_bot_active(self, active):
+        send_command("set_bot_active", active=active)
+
+    def bot_status(self):
+        return self.read()['bot_status']
+
+    def check_trading_symbol(self, tradingsymbol):
+        return send_command("check_trading_symbol", tradingsymbol=tradingsymbol)
+
+    # =================================================================================================================
+    # STATE
+    def positions(self, etag=None, wait=0):
+        """
+        Returns (etag, payload) of the engine positions. If etag is current and wait (in sec) is
+        passed, polls the snapshot till the positions change or the wait expires.
+        """
+        deadline = time() + wait
+        while True:
+            state = self.read()
+            if state['positions_etag'] != etag or time() >= deadline:
+                break
+            sleep(settings.ENGINE_SNAPSHOT_INTERVAL)
+        with self.lock:
+            if self.positions_payload == None or self.positions_payload[0] != state['positions_etag']:
+                self.positions_payload = (state['positions_etag'], json.dumps(state['positions']).encode())
+            return self.positions_payload
+
+    def risk(self):
+        return self.read()['risk']
+
+    def stream(self, last_event_id=None):
+        """
+        Yields the Server-Sent Events frames of the snapshot changes, polled every
+        STREAM_PUBLISH_INTERVAL. Same events as the embedded stream, a new client starts with the
+        current positions and LTPs and a reconnecting one (last_event_id) with the recent events it
+        missed. Ends when the engine stops.
+        """
+        yield b"retry: 3000\n\n"
+        positions_etag, ltp = None, None
+        stream, last_event = parse_event_id(last_event_id)
+        sent_at = time()
+        while True:
+            try:
+                state = self.read()
+            except EngineUnavailable:
+                return
+            frames = []
+            if state['positions_etag'] != positions_etag:
+                positions_etag = state['positions_etag']
+                frames.append(sse_frame("positions", state['positions']))
+            if state['ltp'] != ltp:
+                ltp = state['ltp']
+                frames.append(sse_frame("ltp", ltp))
+            if state['stream'] != stream:   # Events of a new broker are all new, a new client skips the past ones
+                last_event = -1 if stream != None else (state['events'][-1][0] if state['events'] else -1)
+                stream = state['stream']
+            for sequence, event, data in state['events']:
+                if sequence > last_event:
+                    frames.append(sse_frame(event, data, f"{stream}-{sequence}"))
+                    last_event = sequence
+
+            if frames:
+                yield b"".join(frames)
+                sent_at = time()
+            elif time() - sent_at >= settings.STREAM_HEARTBEAT_INTERVAL:
+                yield b": keepalive\n\n"
+                sent_at = time()
+            sleep(settings.STREAM_PUBLISH_INTERVAL)
@@ -0,0 +1,156 @@
+# SYSTEM
+import json
+import datetime
+from time import time, sleep
+
+# CUSTOM
+from Strategy.five_ema import FiveEMA
+from Strategy.short_straddle import ShortStraddle
+from Strategy.strategy_runtime import StrategyRuntime
+from Broker.main_broker import Zerodha
+from API.engine_link import SharedSnapshot, CommandServer
+import settings
+
+STRATEGY_TYPES = {"FiveEMA": FiveEMA, "ShortStraddle": ShortStraddle}  # Strategies of STRATEGY_INSTANCES
+
+
+class TradingEngine:
+    """
+    Broker and strategies of the trading day. Used directly by the API in embedded mode, or run as
+    its own process (serve) publishing its state to the shared snapshot and taking commands from the
+    API processes, so HTTP load never competes with the tick path for the GIL.
+    """
+    def __init__(self):
+        self.broker_instance = Zerodha()
+        self.runtime = StrategyRuntime(self.broker_instance)   # One loop for all the strategy instances
+        for instance in settings.STRATEGY_INSTANCES:
+            self.runtime.add(STRATEGY_TYPES[instance['strategy']](self.runtime, instance['name'], instance.get('params')))
+        self.runtime.run(*[x['name'] for x in settings.STRATEGY_INSTANCES if x.get('autostart') == True])
+
+        # Login takes a while, so it is spawned off the scheduler thread
+        self.broker_instance.scheduler.daily(datetime.time(9, 15, 15, 0), self.broker_instance.clock.spawn, self.update_broker_instance_on_new_day)
+
+    def update_broker_instance_on_new_day(self):
+        """
+        Updates broker instance at the start of the day. The tick recorder and session events (this
+        one included) move to the new broker, then the old one is closed.
+        """
+        old_broker, self.broker_instance = self.broker_instance, Zerodha(self.broker_instance.tick_recorder)
+        old_broker.tick_recorder = None     # Ticks are recorded once, from the new ticker
+        old_broker.scheduler.move_to(self.broker_instance.scheduler)
+        self.runtime.update_broker(self.broker_instance)
+        old_broker.close()
+
+    @property
+    def journal(self):
+        return self.broker_instance.journal
+
+    # =================================================================================================================
+    # COMMANDS
+    def change_params(self, params):
+        """
+        Saves the action properties of the strategies
+        """
+        with open(settings.ACTION_PROPERTIES_FILE, 'w') as file:
+            file.write(json.dumps(params, indent=4))
+
+    def bot_instances(self):
+        """
+        Returns names of the strategy instances started and stopped by the bot switch
+        """
+        return [x['name'] for x in settings.STRATEGY_INSTANCES if x.get('autostart') != True]
+
+    def set_bot_active(self, active):
+        for name in self.bot_instances():
+            if active == True:
+                self.runtime.start(name)
+            else:
+                self.runtime.stop(name)
+
+    def bot_status(self):
+        return any(self.runtime.is_active(x) for x in self.bot_instances())
+
+    def check_trading_symbol(self, tradingsymbol):
+        return self.broker_instance.check_trading_symbol(tradingsymbol)
+
+    # =================================================================================================================
+    # STATE
+    def positions(self, etag=None, wait=0):
+        """
+        Returns (etag, payload) of the positions view. If etag is current and wait (in sec) is
+        passed, waits till the positions change or the wait expires.
+        """
+        positions_view = self.broker_instance.positions_view
+        if etag != None and wait > 0:
+            return positions_view.wait_for_change(etag, wait)
+        return positions_view.snapshot()
+
+    def risk(self):
+        return self.broker_instance.risk_engine.snapshot()
+
+    def stream(self, last_event_id=None):
+        """
+        Yields the Server-Sent Events frames of the event stream, till the broker is replaced for the
+        next day or the client falls behind. A reconnecting client passes the id of the last event it got.
+        """
+        events = self.broker_instance.events
+        client = events.connect(last_event_id)
+        try:
+            yield b"retry: 3000\n\n"
+            while not client.closed and self.broker_instance.events is events:
+                frames = client.take(settings.STREAM_HEARTBEAT_INTERVAL)
+                yield b"".join(frames) if frames else b": keepalive\n\n"
+        finally:
+            events.disconnect(client)
+
+    # =================================================================================================================
+    # ENGINE PROCESS
+    def serve(self):
+        """
+        Runs the engine as its own process : serves the commands of the API processes and publishes
+        the snapshot till the process is stopped
+        """
+        snapshot = SharedSnapshot(create=True)
+        CommandServer({
+            "change_params": self.change_params,
+            "set_bot_active": self.set_bot_active,
+            "check_trading_symbol": self.check_trading_symbol
+        }, self.broker_instance.logger)
+        self.broker_instance.logger.info("Trading engine serving on the shared snapshot and command channel")
+        try:
+            self.publish_snapshots(snapshot)
+        finally:
+            snapshot.close()
+
+    def publish_snapshots(self, snapshot):
+        """
+        Writes the state to the snapshot whenever it changed (checked every ENGINE_SNAPSHOT_INTERVAL),
+        and at least every ENGINE_SNAPSHOT_HEARTBEAT so the API processes know the engine is alive
+        """
+        last_state, published_at = None, 0
+        positions_etag, positions = None, None
+        while True:
+            sleep(settings.ENGINE_SNAPSHOT_INTERVAL)
+            try:
+                broker = self.broker_instance
+                etag, payload = broker.positions_view.snapshot()
+                if etag != positions_etag:
+                    positions_etag, positions = etag, json.loads(payload)
+                events = broker.events
+                recent = list(events.recent)
+                state = (etag, self.bot_status(), events.ltps.copy(), events.instance, recent[-1][0] if recent else None, self.risk())
+                if state == last_state and time() - published_at < settings.ENGINE_SNAPSHOT_HEARTBEAT:
+                    continue
+                last_state, published_at = state, time()
+                snapshot.write(json.dumps({
+                    "published_at": published_at,
+                    "positions_etag": etag,
+                    "positions": positions,
+                    "bot_status": state[1],
+                    "ltp": state[2],
+                    "stream": events.instance,
+                    "events": recent,
+                    "risk": state[5]
+                }, default=str).encode())
+            except Exception as e:
+                self.broker_instance.logger.error("Error in publishing the engine snapshot ..", exc_info=True)
@@ -0,0 +1,244 @@
+# SYSTEM
+import os
+import math
+import json
+import glob
+import argparse
+import datetime
+from collections import namedtuple
+from time import time
+
+# DATA
+import numpy as np
+import pandas as pd
+
+# CUSTOM
+import settings
+
+# Result of one backtest run
+# trades - dataframe of closed trades, equity - realized PnL after every bar
+BacktestResult = namedtuple("BacktestResult", ["trades", "equity"])
+
+TRADE_COLUMNS = ["entry_time", "exit_time", "entry_price", "exit_price", "stoploss", "target", "reason", "points", "pnl"]
+EXIT_REASONS = {0: "TARGET", 1: "STOPLOSS", 2: "MARKET CLOSE"}
+
+SIGNAL_END_TIME = datetime.time(14, 30, 0, 0)   # FiveEMA stops evaluating candles that close at or after this time
+
+
+def load_candles(path):
+    """
+    Loads 5 minute candles (date, open, high, low, close, volume) from a csv file, or from a directory
+    of per day csv files such as the candle cache directory of an instrument
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, "*.csv")))
+        candles = pd.concat([pd.read_csv(x, parse_dates=['date']) for x in files], ignore_index=True)
+    else:
+        candles = pd.read_csv(path, parse_dates=['date'])
+    if getattr(candles['date'].dt, 'tz', None) != None:
+        candles['date'] = candles['date'].dt.tz_localize(None)
+    return candles.sort_values('date').drop_duplicates('date').reset_index(drop=True)
+
+
+def prepare_arrays(candles:pd.DataFrame, ema_length=5, timeframe=5):
+    """
+    Converts candles into the NumPy arrays used by the backtest. The EMA is computed per day and
+    seeded with the SMA of the first ema_length closes, same as the live streaming EMA.
+    """
+    dates = candles['date'].values.astype('datetime64[m]')
+    days = dates.astype('datetime64[D]')
+    close = candles['close'].to_numpy(dtype=np.float64)
+    n = close.size
+
+    day_change = np.concatenate(([True], days[1:] != days[:-1]))
+    day_id = np.cumsum(day_change) - 1
+    day_start = np.flatnonzero(day_change)
+    position = np.arange(n) - day_start[day_id]  # Position of the candle within its day
+
+    # EMA seed : mean of the first ema_length closes of the day, earlier candles are NaN
+    cumulative = np.concatenate(([0.0], np.cumsum(close)))
+    seeded = close.copy()
+    seeded[position < ema_length - 1] = np.nan
+    seed_rows = np.flatnonzero(position == ema_length - 1)
+    seeded[seed_rows] = (cumulative[seed_rows + 1] - cumulative[seed_rows + 1 - ema_length])/ema_length
+    ema = pd.Series(seeded).groupby(day_id).transform(lambda x: x.ewm(span=ema_length, adjust=False).mean()).to_numpy()
+
+    minutes = (dates - days).astype(np.int64)   # Minute of the day at candle start
+    signal_end = SIGNAL_END_TIME.hour*60 + SIGNAL_END_TIME.minute
+    return {
+        "date": dates,
+        "day": day_id,
+        "open": candles['open'].to_numpy(dtype=np.float64),
+        "high": candles['high'].to_numpy(dtype=np.float64),
+        "low": candles['low'].to_numpy(dtype=np.float64),
+        "close": close,
+        "ema": ema,
+        "signal": (minutes + timeframe < signal_end) & ~np.isnan(ema),  # Candles the strategy evaluates
+    }
+
+
+def run_five_ema(arrays, target, stoploss, trailing_stoploss, quantity=1, lot_size=25):
+    """
+    Replays the FiveEMA rules over the candle arrays and returns (trades, equity)
+    trades - list of (entry_row, exit_row, entry_price, exit_price, stoploss, target, reason)
+    equity - realized PnL after every candle
+
+    Same rules as FiveEMA.process_candle and FiveEMA.on_tick :
+    - Out of trade region, a candle whose low is above the EMA becomes the trigger candle
+    - In trade region, a close below the trigger low enters at the close with
+      stoploss = min(stoploss, trigger high - close) and target = close + min(target, 3*stoploss)
+    - Otherwise the trigger shifts to a candle above the EMA with a higher low than the last candle
+    - Exits are checked on the following candles : stoploss at entry - stoploss, target above target,
+      entry moves up by trailing_stoploss whenever price is above entry + trailing_stoploss, and any
+      open trade is closed with the last candle of the day
+    Candles only give high and low, so when stoploss and target fall in the same candle stoploss is assumed.
+    State is reset every day, as the live strategy is restarted every day.
+    """
+    day = arrays['day'].tolist()
+    open_ = arrays['open'].tolist()
+    high = arrays['high'].tolist()
+    low = arrays['low'].tolist()
+    close = arrays['close'].tolist()
+    ema = arrays['ema'].tolist()
+    signal = arrays['signal'].tolist()
+    n = len(close)
+
+    trades = []
+    realized = np.zeros(n)
+    trade_region = False
+    trigger_low = trigger_high = last_low = None
+    trade = None    # [entry_row, entry_price, trail_price, stoploss, target]
+
+    for i in range(n):
+        if i > 0 and day[i] != day[i - 1]:   # New day
+            if trade != None:   # Closed at market closure with the last candle of the day
+                trades.append((trade[0], i - 1, trade[1], close[i - 1], trade[3], trade[4], 2))
+                realized[i - 1] += close[i - 1] - trade[1]
+                trade = None
+            trade_region = False
+            trigger_low = trigger_high = last_low = None
+
+        # EXITS - on the candles after the entry candle
+        if trade != None:
+            stoploss_price = trade[2] - trade[3]
+            if low[i] <= stoploss_price:
+                exit_price = min(open_[i], stoploss_price)
+                trades.append((trade[0], i, trade[1], exit_price, trade[3], trade[4], 1))
+                realized[i] += exit_price - trade[1]
+                trade = None
+            elif high[i] > trade[4]:
+                exit_price = max(open_[i], trade[4])
+                trades.append((trade[0], i, trade[1], exit_price, trade[3], trade[4], 0))
+                realized[i] += exit_price - trade[1]
+                trade = None
+            elif trailing_stoploss > 0 and high[i] > trade[2] + trailing_stoploss:
+                trade[2] += (math.ceil((high[i] - trade[2])/trailing_stoploss) - 1)*trailing_stoploss
+
+        if not signal[i]:
+            continue
+
+        # STRATEGY - at candle close
+        if trade_region == False:
+            if trade != None:
+                last_low = low[i]
+            elif low[i] > ema[i]:
+                trigger_low, trigger_high = low[i], high[i]
+                last_low = low[i]
+                trade_region = True
+        else:
+            if close[i] < trigger_low:
+                trade_stoploss = min(float(stoploss), trigger_high - close[i])
+                trade = [i, close[i], close[i], trade_stoploss, close[i] + min(target, 3*trade_stoploss)]
+                trade_region = False
+            elif close[i] > trigger_low:
+                if low[i] > ema[i] and low[i] > last_low:
+                    trigger_low, trigger_high = low[i], high[i]
+            last_low = low[i]
+
+    if trade != None:
+        trades.append((trade[0], n - 1, trade[1], close[n - 1], trade[3], trade[4], 2))
+        realized[n - 1] += close[n - 1] - trade[1]
+
+    equity = np.cumsum(realized)*quantity*lot_size
+    return trades, equity
+
+
+def to_trade_frame(arrays, trades, quantity=1, lot_size=25):
+    """
+    Returns the trades of run_five_ema as a dataframe
+    """
+    if len(trades) == 0:
+        return pd.DataFrame(columns=TRADE_COLUMNS)
+    raw = np.array(trades, dtype=np.float64)
+    entry_rows, exit_rows = raw[:, 0].astype(np.int64), raw[:, 1].astype(np.int64)
+    points = raw[:, 3] - raw[:, 2]
+    return pd.DataFrame({
+        "entry_time": arrays['date'][entry_rows],
+        "exit_time": arrays['date'][exit_rows],
+        "entry_price": raw[:, 2],
+        "exit_price": raw[:, 3],
+        "stoploss": raw[:, 4],
+        "target": raw[:, 5],
+        "reason": [EXIT_REASONS[int(x)] for x in raw[:, 6]],
+        "points": points,
+        "pnl": points*quantity*lot_size,
+    })
+
+
+def summarize(trades:pd.DataFrame, equity):
+    """
+    Returns summary statistics of a backtest
+    """
+    drawdown = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:] - equity if len(equity) > 0 else np.zeros(1)
+    return {
+        "trades": int(trades.shape[0]),
+        "win_rate": float((trades['pnl'] > 0).mean()) if trades.shape[0] > 0 else 0.0,
+        "net_pnl": float(trades['pnl'].sum()),
+        "max_drawdown": float(drawdown.max()),
+        "avg_pnl": float(trades['pnl'].mean()) if trades.shape[0] > 0 else 0.0,
+    }
+
+
+class FiveEMABacktest:
+    """
+    Backtest of the FiveEMA strategy over historical 5 minute candles of BankNifty FUT, using the
+    parameters of the properties file unless provided
+    """
+    def __init__(self, candles:pd.DataFrame, properties=None):
+        if properties == None:
+            with open(settings.ACTION_PROPERTIES_FILE) as file:
+                properties = json.load(file)
+        self.properties = properties
+        self.arrays = prepare_arrays(candles)
+
+    def run(self):
+        """
+        Runs the backtest and returns BacktestResult
+        """
+        quantity = self.properties['quantity']
+        lot_size = self.properties['lot_size']
+        trades, equity = run_five_ema(
+            self.arrays,
+            target = self.properties['target'],
+            stoploss = self.properties['stoploss'],
+            trailing_stoploss = self.properties['trailing_stoploss'],
+            quantity = quantity,
+            lot_size = lot_size
+        )
+        return BacktestResult(to_trade_frame(self.arrays, trades, quantity, lot_size), equity)
+
+
+if __name__ == "__main__":
+    # python -m Backtest.five_ema_backtest <candles> from the project directory
+    parser = argparse.ArgumentParser(description="Backtest FiveEMA over historical 5 minute candles")
+    parser.add_argument("candles", help="Candles csv file or directory of per day csv files")
+    parser.add_argument("--output", help="Csv file to write the trades to")
+    args = parser.parse_args()
+
+    backtest = FiveEMABacktest(load_candles(args.candles))
+    start_time = time()
+    result = backtest.run()
+    print(f"Backtest of {backtest.arrays['close'].size} candles completed in {time() - start_time:.3f} sec")
+    print(json.dumps(summarize(result.trades, result.equity), indent=4))
+    if args.output:
+        result.trades.to_csv(args.output, index=False)
@@ -0,0 +1,112 @@
+# SYSTEM
+import os
+import json
+import argparse
+import datetime
+import itertools
+from time import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# DATA
+import numpy as np
+import pandas as pd
+
+# CUSTOM
+import settings
+from Backtest.five_ema_backtest import load_candles, prepare_arrays, run_five_ema
+
+PARAMETERS = ["target", "stoploss", "trailing_stoploss", "quantity", "lot_size"]
+SHARED_ARRAYS = ["day", "open", "high", "low", "close", "ema", "signal"] # Rows of the shared candle block
+
+worker_arrays = None    # Candle arrays of a worker process, views over the shared memory block
+worker_memory = None
+
+
+def attach_shared_arrays(memory_name, rows, columns):
+    """
+    Pool initializer : maps the shared candle block into the worker, so candles are never pickled per task
+    """
+    global worker_arrays, worker_memory
+    worker_memory = shared_memory.SharedMemory(name=memory_name)
+    block = np.ndarray((rows, columns), dtype=np.float64, buffer=worker_memory.buf)
+    worker_arrays = {name: block[row] for row, name in enumerate(SHARED_ARRAYS)}
+
+
+def evaluate(parameters):
+    """
+    Runs one backtest in a worker and returns its summary with the parameters
+    """
+    trades, equity = run_five_ema(worker_arrays, **parameters)
+    pnl = np.array([x[3] - x[2] for x in trades])*parameters['quantity']*parameters['lot_size']
+    drawdown = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:] - equity
+    result = dict(parameters)
+    result.update({
+        "trades": len(trades),
+        "win_rate": float((pnl > 0).mean()) if pnl.size > 0 else 0.0,
+        "net_pnl": float(pnl.sum()),
+        "max_drawdown": float(drawdown.max()) if drawdown.size > 0 else 0.0,
+        "avg_pnl": float(pnl.mean()) if pnl.size > 0 else 0.0,
+    })
+    return result
+
+
+def expand_grid(grid):
+    """
+    Returns all parameter combinations of the grid. Parameters missing in the grid are taken from
+    the properties file.
+    """
+    with open(settings.ACTION_PROPERTIES_FILE) as file:
+        properties = json.load(file)
+    values = [grid.get(x, [properties[x]]) for x in PARAMETERS]
+    return [dict(zip(PARAMETERS, combination)) for combination in itertools.product(*values)]
+
+
+def run_sweep(candles:pd.DataFrame, grid, workers=None, sort_by="net_pnl"):
+    """
+    Backtests FiveEMA for every combination of the parameter grid on all cores and returns the
+    results ranked by sort_by. The candle arrays are placed once in shared memory for all workers.
+    """
+    arrays = prepare_arrays(candles)
+    block_data = np.vstack([arrays[x].astype(np.float64) for x in SHARED_ARRAYS])
+    memory = shared_memory.SharedMemory(create=True, size=block_data.nbytes)
+    try:
+        block = np.ndarray(block_data.shape, dtype=np.float64, buffer=memory.buf)
+        block[:] = block_data
+        combinations = expand_grid(grid)
+        workers = workers or os.cpu_count()
+        chunksize = max(len(combinations) // (workers*4), 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_shared_arrays,
+                initargs=(memory.name, block_data.shape[0], block_data.shape[1])) as executor:
+            results = list(executor.map(evaluate, combinations, chunksize=chunksize))
+    finally:
+        memory.close()
+        memory.unlink()
+
+    results = pd.DataFrame(results).sort_values(sort_by, ascending=False).reset_index(drop=True)
+    results.index.name = "rank"
+    return results
+
+
+if __name__ == "__main__":
+    # python -m Backtest.parameter_sweep <candles> <grid.json> from the project directory
+    # grid.json : {"target": [100, 200, 300], "stoploss": [50, 100, 200], "trailing_stoploss": [10, 20]}
+    parser = argparse.ArgumentParser(description="Parallel FiveEMA parameter sweep")
+    parser.add_argument("candles", help="Candles csv file or directory of per day csv files")
+    parser.add_argument("grid", help="Json file of parameter -> list of values")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes, all cores by default")
+    parser.add_argument("--sort", default="net_pnl", help="Result column to rank by")
+    args = parser.parse_args()
+
+    with open(args.grid) as file:
+        grid = json.load(file)
+
+    start_time = time()
+    results = run_sweep(load_candles(args.candles), grid, args.workers, args.sort)
+    print(f"{results.shape[0]} combinations backtested in {time() - start_time:.2f} sec")
+    print(results.head(20).to_string())
+
+    os.makedirs(settings.BACKTEST_RESULTS_FOLDER, exist_ok=True)
+    output_file = os.path.join(settings.BACKTEST_RESULTS_FOLDER, f"five_ema_sweep_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    results.to_csv(output_file)
+    print(f"Results written to {output_file}")
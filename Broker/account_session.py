@@ -0,0 +1,154 @@
+# SYSTEM
+import logging
+from concurrent.futures import Future
+
+# WEB
+import requests
+import pyotp
+from urllib import parse
+from kiteconnect import KiteConnect
+
+# DATA
+import json
+
+# CUSTOM
+import settings
+from Broker.order_tracker import OrderTracker
+from Broker.request_gateway import RequestGateway
+
+
+def kite_login(credentials, logger):
+    """
+    Authenticates the Kite account of the credentials (user_id, password, totp_code, api_key,
+    api_secret) and returns its (KiteConnect object, access token), None after
+    MAX_BROKER_LOGIN_ATTEMPT_COUNT failed attempts
+    """
+    BROKER_LOGIN_ATTEMPT_COUNT = 0
+    while BROKER_LOGIN_ATTEMPT_COUNT < settings.MAX_BROKER_LOGIN_ATTEMPT_COUNT:
+        try:
+            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.77"}
+            session = requests.Session()
+            session.headers.update(headers)
+
+            get_response = session.get(f"https://kite.trade/connect/login?api_key={credentials['api_key']}")
+            login_response = json.loads(session.post("https://kite.zerodha.com/api/login", data={
+                'user_id': credentials['user_id'],
+                'password': credentials['password']
+            }).text)
+
+            totp = pyotp.TOTP(credentials['totp_code'])
+            totp_response = session.post("https://kite.zerodha.com/api/twofa",
+                data = {
+                    'user_id': credentials['user_id'],
+                    'request_id': login_response['data']['request_id'],
+                    'twofa_value': totp.now()
+                }
+            )
+
+            # Extracting the token
+            token = ""
+            try:
+                final_response = session.get(get_response.url + "&skip_session=true")
+                parsed_text = parse.urlparse(final_response.history[1].headers['location'])
+                token = parse.parse_qs(parsed_text.query)['request_token'][0]
+            except Exception as e:
+                logger.critical(f"Error in generating zerodha token of {credentials['user_id']}\n", exc_info=True)
+                return None
+
+            session.close()
+            conn = KiteConnect(api_key=credentials['api_key'], pool=settings.KITE_HTTP_POOL)
+            data = conn.generate_session(
+                request_token=token,
+                api_secret=credentials['api_secret']
+            )
+            conn.set_access_token(data['access_token'])
+            return conn, data['access_token']
+        except Exception as e:
+            logger.error(f"Broker login of {credentials['user_id']} failed. Retrying ..", exc_info=True)
+        BROKER_LOGIN_ATTEMPT_COUNT += 1
+    return None
+
+
+class AccountSession:
+    """
+    Order routing of one Kite account : its KiteConnect session, a request gateway within the rate
+    limits of the account and an order tracker. Market data is not fetched through it, one ticker
+    feed and one instrument index (for the exchange of the orders) serve every account. Quantities of
+    the strategies are scaled by the multiplier of the account.
+    """
+    def __init__(self, name, conn, clock, instrument_index, logger=None, gateway=None, multiplier=1):
+        self.name = name
+        self.conn = conn
+        self.clock = clock
+        self.instrument_index = instrument_index
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.gateway = gateway if gateway != None else RequestGateway(self.logger)  # Kite rate limits are per account
+        self.multiplier = multiplier
+        self.order_tracker = OrderTracker(self.fetch_orders, self.clock, self.logger)  # Order updates on the ticker are of the ticker account only, the others are polled
+
+    def fetch_orders(self):
+        """
+        Returns all the orders of the day of the account from Kite, in the form of list of dictionaries
+        """
+        return self.gateway.read("default", self.conn.orders)
+
+    def place_order(self, tradingsymbol, transaction_type, quantity, max_attempts=None):
+        """
+        Places market order of quantity times the multiplier of the account and returns its handle
+        immediately, a future resolved with the final order once it is COMPLETE. Orders CANCELLED or
+        REJECTED by the exchange are placed again, the handle fails once max_attempts
+        (MAX_ORDER_PLACEMENT_RETRIES by default) are exhausted.
+        """
+        handle = Future()
+        self.submit_order(handle, tradingsymbol, transaction_type, quantity*self.multiplier, 1, max_attempts or settings.MAX_ORDER_PLACEMENT_RETRIES)
+        return handle
+
+    def submit_order(self, handle, tradingsymbol, transaction_type, quantity, attempt, max_attempts):
+        """
+        Places the order on zerodha and hands its order id over to the order tracker
+        """
+        try:
+            exchange = self.instrument_index.get_exchange(tradingsymbol)   # NFO for the options and futures
+        except KeyError as e:
+            self.logger.critical(f"{tradingsymbol} is not listed, order not placed on account {self.name}.")
+            handle.set_exception(RuntimeError(f"{transaction_type} order of {tradingsymbol} could not be placed on account {self.name}, symbol not listed"))
+            return
+
+        while attempt <= max_attempts:
+            try:
+                order_id = self.gateway.request("order", self.conn.place_order,
+                    variety = "regular",
+                    exchange = exchange,
+                    tradingsymbol = tradingsymbol,
+                    transaction_type = transaction_type,
+                    quantity = quantity,
+                    product = "MIS",
+                    order_type = "MARKET",
+                    price = None
+                    )
+                break
+            except Exception as e:
+                self.logger.error(f"Error placing order on zerodha account {self.name} ..", exc_info=True)
+                attempt += 1
+        else:
+            self.logger.critical(f"Order placment max retries exceeded on account {self.name}.")
+            handle.set_exception(RuntimeError(f"{transaction_type} order of {tradingsymbol} could not be placed on account {self.name}"))
+            return
+
+        self.order_tracker.track(order_id).add_done_callback(
+            lambda x: self.on_order_final(handle, tradingsymbol, transaction_type, quantity, attempt, max_attempts, x.result())
+        )
+
+    def on_order_final(self, handle, tradingsymbol, transaction_type, quantity, attempt, max_attempts, order):
+        """
+        Called when the order reaches a final status, resolves the handle or places the order again
+        """
+        if order['status'] == "COMPLETE":  # Trade executed
+            handle.set_result(order)
+            return
+        if attempt >= max_attempts:
+            self.logger.error(f"Trade {order['status']} on account {self.name}.")
+            handle.set_exception(RuntimeError(f"{transaction_type} order of {tradingsymbol} {order['status']} on account {self.name}"))
+            return
+        self.logger.error(f"Trade {order['status']} on account {self.name}. Retrying ..")
+        self.clock.spawn(self.submit_order, handle, tradingsymbol, transaction_type, quantity, attempt + 1, max_attempts)
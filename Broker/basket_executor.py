@@ -0,0 +1,135 @@
+# SYSTEM
+import datetime
+import threading
+import logging
+from collections import namedtuple
+from concurrent.futures import Future, wait
+
+# CUSTOM
+import settings
+
+# Single leg of a basket order
+BasketLeg = namedtuple("BasketLeg", ["tradingsymbol", "transaction_type", "quantity"])
+
+OPPOSITE_TRANSACTION = {"BUY": "SELL", "SELL": "BUY"}
+
+
+class BasketFailed(Exception):
+    """
+    Raised through the basket handle when a leg of an entry basket could not be executed. The legs
+    which had been executed are unwound before it is raised.
+    """
+    def __init__(self, legs, results):
+        self.legs = legs
+        self.results = results  # Order (dictionary) or exception of every leg
+        failed = [leg.tradingsymbol for leg, result in zip(legs, results) if isinstance(result, Exception)]
+        super().__init__(f"Basket legs failed : {failed}")
+
+
+class Basket:
+    """
+    Legs of a basket order being executed
+    """
+    def __init__(self, legs, place_order, unwind):
+        self.legs = legs
+        self.place_order = place_order
+        self.unwind = unwind    # Executed legs are reversed if a leg fails, else failed legs are placed again
+        self.results = [None]*len(legs) # Order or exception of every leg
+        self.remaining = len(legs)
+        self.lock = threading.Lock()
+        self.handle = Future()
+
+
+class BasketExecutor:
+    """
+    Executes multi-leg orders (straddle, strangle) as one unit. All the legs are placed concurrently,
+    so the skew between legs is the round trip of one request, and the basket resolves once every
+    leg is final. If any leg of an entry basket fails, the legs which were executed are unwound with
+    opposite orders. Exit baskets are never unwound, buying back a leg again would reopen the short,
+    so their failed legs are placed again till they are executed.
+    """
+    def __init__(self, clock, logger=None):
+        self.clock = clock
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+
+    def execute(self, legs, place_order, concurrent=True, unwind=True):
+        """
+        Places every leg with place_order(tradingsymbol, transaction_type, quantity, max_attempts), which
+        returns an order handle. Returns the basket handle immediately, resolved with the orders of
+        the legs (in leg order) or failed with BasketFailed once the executed legs are unwound.
+        Legs are placed one after another on the calling thread if not concurrent. With unwind False
+        (exit baskets) the failed legs are placed again every BASKET_EXIT_RETRY_INTERVAL instead, the
+        handle resolves once all of them are executed.
+        """
+        basket = Basket(legs, place_order, unwind)
+        if len(legs) == 0:
+            basket.handle.set_result([])
+        for position in range(len(legs)):
+            if concurrent == True:
+                self.clock.spawn(self.submit_leg, basket, position)
+            else:
+                self.submit_leg(basket, position)
+        return basket.handle
+
+    def submit_leg(self, basket, position):
+        """
+        Places one leg, without retries if a rejected leg unwinds the basket
+        """
+        leg = basket.legs[position]
+        try:
+            leg_handle = basket.place_order(leg.tradingsymbol, leg.transaction_type, leg.quantity, 1 if basket.unwind == True else None)
+        except Exception as e:
+            self.logger.error(f"Error placing basket leg {leg.tradingsymbol} ..", exc_info=True)
+            leg_handle = Future()
+            leg_handle.set_exception(e)
+        leg_handle.add_done_callback(lambda x: self.on_leg_final(basket, position, x))
+
+    def on_leg_final(self, basket, position, leg_handle):
+        """
+        Records the final state of the leg and completes the basket after its last leg
+        """
+        result = leg_handle.exception() if leg_handle.exception() != None else leg_handle.result()
+        with basket.lock:
+            basket.results[position] = result
+            basket.remaining -= 1
+            if basket.remaining > 0:
+                return
+
+        failed = [x for x in range(len(basket.results)) if isinstance(basket.results[x], Exception)]
+        if len(failed) == 0:
+            basket.handle.set_result(list(basket.results))
+        elif basket.unwind == True:
+            self.clock.spawn(self.unwind, basket)
+        else:
+            self.retry(basket, failed)
+
+    def retry(self, basket, positions):
+        """
+        Places the failed legs of an exit basket again after BASKET_EXIT_RETRY_INTERVAL, the legs stay
+        open till then
+        """
+        self.logger.critical(f"Basket exit legs failed, placing them again : {[basket.legs[x].tradingsymbol for x in positions]}")
+        with basket.lock:
+            basket.remaining = len(positions)
+        when = self.clock.now() + datetime.timedelta(seconds=settings.BASKET_EXIT_RETRY_INTERVAL)
+        for position in positions:
+            self.clock.call_at(when, self.clock.spawn, self.submit_leg, basket, position)
+
+    def unwind(self, basket):
+        """
+        Reverses every executed leg of a failed basket and fails the basket handle
+        """
+        self.logger.error("Basket order failed, unwinding executed legs ..")
+        handles = []
+        for leg, result in zip(basket.legs, basket.results):
+            if isinstance(result, Exception):
+                continue
+            try:
+                handles.append(basket.place_order(leg.tradingsymbol, OPPOSITE_TRANSACTION[leg.transaction_type], leg.quantity, None))
+            except Exception as e:
+                self.logger.critical(f"Unwind of basket leg {leg.tradingsymbol} could not be placed, position is still open", exc_info=True)
+        wait(handles)
+        for handle in handles:
+            if handle.exception() != None:
+                self.logger.critical(f"Unwind of basket leg failed, position is still open\n{handle.exception()}")
+        basket.handle.set_exception(BasketFailed(basket.legs, basket.results))
@@ -0,0 +1,233 @@
+# SYSTEM
+import datetime
+import threading
+import logging
+
+# DATA
+import pandas as pd
+
+# CUSTOM
+import settings
+from Broker.clock import SystemClock
+
+
+class CandleSeries:
+    """
+    OHLCV bars of one instrument token for one timeframe (in minutes)
+    """
+    def __init__(self, instrument_token, timeframe):
+        self.instrument_token = instrument_token
+        self.timeframe = timeframe
+        self.bars = []  # Closed bars, oldest first - [{date, open, high, low, close, volume}]
+        self.current = None # Bar being formed
+        self.last_closed = None # Start time of the last closed bar, ticks of it or earlier bars are dropped
+        self.last_volume = None # Cumulative day volume of the last tick, volume of a bar is its difference
+        self.subscribers = []   # [callback(instrument_token, timeframe, bar)] called when a bar closes
+
+
+class CandleAggregator:
+    """
+    Builds OHLCV bars of any timeframe from live ticks. Bars are aligned to the session open, same
+    as the Kite historical candles, and are closed exactly at the bar boundary by a clock timer.
+    """
+    def __init__(self, logger=None, clock=None):
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.clock = clock if clock != None else SystemClock()
+        self.series = {}    # {(instrument_token, timeframe) : CandleSeries}
+        self.series_by_token = {}   # {instrument_token : [CandleSeries]}
+        self.lock = threading.Lock()
+        self.boundary_timer = None
+        self.timer_lock = threading.Lock()  # Guards the boundary timer, rescheduled from the timer and strategy threads
+        self.running = False
+
+    # =================================================================================================================
+    # BAR TIMES
+    def get_bar_start(self, timestamp, timeframe):
+        """
+        Returns start time of the bar of the given timeframe (in minutes) which contains the timestamp
+        """
+        session_open = datetime.datetime.combine(timestamp.date(), settings.MARKET_OPEN_TIME)
+        minutes = int((timestamp - session_open).total_seconds() // 60)
+        return session_open + datetime.timedelta(minutes=(minutes // timeframe) * timeframe)
+
+    def get_next_boundary(self, now):
+        """
+        Returns the earliest bar boundary after now across all the series
+        """
+        boundaries = [self.get_bar_start(now, timeframe) + datetime.timedelta(minutes=timeframe) for (_, timeframe) in list(self.series)]
+        return min(boundaries) if len(boundaries) > 0 else None
+
+    # =================================================================================================================
+    # SERIES
+    def add_series(self, instrument_token, timeframe, historical_bars=None):
+        """
+        Starts building bars of the timeframe for the token. Historical bars (list of dictionaries with
+        date, open, high, low, close, volume as returned by Kite) seed the series, the last one is
+        treated as the bar being formed if it has not closed yet.
+        """
+        with self.lock:
+            key = (instrument_token, timeframe)
+            if key in self.series:
+                return self.series[key]
+            candle_series = CandleSeries(instrument_token, timeframe)
+            now = self.clock.now()
+            for bar in historical_bars or []:
+                bar = dict(bar)
+                bar['date'] = pd.Timestamp(bar['date']).tz_localize(None).to_pydatetime()
+                if bar['date'] + datetime.timedelta(minutes=timeframe) <= now:
+                    candle_series.bars.append(bar)
+                    candle_series.last_closed = bar['date']
+                else:
+                    candle_series.current = bar
+            self.series[key] = candle_series
+            self.series_by_token.setdefault(instrument_token, []).append(candle_series)
+        self.reschedule()   # The new timeframe may have an earlier boundary
+        return candle_series
+
+    def subscribe(self, instrument_token, timeframe, callback):
+        """
+        Registers callback(instrument_token, timeframe, bar) to be called when a bar of the series closes
+        """
+        with self.lock:
+            self.series[(instrument_token, timeframe)].subscribers.append(callback)
+
+    def unsubscribe(self, instrument_token, timeframe, callback):
+        """
+        Removes callback from the bar close subscribers of the series
+        """
+        with self.lock:
+            candle_series = self.series.get((instrument_token, timeframe))
+            if candle_series != None:
+                candle_series.subscribers = [x for x in candle_series.subscribers if x != callback]
+
+    def get_bars(self, instrument_token, timeframe):
+        """
+        Returns the closed bars of the series as a pandas dataframe
+        """
+        with self.lock:
+            bars = list(self.series[(instrument_token, timeframe)].bars)
+        return pd.DataFrame(bars, columns=["date", "open", "high", "low", "close", "volume"])
+
+    # =================================================================================================================
+    # UPDATES
+    def on_tick(self, tick):
+        """
+        Updates the bars being formed with the tick. Called from the ticker thread.
+        """
+        series_list = self.series_by_token.get(tick['instrument_token'])
+        if not series_list:
+            return
+        timestamp = tick.get('exchange_timestamp') or tick.get('last_trade_time') or self.clock.now()
+        ltp = tick['last_price']
+        cumulative_volume = tick.get('volume_traded')
+
+        closed = []
+        with self.lock:
+            for candle_series in series_list:
+                bar_start = self.get_bar_start(timestamp, candle_series.timeframe)
+                current = candle_series.current
+                if candle_series.last_closed != None and bar_start <= candle_series.last_closed:  # Late tick of an already closed bar
+                    continue
+                if current != None and bar_start < current['date']:  # Late tick of a bar before the seeded one
+                    continue
+                if current != None and bar_start > current['date']:  # Tick of next bar arrived before the timer
+                    closed.append((candle_series, self.close_bar(candle_series)))
+                    current = None
+
+                volume = 0
+                if cumulative_volume != None:
+                    if candle_series.last_volume != None:
+                        volume = max(cumulative_volume - candle_series.last_volume, 0)
+                    candle_series.last_volume = cumulative_volume
+
+                if current == None:
+                    candle_series.current = {"date": bar_start, "open": ltp, "high": ltp, "low": ltp, "close": ltp, "volume": volume}
+                else:
+                    current['high'] = max(current['high'], ltp)
+                    current['low'] = min(current['low'], ltp)
+                    current['close'] = ltp
+                    current['volume'] += volume
+        self.emit(closed)
+
+    def close_bar(self, candle_series):
+        """
+        Moves the bar being formed to the closed bars and returns it. Must be called with the lock held.
+        """
+        bar = candle_series.current
+        candle_series.bars.append(bar)
+        candle_series.current = None
+        candle_series.last_closed = bar['date']
+        return bar
+
+    def close_due_bars(self, now):
+        """
+        Closes every bar whose boundary has passed
+        """
+        closed = []
+        with self.lock:
+            for candle_series in self.series.values():
+                current = candle_series.current
+                if current != None and current['date'] + datetime.timedelta(minutes=candle_series.timeframe) <= now:
+                    closed.append((candle_series, self.close_bar(candle_series)))
+        self.emit(closed)
+
+    def emit(self, closed):
+        """
+        Calls the bar close subscribers of the closed bars
+        """
+        for candle_series, bar in closed:
+            for callback in list(candle_series.subscribers):
+                try:
+                    callback(candle_series.instrument_token, candle_series.timeframe, bar)
+                except Exception as e:
+                    self.logger.error("Error in bar close subscriber ..", exc_info=True)
+
+    # =================================================================================================================
+    # BOUNDARY TIMER
+    def start(self):
+        """
+        Starts closing bars at their boundaries
+        """
+        self.running = True
+        self.reschedule()
+
+    def stop(self):
+        """
+        Stops the boundary timer
+        """
+        self.running = False
+        if self.boundary_timer != None:
+            self.boundary_timer.cancel()
+
+    def reschedule(self):
+        """
+        Replaces the boundary timer with one for the next boundary across all the series
+        """
+        with self.timer_lock:
+            if self.boundary_timer != None:
+                self.boundary_timer.cancel()
+            self.schedule_next_boundary()
+
+    def schedule_next_boundary(self):
+        """
+        Sets a timer for the next bar boundary (plus a small grace for in-flight ticks). Nothing is
+        scheduled till the first series is added. Must be called with the timer lock held.
+        """
+        self.boundary_timer = None
+        if self.running == False:
+            return
+        grace = datetime.timedelta(seconds=settings.CANDLE_CLOSE_GRACE_TIME)
+        boundary = self.get_next_boundary(self.clock.now() - grace)    # A boundary still in its grace time is kept
+        if boundary == None:
+            return
+        close_time = boundary + grace
+        self.boundary_timer = self.clock.call_at(close_time, self.on_boundary, boundary)
+
+    def on_boundary(self, boundary):
+        """
+        Closes the bars due at the boundary and sets the timer for the next one
+        """
+        try:
+            self.close_due_bars(boundary)
+        finally:
+            self.reschedule()
@@ -0,0 +1,176 @@
+# SYSTEM
+import os
+import datetime
+import threading
+import logging
+
+# DATA
+import pandas as pd
+
+# CUSTOM
+import settings
+
+INTERVAL_MINUTES = {"minute": 1, "3minute": 3, "5minute": 5, "10minute": 10, "15minute": 15, "30minute": 30, "60minute": 60}
+
+
+class CandleCache:
+    """
+    Historical candle cache keyed by (instrument_token, interval, date). Every day is kept in memory
+    and persisted to disk as a csv. Days that are complete are never fetched again, the current day
+    is refreshed by fetching only the bars after the last stored one.
+    """
+    def __init__(self, fetch_function, cache_dir, logger=None):
+        """
+        fetch_function(instrument_token, interval, from_datetime, to_datetime) returns the candles
+        from the broker as a list of dictionaries
+        """
+        self.fetch_function = fetch_function
+        self.cache_dir = cache_dir
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.days = {}  # {(instrument_token, interval, date) : {"bars": [bars], "fetched_at": datetime}}
+        self.series_locks = {}  # {(instrument_token, interval) : Lock} held while the series is read or fetched
+        self.lock = threading.Lock()    # Guards series_locks only, never held during a fetch
+
+    def series_lock(self, instrument_token, interval):
+        """
+        Returns the lock of the series. Fetches of a series wait for each other, so a day is never
+        fetched twice, while other series are fetched in parallel.
+        """
+        with self.lock:
+            return self.series_locks.setdefault((instrument_token, interval), threading.Lock())
+
+    def get_path(self, instrument_token, interval, day):
+        """
+        Returns the cache file of the day
+        """
+        return os.path.join(self.cache_dir, str(instrument_token), interval, f"{day.strftime('%Y-%m-%d')}.csv")
+
+    def is_complete(self, day, fetched_at):
+        """
+        Returns true if the day was fetched after the market closed, so no more bars can be added to it
+        """
+        return fetched_at >= datetime.datetime.combine(day, settings.MARKET_CLOSE_TIME) + datetime.timedelta(seconds=settings.CANDLE_CACHE_SETTLE_TIME)
+
+    def needs_refresh(self, interval, fetched_at, now):
+        """
+        Returns true if a bar may have closed since the day was last fetched
+        """
+        minutes = INTERVAL_MINUTES.get(interval)
+        if minutes == None:
+            return True
+        session_open = datetime.datetime.combine(now.date(), settings.MARKET_OPEN_TIME)
+        bar_number = lambda x: int((x - session_open).total_seconds() // (60*minutes))
+        return bar_number(now) != bar_number(fetched_at)
+
+    # =================================================================================================================
+    # STORAGE
+    def load_day(self, key):
+        """
+        Returns the cached day from memory or disk, None if the day was never fetched
+        """
+        entry = self.days.get(key)
+        if entry != None:
+            return entry
+        path = self.get_path(*key)
+        if not os.path.exists(path):
+            return None
+        try:
+            bars = pd.read_csv(path, parse_dates=['date']).to_dict('records')
+            for bar in bars:
+                bar['date'] = bar['date'].to_pydatetime()
+            entry = {"bars": bars, "fetched_at": datetime.datetime.fromtimestamp(os.path.getmtime(path))}
+        except Exception as e:
+            self.logger.error(f"Corrupt candle cache file {path}, fetching again ..", exc_info=True)
+            return None
+        self.days[key] = entry
+        return entry
+
+    def save_day(self, key, bars, fetched_at):
+        """
+        Stores the bars of the day in memory and on disk
+        """
+        self.days[key] = {"bars": bars, "fetched_at": fetched_at}
+        path = self.get_path(*key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        pd.DataFrame(bars, columns=["date", "open", "high", "low", "close", "volume"]).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def normalize(self, bars):
+        """
+        Returns bars as {date, open, high, low, close, volume} with timezone naive dates
+        """
+        normalized = []
+        for bar in bars:
+            date = pd.Timestamp(bar['date'])
+            if date.tzinfo != None:
+                date = date.tz_localize(None)
+            normalized.append({"date": date.to_pydatetime(), "open": bar['open'], "high": bar['high'],
+                "low": bar['low'], "close": bar['close'], "volume": bar['volume']})
+        return normalized
+
+    # =================================================================================================================
+    # FETCHING
+    def fetch_days(self, instrument_token, interval, days):
+        """
+        Fetches consecutive days that were never fetched, in as few requests as the broker allows
+        """
+        max_days = settings.HISTORICAL_DATA_MAX_DAYS_PER_REQUEST.get(interval, 60)
+        for start in range(0, len(days), max_days):
+            chunk = days[start:start + max_days]
+            fetched_at = datetime.datetime.now()
+            bars = self.normalize(self.fetch_function(
+                instrument_token, interval,
+                datetime.datetime.combine(chunk[0], datetime.time(0, 0, 0)),
+                datetime.datetime.combine(chunk[-1], datetime.time(23, 59, 59))
+            ))
+            bars_by_day = {}
+            for bar in bars:
+                bars_by_day.setdefault(bar['date'].date(), []).append(bar)
+            for day in chunk:   # Days without bars (holidays) are stored empty so they are not fetched again
+                self.save_day((instrument_token, interval, day), bars_by_day.get(day, []), fetched_at)
+
+    def refresh_day(self, instrument_token, interval, day, entry):
+        """
+        Fetches only the bars from the last stored bar (which may have been still forming) till the end of the day
+        """
+        bars = entry['bars']
+        since = bars[-1]['date'] if len(bars) > 0 else datetime.datetime.combine(day, datetime.time(0, 0, 0))
+        fetched_at = datetime.datetime.now()
+        new_bars = self.normalize(self.fetch_function(
+            instrument_token, interval, since, datetime.datetime.combine(day, datetime.time(23, 59, 59))
+        ))
+        bars = [x for x in bars if x['date'] < since] + [x for x in new_bars if x['date'] >= since]
+        self.save_day((instrument_token, interval, day), bars, fetched_at)
+
+    def get_candles(self, instrument_token, interval, from_date, to_date):
+        """
+        Returns candles of the token between the dates (both inclusive) as a list of dictionaries,
+        fetching only what is missing from the cache
+        """
+        days = []
+        day = from_date
+        while day <= min(to_date, datetime.date.today()):
+            days.append(day)
+            day += datetime.timedelta(days=1)
+
+        with self.series_lock(instrument_token, interval):
+            missing = []    # Consecutive runs of days never fetched
+            for day in days:
+                key = (instrument_token, interval, day)
+                entry = self.load_day(key)
+                if entry == None:
+                    if len(missing) > 0 and missing[-1][-1] == day - datetime.timedelta(days=1):
+                        missing[-1].append(day)
+                    else:
+                        missing.append([day])
+                elif not self.is_complete(day, entry['fetched_at']) and self.needs_refresh(interval, entry['fetched_at'], datetime.datetime.now()):
+                    self.refresh_day(instrument_token, interval, day, entry)
+
+            for run in missing:
+                self.fetch_days(instrument_token, interval, run)
+
+            candles = []
+            for day in days:
+                candles.extend(dict(x) for x in self.days[(instrument_token, interval, day)]['bars'])
+        return candles
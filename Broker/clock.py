@@ -0,0 +1,254 @@
+# SYSTEM
+import datetime
+import threading
+import heapq
+import itertools
+import logging
+from time import sleep, time
+
+# CUSTOM
+import settings
+
+
+class ClockStopped(Exception):
+    """
+    Raised inside threads waiting on a virtual clock once the simulation is over
+    """
+
+
+class ClockTimer:
+    """
+    Timer of a clock, can be cancelled till it fires
+    """
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerThread:
+    """
+    Single thread running the timers of every SystemClock from a heap in time order, instead of a
+    thread per timer. Callbacks must not block, long running work should be spawned.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.timers = []    # Heap of (when, sequence, ClockTimer)
+        self.sequence = itertools.count()
+        self.thread = None
+        self.logger = logging.getLogger('Zerodha Logger')
+
+    def add(self, timer):
+        with self.condition:
+            heapq.heappush(self.timers, (timer.when, next(self.sequence), timer))
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.run, name="ClockTimers", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    while self.timers and self.timers[0][2].cancelled:
+                        heapq.heappop(self.timers)
+                    if not self.timers:
+                        self.condition.wait()
+                        continue
+                    delay = (self.timers[0][0] - datetime.datetime.now()).total_seconds()
+                    if delay <= 0:
+                        timer = heapq.heappop(self.timers)[2]
+                        break
+                    self.condition.wait(delay)  # Woken early when an earlier timer is added
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                self.logger.error("Error in clock timer ..", exc_info=True)
+
+
+timer_thread = TimerThread()    # Shared by all the system clocks
+
+
+class SystemClock:
+    """
+    Wall clock, used for live trading. Every time related call of the broker and the strategies
+    goes through a clock, so the same code can be run under a VirtualClock.
+    """
+    def now(self):
+        return datetime.datetime.now()
+
+    def sleep(self, seconds):
+        sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        """
+        Waits till the event is set or the timeout (in sec) expires. Returns true if the event is set.
+        """
+        return event.wait(timeout)
+
+    def call_at(self, when, callback, *args):
+        """
+        Calls callback(*args) at the datetime on the timer thread. Returns the timer, which can be cancelled.
+        """
+        timer = ClockTimer(when, callback, args)
+        timer_thread.add(timer)
+        return timer
+
+    def spawn(self, target, *args):
+        """
+        Runs target(*args) on a new thread and returns the thread
+        """
+        thread = threading.Thread(target=target, args=args)
+        thread.start()
+        return thread
+
+
+class VirtualClock:
+    """
+    Simulated clock for deterministic replay. Time moves only when the replay driver calls advance_to.
+    Threads sleeping or waiting on the clock are woken in timestamp order, and the driver waits till
+    every woken thread is parked on the clock again (or has finished) before time moves further, so
+    a full trading day replays in seconds with the same ordering on every run.
+    """
+    def __init__(self, start:datetime.datetime):
+        self.current = start
+        self.condition = threading.Condition()
+        self.waiters = {}   # {thread : (deadline, event)} threads parked on the clock
+        self.released = set()   # Threads woken by the driver which have not resumed yet
+        self.running = {}   # {thread : real time when it was woken} threads the driver is waiting for
+        self.timers = []    # Heap of (when, sequence, ClockTimer)
+        self.sequence = itertools.count()
+        self.stopped = False
+        self.logger = logging.getLogger('Zerodha Logger')
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.wait(None, seconds)
+
+    def wait(self, event, timeout=None):
+        """
+        Parks the calling thread till the event is set or the virtual timeout (in sec) expires.
+        Returns true if the event is set.
+        """
+        me = threading.current_thread()
+        with self.condition:
+            if self.stopped:
+                raise ClockStopped()
+            deadline = None if timeout == None else self.current + datetime.timedelta(seconds=timeout)
+            self.waiters[me] = (deadline, event)
+            self.running.pop(me, None)
+            self.condition.notify_all()
+            while me not in self.released:
+                if self.stopped:
+                    self.waiters.pop(me, None)
+                    raise ClockStopped()
+                self.condition.wait()
+            self.released.discard(me)
+        return event.is_set() if event != None else False
+
+    def call_at(self, when, callback, *args):
+        """
+        Calls callback(*args) on the driver thread when virtual time reaches the datetime
+        """
+        timer = ClockTimer(when, callback, args)
+        with self.condition:
+            heapq.heappush(self.timers, (when, next(self.sequence), timer))
+        return timer
+
+    def spawn(self, target, *args):
+        """
+        Runs target(*args) on a new daemon thread which the driver waits for like any woken thread
+        """
+        def run():
+            try:
+                target(*args)
+            except ClockStopped:
+                pass
+            finally:
+                with self.condition:
+                    self.running.pop(threading.current_thread(), None)
+                    self.condition.notify_all()
+
+        thread = threading.Thread(target=run, daemon=True)
+        with self.condition:
+            self.running[thread] = time()
+        thread.start()
+        return thread
+
+    # =================================================================================================================
+    # DRIVER
+    def is_due(self, deadline, event):
+        return (event != None and event.is_set()) or (deadline != None and deadline <= self.current)
+
+    def settle(self):
+        """
+        Wakes every thread whose wait is over and blocks till all woken threads are parked again
+        """
+        with self.condition:
+            while True:
+                due = [x for x, (deadline, event) in self.waiters.items() if self.is_due(deadline, event)]
+                for thread in due:
+                    del self.waiters[thread]
+                    self.released.add(thread)
+                    self.running[thread] = time()
+                if due:
+                    self.condition.notify_all()
+
+                for thread, woken_at in list(self.running.items()):
+                    if not thread.is_alive() and thread not in self.released and thread.ident != None:
+                        del self.running[thread]
+                    elif time() - woken_at > settings.SIMULATION_SETTLE_TIMEOUT:
+                        self.logger.error(f"Thread {thread.name} blocked outside the virtual clock, no longer waited for")
+                        del self.running[thread]
+                if not due and len(self.running) == 0:
+                    return
+                self.condition.wait(0.001)
+
+    def next_wakeup(self):
+        """
+        Returns the earliest virtual time at which a timer or a parked thread is due, None if nothing is pending
+        """
+        times = [x[0] for x in self.timers[:1]]
+        times += [deadline for (deadline, event) in self.waiters.values() if deadline != None]
+        return min(times) if times else None
+
+    def advance_to(self, when):
+        """
+        Moves virtual time to the datetime, running every timer and waking every thread due on the way
+        in timestamp order
+        """
+        self.settle()
+        while True:
+            with self.condition:
+                wakeup = self.next_wakeup()
+                if wakeup == None or wakeup > when:
+                    break
+                self.current = max(self.current, wakeup)
+                timers = []
+                while self.timers and self.timers[0][0] <= self.current:
+                    timers.append(heapq.heappop(self.timers)[2])
+            for timer in timers:
+                if timer.cancelled:
+                    continue
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    self.logger.error("Error in clock timer ..", exc_info=True)
+            self.settle()
+        with self.condition:
+            self.current = max(self.current, when)
+        self.settle()
+
+    def stop(self):
+        """
+        Ends the simulation, every thread parked on the clock raises ClockStopped
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
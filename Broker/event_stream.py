@@ -0,0 +1,174 @@
+# SYSTEM
+import json
+import uuid
+import itertools
+import threading
+import logging
+from time import sleep
+from collections import deque
+
+# CUSTOM
+import settings
+
+
+def sse_frame(event, data, event_id=None):
+    """
+    Returns the data as a Server-Sent Events frame of the event. Frames with an id are strategy
+    events, the browser sends the id of the last one as Last-Event-ID when it reconnects.
+    """
+    id_line = f"id: {event_id}\n" if event_id != None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+def parse_event_id(event_id):
+    """
+    Returns (stream instance, sequence) of an event id, (None, None) if it is not one
+    """
+    try:
+        instance, sequence = event_id.rsplit("-", 1)
+        return instance, int(sequence)
+    except (AttributeError, ValueError) as e:
+        return None, None
+
+
+class StreamClient:
+    """
+    Frames waiting to be sent to one connected client. State events (positions, LTPs) are conflated,
+    a new one replaces the one still pending, so a slow client skips to the latest state instead of
+    backing up. Strategy events are all kept, a client with more than STREAM_CLIENT_QUEUE_SIZE of
+    them pending is closed and gets the current state again when it reconnects.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = {}   # {key : frame} in the order they were published
+        self.queued = 0 # Strategy events pending
+        self.closed = False
+
+    def put(self, key, frame, conflate):
+        with self.condition:
+            if self.closed:
+                return
+            if conflate:
+                self.pending.pop(key, None) # The latest state goes after the events published before it
+            elif self.queued >= settings.STREAM_CLIENT_QUEUE_SIZE:
+                self.closed = True
+                self.condition.notify_all()
+                return
+            else:
+                self.queued += 1
+            self.pending[key] = frame
+            self.condition.notify_all()
+
+    def take(self, timeout):
+        """
+        Waits up to timeout (in sec) for frames and returns all the pending ones, empty list if none
+        """
+        with self.condition:
+            if len(self.pending) == 0 and not self.closed:
+                self.condition.wait(timeout)
+            frames = list(self.pending.values())
+            self.pending.clear()
+            self.queued = 0
+            return frames
+
+
+class EventStream:
+    """
+    Push channel of the live state to any number of clients. Strategy events are sent as they are
+    published. Positions (from the positions view) and the LTPs of the ticked instruments are sent
+    by a publisher thread at most every STREAM_PUBLISH_INTERVAL when they changed. The tick path only
+    stores the LTPs, every frame is serialized once for all the clients. Strategy events carry the id
+    <instance>-<sequence>. The last STREAM_RECENT_EVENTS of them are kept for the engine snapshot and
+    replayed to a client reconnecting with the id of the last event it got.
+    """
+    def __init__(self, positions_view, logger=None):
+        self.positions_view = positions_view
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.condition = threading.Condition()
+        self.clients = ()   # Replaced on connect/disconnect under the condition, so publishers read it unlocked
+        self.instance = uuid.uuid4().hex[:8]    # Sequences restart with a new stream
+        self.sequence = itertools.count()
+        self.recent = deque(maxlen=settings.STREAM_RECENT_EVENTS)   # [(sequence, event, data)] appended under the condition
+        self.ltps = {}  # {instrument_token : last_price} of every tick received
+        self.ltps_changed = False
+        self.thread = None
+
+    def on_ticks(self, ticks):
+        """
+        Stores the LTPs of the ticks. Called from the ticker thread.
+        """
+        for tick in ticks:
+            self.ltps[tick['instrument_token']] = tick['last_price']
+        self.ltps_changed = True
+
+    def event_id(self, sequence):
+        return f"{self.instance}-{sequence}"
+
+    def connect(self, last_event_id=None):
+        """
+        Registers a client, which starts with the current positions and LTPs. A reconnecting client
+        (last_event_id, the Last-Event-ID header) first gets the recent strategy events published
+        after that one, all of them if it was on the stream of an earlier broker. Events older than
+        the last STREAM_RECENT_EVENTS are not recovered. Returns the client.
+        """
+        client = StreamClient()
+        etag, payload = self.positions_view.snapshot()
+        client.put("positions", b"event: positions\ndata: " + payload + b"\n\n", True)
+        client.put("ltp", sse_frame("ltp", self.ltps.copy()), True)
+        instance, last_sequence = parse_event_id(last_event_id)
+        if instance != None and instance != self.instance:
+            last_sequence = -1
+        with self.condition:    # No event is published between the replay and the registration
+            if last_sequence != None:
+                for sequence, event, data in self.recent:
+                    if sequence > last_sequence:
+                        client.put(sequence, sse_frame(event, data, self.event_id(sequence)), False)
+            self.clients = self.clients + (client,)
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.run, name="EventStream", daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+        return client
+
+    def disconnect(self, client):
+        with self.condition:
+            self.clients = tuple(x for x in self.clients if x is not client)
+
+    def send(self, key, frame, conflate):
+        for client in self.clients:
+            client.put(key, frame, conflate)
+
+    def publish(self, event, data):
+        """
+        Sends an event to every connected client, events are never conflated
+        """
+        with self.condition:
+            sequence = next(self.sequence)
+            self.recent.append((sequence, event, data))
+            clients = self.clients
+        if len(clients) == 0:
+            return
+        frame = sse_frame(event, data, self.event_id(sequence))
+        for client in clients:
+            client.put(sequence, frame, False)
+
+    def run(self):
+        """
+        Publishes the changed positions and LTPs every interval while clients are connected
+        """
+        etag = None
+        while True:
+            with self.condition:
+                while len(self.clients) == 0:
+                    self.condition.wait()
+            sleep(settings.STREAM_PUBLISH_INTERVAL)
+            try:
+                current_etag, payload = self.positions_view.snapshot()
+                if current_etag != etag:
+                    etag = current_etag
+                    self.send("positions", b"event: positions\ndata: " + payload + b"\n\n", True)
+                if self.ltps_changed:
+                    self.ltps_changed = False
+                    self.send("ltp", sse_frame("ltp", self.ltps.copy()), True)
+            except Exception as e:
+                self.logger.error("Error in publishing to the event stream ..", exc_info=True)
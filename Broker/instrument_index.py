@@ -0,0 +1,144 @@
+# DATA
+import numpy as np
+import pandas as pd
+
+
+class InstrumentIndex:
+    """
+    Index over the instrument master. Symbol/token/exchange lookups binary search the row order
+    sorting the column, stored in the snapshot, so building the index reads nothing from the memory
+    mapped columns. Looked up keys are kept in a dictionary, repeated lookups are dictionary hits.
+    Accepts either the instrument master DataFrame or an InstrumentSnapshot.
+    """
+    def __init__(self, instruments):
+        self.source = instruments   # DataFrame or InstrumentSnapshot
+        self.__instruments = instruments if isinstance(instruments, pd.DataFrame) else None
+
+        # COLUMNS - row position -> value
+        if isinstance(instruments, pd.DataFrame):
+            self.tokens = instruments['instrument_token'].to_numpy(dtype=np.int64)
+            self.symbols = instruments['tradingsymbol'].astype(str).to_numpy()
+            self.exchange_codes, self.exchange_names = pd.factorize(instruments['exchange'].astype(str))
+            self.token_order = np.argsort(self.tokens, kind="stable")
+            self.symbol_order = np.argsort(self.symbols, kind="stable")
+        else:
+            self.tokens = instruments.columns['instrument_token']
+            self.symbols = instruments.columns['tradingsymbol']   # ascii bytes
+            self.exchange_codes, self.exchange_names = instruments.codes('exchange'), instruments.categories['exchange']
+            self.token_order = instruments.order('instrument_token')
+            self.symbol_order = instruments.order('tradingsymbol')
+        self.encoded = self.symbols.dtype.kind == "S"
+
+        # LOOKED UP KEYS - key -> row position, None if not listed
+        self.symbol_to_row = {}    # {(exchange, tradingsymbol) : row}, first listing wins as with the old iloc[0] lookups
+        self.token_to_row = {}     # {instrument_token : row}
+
+    def find_rows(self, column, order, value):
+        """
+        Returns rows (in row order) whose column equals the value, by binary search over the order
+        """
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high)//2
+            if column[order[middle]] < value:
+                low = middle + 1
+            else:
+                high = middle
+        rows = []
+        while low < len(order) and column[order[low]] == value:
+            rows.append(int(order[low]))
+            low += 1
+        return rows
+
+    @property
+    def instruments(self):
+        """
+        Full instrument master DataFrame, kept for ad-hoc queries. Built lazily from the snapshot.
+        """
+        if self.__instruments is None:
+            self.__instruments = self.source.to_dataframe()
+        return self.__instruments
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def get_row(self, tradingsymbol, exchange=None):
+        """
+        Returns row position of the trading symbol, None if it is not listed
+        """
+        key = (exchange, tradingsymbol)
+        if key not in self.symbol_to_row:
+            value = tradingsymbol.encode("ascii", errors="replace") if self.encoded else tradingsymbol
+            rows = [x for x in self.find_rows(self.symbols, self.symbol_order, value) if exchange == None or self.exchange_names[self.exchange_codes[x]] == exchange]
+            self.symbol_to_row[key] = rows[0] if rows else None
+        return self.symbol_to_row[key]
+
+    def get_token_row(self, instrument_token):
+        """
+        Returns row position of the instrument token. Raises KeyError if it is not listed
+        """
+        instrument_token = int(instrument_token)
+        if instrument_token not in self.token_to_row:
+            rows = self.find_rows(self.tokens, self.token_order, instrument_token)
+            self.token_to_row[instrument_token] = rows[0] if rows else None
+        row = self.token_to_row[instrument_token]
+        if row == None:
+            raise KeyError(instrument_token)
+        return row
+
+    def has_symbol(self, tradingsymbol, exchange=None):
+        """
+        Returns true if trading symbol exists
+        """
+        return self.get_row(tradingsymbol, exchange) != None
+
+    def get_instrument_token(self, tradingsymbol, exchange=None):
+        """
+        Returns instrument token of the trading symbol. Raises KeyError if it is not listed
+        """
+        row = self.get_row(tradingsymbol, exchange)
+        if row == None:
+            raise KeyError(f"{exchange}:{tradingsymbol}" if exchange else tradingsymbol)
+        return int(self.tokens[row])
+
+    def get_trading_symbol(self, instrument_token):
+        """
+        Returns trading symbol of the instrument token. Raises KeyError if it is not listed
+        """
+        symbol = self.symbols[self.get_token_row(instrument_token)]
+        return symbol.decode("ascii") if self.encoded else str(symbol)
+
+    def get_exchange(self, tradingsymbol):
+        """
+        Returns exchange of the trading symbol. Raises KeyError if it is not listed
+        """
+        row = self.get_row(tradingsymbol)
+        if row == None:
+            raise KeyError(tradingsymbol)
+        return str(self.exchange_names[self.exchange_codes[row]])
+
+    def get_field(self, instrument_token, column):
+        """
+        Returns a single column value of the instrument token, e.g. get_field(token, "expiry")
+        """
+        row = self.get_token_row(instrument_token)
+        if isinstance(self.source, pd.DataFrame):
+            return self.source[column].iloc[row]
+        return self.source.value(column, row)
+
+    def get_instrument(self, instrument_token):
+        """
+        Returns the complete instrument master record of the token as a dictionary. Meant for
+        ad-hoc queries, goes through the DataFrame.
+        """
+        return self.instruments.iloc[self.get_token_row(instrument_token)].to_dict()
+
+    def query(self, **filters):
+        """
+        Ad-hoc query on the instrument master. Returns the rows where every column equals the
+        value passed, e.g. query(name="BANKNIFTY", segment="NFO-OPT")
+        """
+        mask = pd.Series(True, index=self.instruments.index)
+        for column, value in filters.items():
+            mask &= self.instruments[column] == value
+        return self.instruments[mask]
@@ -0,0 +1,188 @@
+# SYSTEM
+import os
+import json
+import datetime
+
+# DATA
+import numpy as np
+import pandas as pd
+
+# Storage of every instrument master column in the snapshot
+# plain - fixed width numpy column, string - fixed width ascii bytes, category - int codes + categories
+SNAPSHOT_COLUMNS = {
+    "instrument_token": ("plain", "int64"),
+    "exchange_token": ("plain", "int64"),
+    "tradingsymbol": ("string", None),
+    "name": ("string", None),
+    "last_price": ("plain", "float64"),
+    "expiry": ("plain", "datetime64[D]"),
+    "strike": ("plain", "float64"),
+    "tick_size": ("plain", "float64"),
+    "lot_size": ("plain", "int32"),
+    "instrument_type": ("category", None),
+    "segment": ("category", None),
+    "exchange": ("category", None),
+}
+SORTED_COLUMNS = ["instrument_token", "tradingsymbol"]  # Row order sorting the column is stored, InstrumentIndex binary searches it
+META_FILE_NAME = "meta.json"
+
+
+def filter_traded_instruments(instruments:pd.DataFrame, underlyings:list):
+    """
+    Keeps only the instruments we trade : NSE equities/indices and NFO futures/options of the
+    given underlyings
+    """
+    nse = instruments['exchange'] == "NSE"
+    nfo = (instruments['exchange'] == "NFO") & (instruments['name'].isin(underlyings))
+    return instruments[nse | nfo].reset_index(drop=True)
+
+
+def save_column(path, array):
+    """
+    Writes the array to a temporary file and moves it over path, so a snapshot still mapped by a
+    running broker keeps its old file and is never truncated under it
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        np.save(file, array)
+    os.replace(tmp_path, path)
+
+
+def compile_snapshot(csv_path, snapshot_dir, underlyings=None):
+    """
+    Converts the instruments csv into a columnar binary snapshot (one .npy file per column) in the
+    snapshot directory. If underlyings are provided, only the traded segments are kept.
+    """
+    instruments = pd.read_csv(csv_path)
+    if underlyings != None:
+        instruments = filter_traded_instruments(instruments, underlyings)
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    meta_path = os.path.join(snapshot_dir, META_FILE_NAME)
+    if os.path.exists(meta_path):   # Invalidate the old snapshot before the columns are replaced
+        os.remove(meta_path)
+
+    meta = {
+        "date": datetime.date.today().strftime("%Y-%m-%d"),
+        "rows": int(instruments.shape[0]),
+        "underlyings": underlyings,
+        "columns": {}
+    }
+    for column, (kind, dtype) in SNAPSHOT_COLUMNS.items():
+        values = instruments[column]
+        column_meta = {"kind": kind}
+        if kind == "plain" and dtype == "datetime64[D]":
+            array = pd.to_datetime(values, errors="coerce").values.astype(dtype)
+        elif kind == "plain":
+            array = values.fillna(0).to_numpy(dtype=dtype)
+        elif kind == "string":
+            array = values.fillna("").astype(str).str.encode("ascii", errors="replace").to_numpy(dtype=bytes)
+        else:
+            categorical = pd.Categorical(values.fillna("").astype(str))
+            array = np.asarray(categorical.codes, dtype=np.int16)
+            column_meta["categories"] = [str(x) for x in categorical.categories]
+        save_column(os.path.join(snapshot_dir, f"{column}.npy"), array)
+        if column in SORTED_COLUMNS:
+            save_column(os.path.join(snapshot_dir, f"{column}.order.npy"), np.argsort(array, kind="stable").astype(np.int32))
+            column_meta["sorted"] = True
+        meta["columns"][column] = column_meta
+
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(meta, file)
+    os.replace(tmp_path, meta_path)   # Snapshot is valid only once the meta file exists
+
+
+def is_snapshot_fresh(snapshot_dir, underlyings=None):
+    """
+    Returns true if a snapshot compiled today with the same filter exists in the directory
+    """
+    meta_path = os.path.join(snapshot_dir, META_FILE_NAME)
+    if not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+    except Exception as e:
+        return False
+    return meta['date'] == datetime.date.today().strftime("%Y-%m-%d") and meta['underlyings'] == underlyings
+
+
+class InstrumentSnapshot:
+    """
+    Read only view over a compiled instrument snapshot. Columns are memory mapped, so opening a
+    snapshot costs a few milliseconds irrespective of the number of instruments.
+    """
+    def __init__(self, snapshot_dir):
+        with open(os.path.join(snapshot_dir, META_FILE_NAME)) as file:
+            self.meta = json.load(file)
+        self.date = datetime.datetime.strptime(self.meta['date'], "%Y-%m-%d").date()
+        self.columns = {}   # {column : memory mapped array}
+        self.categories = {}    # {column : numpy array of categories} for categorical columns
+        self.orders = {}    # {column : memory mapped row order sorting the column}
+        for column, column_meta in self.meta['columns'].items():
+            self.columns[column] = np.load(os.path.join(snapshot_dir, f"{column}.npy"), mmap_mode='r')
+            if column_meta.get('sorted') == True:
+                self.orders[column] = np.load(os.path.join(snapshot_dir, f"{column}.order.npy"), mmap_mode='r')
+            if column_meta['kind'] == "category":
+                self.categories[column] = np.array(column_meta['categories'], dtype=object)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def codes(self, column):
+        """
+        Returns raw codes of a categorical column
+        """
+        return self.columns[column]
+
+    def order(self, column):
+        """
+        Returns row order sorting the raw column (stable, so equal values keep their row order),
+        sorted when the snapshot was compiled
+        """
+        if column not in self.orders:   # Snapshot compiled without it
+            self.orders[column] = np.argsort(self.columns[column], kind="stable")
+        return self.orders[column]
+
+    def category_code(self, column, value):
+        """
+        Returns code of the value in a categorical column, -1 if value is not present
+        """
+        matches = np.flatnonzero(self.categories[column] == value)
+        return int(matches[0]) if matches.size > 0 else -1
+
+    def __getitem__(self, column):
+        """
+        Returns decoded column - strings for string and categorical columns
+        """
+        kind = self.meta['columns'][column]['kind']
+        if kind == "category":
+            return self.categories[column][self.columns[column]]
+        if kind == "string":
+            return np.char.decode(self.columns[column], "ascii")
+        return self.columns[column]
+
+    def value(self, column, row):
+        """
+        Returns the decoded value of a single cell
+        """
+        kind = self.meta['columns'][column]['kind']
+        value = self.columns[column][row]
+        if kind == "category":
+            return self.categories[column][value]
+        if kind == "string":
+            return value.decode("ascii")
+        return value
+
+    def to_dataframe(self):
+        """
+        Builds the instrument master DataFrame from the snapshot, used only for ad-hoc queries
+        """
+        data = {}
+        for column, column_meta in self.meta['columns'].items():
+            if column_meta['kind'] == "category":
+                data[column] = pd.Categorical.from_codes(np.asarray(self.columns[column]), categories=column_meta['categories'])
+            else:
+                data[column] = self[column]
+        return pd.DataFrame(data)
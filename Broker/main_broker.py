@@ -3,56 +3,69 @@ import os
 from sys import exc_info
 import datetime
 import logging
+import threading
 from time import sleep, time
+from concurrent.futures import Future
 
 # WEB
 import requests
-import pyotp
-from urllib import parse
-from kiteconnect import KiteConnect, KiteTicker
+from kiteconnect import KiteTicker
 
 # DATA
 import pandas as pd
-import csv
 import json
 
 # CUSTOM
 import settings
+from Broker.instrument_index import InstrumentIndex
+from Broker.instrument_snapshot import InstrumentSnapshot, compile_snapshot, is_snapshot_fresh
+from Broker.option_chain import OptionChainIndex
+from Broker.candle_aggregator import CandleAggregator
+from Broker.candle_cache import CandleCache
+from Broker.clock import SystemClock
+from Broker.scheduler import SessionScheduler
+from Broker.order_tracker import completed_handle
+from Broker.account_session import AccountSession, kite_login
+from Broker.basket_executor import BasketExecutor
+from Broker.request_gateway import RequestGateway
+from Broker.tick_recorder import TickRecorder
+from Broker.tick_buffer import TickStore
+from Broker.trade_journal import get_journal
+from Broker.positions_view import PositionsView
+from Broker.event_stream import EventStream
+from Broker.risk_engine import RiskEngine
+from Strategy.indicators import IndicatorEngine
+from Strategy.option_analytics import ChainAnalytics
 
 class Zerodha:
     """
-    Object for Zerodha broker, contains all broker functions for 5EMA strategy
+    Object for Zerodha broker, contains all broker functions shared by the strategies. One ticker
+    feed and one instrument index serve every account traded, orders are routed to the execution
+    session (AccountSession) of each account.
     """
-    def __init__(self):
+    def __init__(self, tick_recorder=None):
+        """
+        tick_recorder : recorder of the broker being replaced, handed over so the process keeps a single one
+        """
         # BROKER CONNECTION VARIABLES
-        self.__conn = None  # Broker connection object
+        self.__conn = None  # Broker connection object of the main account, for market data
         self.__ticker = None  # Broker ticker object
 
-        # DYNAMIC TRADE DATA
-        self.live_data_dictionary = {}  # Contains dynamic values for the particular token - {instrument_token : LTP}
-        self.active_trade = None # Trade that needs to be closed with SL or target - {order_id, instrument_token, quantity, target, stoploss, trailingSL, price, paper_trade}
-        self.is_active_trade = False
-
-        # STATIC VARIABLES
-        self.month_mapping = {1:"JAN", 2:"FEB", 3:"MAR", 4:"APR", 5:"MAY", 6:"JUN", 7:"JUL", 8:"AUG", 9:"SEP", 10:"OCT", 11:"NOV", 12:"DEC"}
-
-        # UTILITY VARIABLES
-        self.logger = self.get_logger()
-        self.instruments = self.load_instruments()
+        self.init_state(SystemClock())
+        if tick_recorder == None and settings.TICK_RECORDING == True:
+            tick_recorder = TickRecorder(settings.TICK_DATA_DIR, self.logger, self.clock)
+        self.tick_recorder = tick_recorder
+        self.instrument_index = InstrumentIndex(self.load_instruments())   # O(1) symbol/token lookups
+        self.option_chains = OptionChainIndex(self.instrument_index.source)   # Strike sorted option chains
 
         # Broker login initiation
         self.__conn, self.__ticker = self.login() 
         if type(self.__conn) == int:
             exit(1)
-
-        # Create Excel Order Log
-        if not os.path.isfile(settings.CSV_LOGS_FILE):
-            with open(settings.CSV_LOGS_FILE, "a") as file:
-                field_names = ["ORDER ID", "DATE TIME", "INSTRUMENT TOKEN", "ORDER TYPE", "QUANTITY", "TARGET", "STOPLOSS", "TRAILING SL", "BANKNIFTY FUT PRICE", "PAPER TRADE"]
-                writer = csv.DictWriter(file, fieldnames=field_names)
-                writer.writeheader()
+        self.accounts = [self.account] + self.login_linked_accounts()
 
         # Start live streaming of Data
+        self.candle_aggregator.start()
         self.__ticker.connect(threaded=True)
         start_time = time()
         while(self.__ticker.is_connected() == False): # Wait till streaming becomes live
@@ -61,6 +74,38 @@ class Zerodha:
                 self.logger.critical("Live streaming cannot be started. Increase TICKER_RETRY_TIMEOUT for weaker networks. Appliation exiting ..\n")
                 exit(1)
 
+    def init_state(self, clock, journal_file=settings.TRADE_JOURNAL_FILE):
+        """
+        Initializes trade data and utilities which do not depend on the broker connection
+        """
+        # TICK SUBSCRIBERS
+        self.tick_subscribers = {}  # {instrument_token : [callback(tick)]}, called from the ticker thread on every tick
+        self.tick_subscribers_lock = threading.Lock()
+
+        # STATIC VARIABLES
+        self.month_mapping = {1:"JAN", 2:"FEB", 3:"MAR", 4:"APR", 5:"MAY", 6:"JUN", 7:"JUL", 8:"AUG", 9:"SEP", 10:"OCT", 11:"NOV", 12:"DEC"}
+        self.interval_mapping = {1:"minute", 3:"3minute", 5:"5minute", 10:"10minute", 15:"15minute", 30:"30minute", 60:"60minute"}  # Timeframe (in min) -> Kite interval
+
+        # UTILITY VARIABLES
+        self.clock = clock  # All time related calls of the broker and strategies go through the clock
+        self.logger = self.get_logger()
+        self.gateway = RequestGateway(self.logger)  # Rate limits and prioritizes every Kite REST call
+        self.scheduler = SessionScheduler(self.clock, self.logger)  # Session events of the broker and strategies
+        self.candle_aggregator = CandleAggregator(self.logger, self.clock)  # Live OHLCV bars built from the ticks
+        self.indicator_engine = IndicatorEngine()   # Streaming indicators shared by all strategies
+        self.candle_cache = CandleCache(self.fetch_historical_data_from_kite, settings.CANDLE_CACHE_DIR, self.logger)
+        self.account = None # Execution session of the main account, whose access token opens the ticker
+        self.accounts = []  # Execution sessions of every account traded, main account first
+        self.basket_executor = BasketExecutor(self.clock, self.logger) # Places legs of multi-leg orders concurrently
+        self.tick_recorder = None   # Records every tick received, live broker only
+        self.tick_store = TickStore(self.clock)    # Latest ticks of every token received, read without locking
+        self.journal = get_journal(journal_file, self.logger)   # Fills of all the strategies, written in the background
+        self.positions_view = PositionsView()   # Open positions of all the strategies with live PnL, served by /positions
+        self.events = EventStream(self.positions_view, self.logger)    # Pushes positions, LTPs and strategy events to /stream clients
+        self.risk_engine = RiskEngine(self.logger, self.clock)  # Portfolio MTM of the open legs of all the strategies, flattens on a breach
+        self.chain_analytics = {}   # {(underlying, expiry) : ChainAnalytics} IV and greeks of the option chains
+        self.chain_analytics_lock = threading.Lock()
+
     def get_logger(self):
         """
         Creates a logger with stream and file handlers, and returns it. 
@@ -82,103 +127,106 @@ class Zerodha:
 
     def login(self):
         """
-        Creates a client object after performing authentication with zerodha. This client object
-        can be used to take actions on the user account. 
+        Creates a client object after performing authentication with zerodha for the main account
+        (credentials file). This client object is used for market data and the orders of the
+        account, and its access token opens the only ticker.
         
         Returns:
             client and ticker objects
         """
         self.logger.info("Starting Broker Login Process ..")
-        BROKER_LOGIN_ATTEMPT_COUNT = 0
-        while BROKER_LOGIN_ATTEMPT_COUNT < settings.MAX_BROKER_LOGIN_ATTEMPT_COUNT:
-            try:
-                try:
-                    with open(settings.BROKER_CREDENTIALS_FILE) as file:
-                        credentials = json.load(file)
-                except Exception as e:
-                    self.logger.critical("Broker credentials file not found ..\n", exc_info=True)
-                    return
+        try:
+            with open(settings.BROKER_CREDENTIALS_FILE) as file:
+                credentials = json.load(file)
+        except Exception as e:
+            self.logger.critical("Broker credentials file not found ..\n", exc_info=True)
+            return 1, 1
+
+        session = kite_login(credentials, self.logger)
+        if session == None:
+            self.logger.critical("Broker login max retries exceeded. Application exiting ..")
+            return 1, 1
+        conn, access_token = session
+
+        # ==============================================================================
+        # TICKER
+        ticker = KiteTicker(
+            api_key=credentials['api_key'],
+            access_token=access_token
+        )
+        ticker.on_close = self.on_close 
+        ticker.on_ticks = self.on_ticks
+        ticker.on_connect = self.on_connect
+        ticker.on_error = self.on_error
+        ticker.on_order_update = self.on_order_update
+
+        self.account = AccountSession(credentials['user_id'], conn, self.clock, self.instrument_index, self.logger, self.gateway)  # Shares the rate limits with the market data calls
+        self.logger.info("Broker Login Successful")
+        return conn, ticker
+
+    def login_linked_accounts(self):
+        """
+        Logs in to the linked accounts of the accounts file ([{user_id, password, totp_code, api_key,
+        api_secret, multiplier}]) concurrently and returns their execution sessions. Linked accounts
+        are sent every order of the main account, without a ticker of their own. Accounts which cannot
+        log in are not traded for the day.
+        """
+        if not os.path.exists(settings.BROKER_ACCOUNTS_FILE):
+            return []
+        try:
+            with open(settings.BROKER_ACCOUNTS_FILE) as file:
+                linked = json.load(file)
+        except Exception as e:
+            self.logger.critical("Broker accounts file could not be read, linked accounts are not traded ..", exc_info=True)
+            return []
 
-                headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.77"}
-                session = requests.Session()
-                session.headers.update(headers)
-                
-                get_response = session.get(f"https://kite.trade/connect/login?api_key={credentials['api_key']}")
-                login_response = json.loads(session.post("https://kite.zerodha.com/api/login", data={
-                    'user_id': credentials['user_id'],
-                    'password': credentials['password']
-                }).text)
-
-                totp = pyotp.TOTP(credentials['totp_code'])
-                totp_response = session.post("https://kite.zerodha.com/api/twofa",
-                    data = {
-                        'user_id': credentials['user_id'],
-                        'request_id': login_response['data']['request_id'],
-                        'twofa_value': totp.now()
-                    }
-                )
+        sessions = [None]*len(linked)
+        def login(position):
+            sessions[position] = kite_login(linked[position], self.logger)
+        for thread in [self.clock.spawn(login, x) for x in range(len(linked))]:
+            thread.join()
 
-                # Extracting the token
-                token = ""
-                try:
-                    final_response = session.get(get_response.url + "&skip_session=true")
-                    parsed_text = parse.urlparse(final_response.history[1].headers['location'])
-                    token = parse.parse_qs(parsed_text.query)['request_token'][0]
-                except Exception as e:
-                    self.logger.critical("Error in generating zerodha token\n", exc_info=True)
-                    return
-
-                session.close()
-                self.__conn = KiteConnect(api_key=credentials['api_key'])
-                data = self.__conn.generate_session(
-                    request_token=token,
-                    api_secret=credentials['api_secret']
-                )
-                
-                self.__conn.set_access_token(data['access_token'])
+        accounts = []
+        for credentials, session in zip(linked, sessions):
+            if session == None:
+                self.logger.critical(f"Login of linked account {credentials['user_id']} failed, it is not traded today")
+                continue
+            accounts.append(AccountSession(credentials['user_id'], session[0], self.clock, self.instrument_index, self.logger, multiplier=credentials.get('multiplier', 1)))
+        self.logger.info(f"{len(accounts)} linked accounts logged in")
+        return accounts
 
-                # ==============================================================================
-                # TICKER
-                self.__ticker = KiteTicker(
-                    api_key=credentials['api_key'],
-                    access_token=data['access_token']
-                )
-                self.__ticker.on_close = self.on_close 
-                self.__ticker.on_ticks = self.on_ticks
-                self.__ticker.on_connect = self.on_connect
-                self.__ticker.on_error = self.on_error
-
-                if data['access_token'] == None:
-                    return self.__conn, self.__ticker
-                else:
-                    self.logger.info("Broker Login Successful")
-                    return self.__conn, self.__ticker
-            except Exception as e:
-                self.logger.error("Broker login failed. Retrying ..", exc_info=True)
-            BROKER_LOGIN_ATTEMPT_COUNT += 1
-        self.logger.critical("Broker login max retries exceeded. Application exiting ..")
-        return 1, 1
+    @property
+    def instruments(self):
+        """
+        Instrument master DataFrame, for ad-hoc queries only. Lookups should go through instrument_index.
+        """
+        return self.instrument_index.instruments
 
     def load_instruments(self):
         """
-        Loads the instruments from the instruments file. If file not exists or has gotten old, 
-        new file is downloaded from the web.
+        Loads the instruments from today's compiled snapshot. If the snapshot does not exist or has
+        gotten old, it is compiled from the instruments file, which is downloaded from the web if
+        it does not exist or has gotten old.
         """
+        underlyings = settings.INSTRUMENT_SNAPSHOT_UNDERLYINGS if settings.INSTRUMENT_SNAPSHOT_FILTER else None
         FETCH_INSTRUMENT_ATTEMPT_COUNTER = 0
         while FETCH_INSTRUMENT_ATTEMPT_COUNTER < settings.MAX_FETCH_INSTRUMENT_FILE_ATTEMPT_COUNT:
             try:
-                file_path = settings.INSTRUMENTS_FILE
-                if os.path.exists(file_path):
-                    m_dt = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-                    m_dt = m_dt.date()  # Extracting date
-                    
-                if not os.path.exists(file_path) or m_dt != datetime.datetime.now().date():  # If file not exists or file was not modified today
-                    url = "https://api.kite.trade/instruments"
-                    response = requests.get(url, allow_redirects=True)
-                    open(file_path, 'wb').write(response.content)
-                
-                with open(file_path, 'r') as file:
-                    instruments = pd.read_csv(file)
+                if not is_snapshot_fresh(settings.INSTRUMENTS_SNAPSHOT_DIR, underlyings):
+                    file_path = settings.INSTRUMENTS_FILE
+                    if os.path.exists(file_path):
+                        m_dt = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
+                        m_dt = m_dt.date()  # Extracting date
+                        
+                    if not os.path.exists(file_path) or m_dt != datetime.datetime.now().date():  # If file not exists or file was not modified today
+                        url = "https://api.kite.trade/instruments"
+                        response = requests.get(url, allow_redirects=True)
+                        open(file_path, 'wb').write(response.content)
+
+                    compile_snapshot(file_path, settings.INSTRUMENTS_SNAPSHOT_DIR, underlyings)
+                    self.logger.info("Instruments snapshot compiled")
+
+                instruments = InstrumentSnapshot(settings.INSTRUMENTS_SNAPSHOT_DIR)
                 self.logger.info("Instruments loaded successfully")
                 return instruments
             except Exception as e:
@@ -194,18 +242,18 @@ class Zerodha:
         """
         exch = -1
         try:
-            exch = str(self.instruments[self.instruments['tradingsymbol'] == tradingsymbol]['exchange'].iloc[0])
+            exch = self.instrument_index.get_exchange(tradingsymbol)
         except Exception as e:
             self.logger.error("Failed to fetch Exchange .. \n", exc_info=True)
         return exch
 
-    def get_instrument_token(self, tradingsymbol):
+    def get_instrument_token(self, tradingsymbol, exchange=None):
         """
         Returns instrument token by mapping the input symbol name, -1 in case of failure
         """
         instrument_token = -1
         try:
-            instrument_token = int(self.instruments[self.instruments['tradingsymbol'] == tradingsymbol]['instrument_token'].iloc[0])
+            instrument_token = self.instrument_index.get_instrument_token(tradingsymbol, exchange)
         except Exception as e:
             self.logger.error(f"Failed to fetch instrument token for {tradingsymbol}.. \n", exc_info=True)
         return instrument_token
@@ -216,233 +264,235 @@ class Zerodha:
         """
         trading_symbol = -1
         try:
-            trading_symbol = str(self.instruments[self.instruments['instrument_token'] == instrument_token]['tradingsymbol'].iloc[0])
+            trading_symbol = self.instrument_index.get_trading_symbol(instrument_token)
         except Exception as e:
             self.logger.error("Failed to fetch trading symbol .. \n", exc_info=True)
         return trading_symbol
 
-    def check_trading_symbol(self, tradingsymbol):
+    def check_trading_symbol(self, tradingsymbol, exchange=None):
         """
         Returns true if trading symbol exists
         """
+        return self.instrument_index.has_symbol(tradingsymbol, exchange)
+
+    def get_expiry(self, instrument_token):
+        """
+        Returns expiry date of the instrument token, None in case of failure or if it does not expire
+        """
         try:
-            instrument_token = int(self.instruments[self.instruments['tradingsymbol'] == tradingsymbol]['instrument_token'].iloc[0])
-            return True
+            expiry = pd.Timestamp(self.instrument_index.get_field(instrument_token, "expiry"))
+            return None if pd.isna(expiry) else expiry.date()
         except Exception as e:
-            return False
+            self.logger.error("Failed to fetch expiry .. \n", exc_info=True)
+            return None
 
-    def fetch_BNF_historical_data(self):
+    def get_option_chain(self, underlying, expiry=None):
         """
-        Returns Bank Nifty Fut historical data of current day
-        with 5 min interval in the form of pandas dataframe
+        Returns the strike sorted option chain of the underlying for the expiry (nearest expiry if
+        not provided), None in case of failure
+        """
+        chain = self.option_chains.get_chain(underlying, expiry, self.clock.now().date())
+        if chain == None:
+            self.logger.error(f"Option chain not found for {underlying} {expiry}")
+        return chain
+
+    def get_chain_analytics(self, underlying, underlying_price, expiry=None):
+        """
+        Returns ChainAnalytics (IV and greeks of every strike) of the option chain from the latest LTPs,
+        recomputed at most every OPTION_ANALYTICS_REFRESH seconds. underlying_price (e.g. futures LTP)
+        is the guess of the forward. None if the chain is not found or no strike has both prices yet.
+        Only the subscribed options have prices.
+        """
+        chain = self.get_option_chain(underlying, expiry)
+        if chain == None:
+            return None
+        now = self.clock.now()
+        with self.chain_analytics_lock:
+            analytics = self.chain_analytics.get((underlying, chain.expiry))
+            if analytics == None:
+                analytics = ChainAnalytics(chain)
+                self.chain_analytics[(underlying, chain.expiry)] = analytics
+            if analytics.updated_at == None or (now - analytics.updated_at).total_seconds() >= settings.OPTION_ANALYTICS_REFRESH:
+                analytics.refresh(self.get_ltps(chain.ce_tokens), self.get_ltps(chain.pe_tokens), underlying_price, now)
+        return analytics if analytics.updated_at != None else None
+
+    def fetch_historical_data_from_kite(self, instrument_token, interval, from_datetime, to_datetime):
+        """
+        Returns historical data of the instrument token between the datetimes, fetched from Kite, in
+        the form of list of dictionaries
         """
         RETRY_COUNT = 0
         while RETRY_COUNT < settings.HISTORICAL_DATA_FETCH_MAX_RETRY:
             try:
-                data = self.__conn.historical_data(
-                    instrument_token = self.bank_nifty_fut_instrument_token,
-                    from_date = datetime.date.today().strftime("%Y-%m-%d"),
-                    to_date = datetime.date.today().strftime("%Y-%m-%d"),
-                    interval = "5minute"
+                return self.gateway.read("historical", self.__conn.historical_data,
+                    instrument_token = instrument_token,
+                    from_date = from_datetime.strftime("%Y-%m-%d %H:%M:%S"),
+                    to_date = to_datetime.strftime("%Y-%m-%d %H:%M:%S"),
+                    interval = interval
                 )
-                return pd.DataFrame(data)
             except Exception as e:
-                self.logger.error("Error in fetching BNF historical data. Retrying ..", exc_info=True)
+                self.logger.error("Error in fetching historical data. Retrying ..", exc_info=True)
                 sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
                 RETRY_COUNT += 1
                 
         self.logger.critical("Historical data fetch retry limited exceeded. Application exiting ..")
         exit(1)
-        
-    def place_buy_order(self, tradingsymbol, quantity, target, stoploss, trailingSL, price, paper_trading:False):
+
+    def fetch_historical_data(self, instrument_token, interval="5minute", from_date=None, to_date=None):
         """
-        Places buy order for the provided trading symbol with the given parameters
+        Returns historical data of the instrument token (current day by default) in the form of
+        list of dictionaries. Served from the candle cache, only missing bars are fetched from Kite.
         """
-        self.is_active_trade = True
+        from_date = from_date or self.clock.now().date()
+        to_date = to_date or self.clock.now().date()
+        return self.candle_cache.get_candles(instrument_token, interval, from_date, to_date)
 
-        if paper_trading == True:
-            instrument_token = self.get_instrument_token(tradingsymbol)
-            self.logger.info(f"BUY TRADE TRIGGERED\nOrder ID: PAPER_TRADE\nInstrument Token: {instrument_token}\nQuantity: {quantity}\nTarget: {target}\nStoploss: {stoploss}\nTrailingSL: {trailingSL}\nPrice: {price}")
-            order_id = "PAPER_TRADE"
-        
+    def fetch_BNF_historical_data(self):
+        """
+        Returns Bank Nifty Fut historical data of current day
+        with 5 min interval in the form of pandas dataframe
+        """
+        return pd.DataFrame(self.fetch_historical_data(self.bank_nifty_fut_instrument_token, "5minute"))
+
+    def subscribe_candles(self, instrument_token, timeframe, callback):
+        """
+        Registers callback(instrument_token, timeframe, bar) to be called when a live bar of the timeframe
+        (in min) closes. The series is seeded with one historical fetch of the current day when it is first used.
+        """
+        if (instrument_token, timeframe) not in self.candle_aggregator.series:
+            historical_bars = self.fetch_historical_data(instrument_token, self.interval_mapping[timeframe])
+            self.candle_aggregator.add_series(instrument_token, timeframe, historical_bars)
+        self.candle_aggregator.subscribe(instrument_token, timeframe, callback)
+
+    def unsubscribe_candles(self, instrument_token, timeframe, callback):
+        """
+        Removes callback from the bar close subscribers
+        """
+        self.candle_aggregator.unsubscribe(instrument_token, timeframe, callback)
+
+    def get_candles(self, instrument_token, timeframe):
+        """
+        Returns the closed bars of the current day in the form of pandas dataframe
+        """
+        return self.candle_aggregator.get_bars(instrument_token, timeframe)
+
+    def get_indicator(self, instrument_token, timeframe, name, **params):
+        """
+        Returns the shared streaming indicator (EMA, SMA, ATR, RSI, VWAP) of the token's bars, e.g.
+        get_indicator(token, 5, "EMA", length=5). It is warmed with the closed bars of the day and then
+        updated on every bar close, before the bar is handed to strategies subscribed after this call.
+        """
+        if not self.indicator_engine.has_series(instrument_token, timeframe):
+            self.subscribe_candles(instrument_token, timeframe, self.indicator_engine.on_bar_close)
+        return self.indicator_engine.get_indicator(
+            instrument_token, timeframe, name,
+            warmup_bars=self.get_candles(instrument_token, timeframe), **params
+        )
+
+    def place_order(self, tradingsymbol, transaction_type, quantity, max_attempts=None):
+        """
+        Places market order on every account and returns the handle of the main account immediately,
+        a future resolved with the final order once it is COMPLETE. Orders CANCELLED or REJECTED by
+        the exchange are placed again, the handle fails once max_attempts (MAX_ORDER_PLACEMENT_RETRIES
+        by default) are exhausted. Linked accounts are sent the order concurrently, each on its own
+        connection, so the last account gets it about one round trip after the signal however many
+        accounts there are.
+        """
+        for account in self.accounts[1:]:
+            self.clock.spawn(self.place_linked_order, account, tradingsymbol, transaction_type, quantity, max_attempts)
+        return self.account.place_order(tradingsymbol, transaction_type, quantity, max_attempts)
+
+    def place_linked_order(self, account, tradingsymbol, transaction_type, quantity, max_attempts=None):
+        """
+        Places the order of the main account on a linked account
+        """
+        try:
+            handle = account.place_order(tradingsymbol, transaction_type, quantity, max_attempts)
+        except Exception as e:
+            handle = Future()
+            handle.set_exception(e)
+        handle.add_done_callback(lambda x: self.on_linked_order_final(account, f"{transaction_type} order of {tradingsymbol}", x))
+
+    def on_linked_order_final(self, account, description, handle):
+        """
+        Logs the outcome of an order or basket of a linked account, strategies follow the main account only
+        """
+        if handle.exception() != None:
+            self.logger.critical(f"{description} failed on linked account {account.name}, its positions differ from the strategies\n{handle.exception()}")
         else:
-            ORDER_PLACE_COUNTER = 0
-            while ORDER_PLACE_COUNTER < settings.MAX_ORDER_PLACEMENT_RETRIES:
-                ORDER_PLACE_COUNTER += 1
-                try:
-                    order_id = self.__conn.place_order(
-                        variety = "regular", 
-                        exchange = "NSE", 
-                        tradingsymbol = tradingsymbol, 
-                        transaction_type = "BUY", 
-                        quantity = quantity, 
-                        product = "MIS", 
-                        order_type = "MARKET", 
-                        price = None
-                        )
-                except Exception as e:
-                    self.logger.error("Error placing order on zerodha ..", exc_info=True)
-                    continue
-
-                ORDER_STATUS_CHECK_ATTEMPTS = 0
-                order_status = self.__conn.order_history(order_id=order_id)[-1]['status']
-                while order_status not in ["COMPLETE", "CANCELLED", "REJECTED"] and ORDER_STATUS_CHECK_ATTEMPTS < 10:  # Wait till order reaches on of these states
-                    sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-                    ORDER_STATUS_CHECK_ATTEMPTS += 1
-                    order_status = self.__conn.order_history(order_id=order_id)[-1]['status']
-
-                if order_status == "COMPLETE":  # Trade executed
-                    instrument_token = self.get_instrument_token(tradingsymbol)
-                    self.logger.info(f"BUY TRADE TRIGGERED\nOrder ID: {order_id}\nInstrument Token: {instrument_token}\nQuantity: {quantity}\nTarget: {target}\nStoploss: {stoploss}\nTrailingSL: {trailingSL}\nPrice: {price}")
-                    break
-                else:
-                    self.logger.error(f"Trade Status {order_status}")
-            
-            if ORDER_PLACE_COUNTER >= settings.MAX_ORDER_PLACEMENT_RETRIES:
-                self.logger.critical("Order placment max retries exceeded. Application exiting..")
-                exit(1)
+            self.logger.info(f"{description} executed on linked account {account.name}")
 
-        self.active_trade = {
-            "date_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "order_id": order_id,
-            "instrument_token": instrument_token, 
-            "quantity": quantity,
-            "target": target,
-            "stoploss": stoploss,
-            "trailingSL": trailingSL,
-            "price": price,
-            "paper_trade": True
-            }
-
-        excel_log = {
-            "ORDER ID": "PAPER_TRADE",
-            "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "ORDER TYPE": "BUY",
-            "INSTRUMENT TOKEN": instrument_token, 
-            "QUANTITY": quantity,
-            "TARGET": target,
-            "STOPLOSS": stoploss,
-            "TRAILING SL": trailingSL,
-            "BANKNIFTY FUT PRICE": price,
-            "PAPER TRADE": paper_trading
-            }
-        with open(settings.CSV_LOGS_FILE, "a") as file:
-            writer = csv.DictWriter(file, fieldnames=list(excel_log.keys()))
-            writer.writerows([excel_log])
-
-    def place_sell_order(self, tradingsymbol, quantity, price, paper_trading=False):
-        """
-        Places sell order for the given trading symbol with given parameters
-        """
-        self.is_active_trade = False
+    def place_paper_order(self, tradingsymbol, transaction_type, quantity, max_attempts=None):
+        """
+        Paper trade counterpart of place_order, the handle is resolved immediately
+        """
+        return completed_handle({"order_id": "PAPER_TRADE", "status": "COMPLETE"})
+
+    def place_basket(self, legs, paper_trading=False, unwind=True):
+        """
+        Places all legs ([BasketLeg]) of a multi-leg order concurrently and returns the basket handle
+        immediately. It is resolved with the orders of the legs once all of them are executed, or fails
+        with BasketFailed after the executed legs have been unwound if any leg is rejected. Exit
+        baskets (unwind False) place their rejected legs again instead.
+        """
         if paper_trading == True:
-            instrument_token = self.get_instrument_token(tradingsymbol)
-            self.logger.info(f"SELL TRADE TRIGGERED\nOrder ID: PAPER_TRADE\nInstrument Token: {instrument_token}\nQuantity: {quantity}\nPrice: {price}")
-            
-        else:
-            ORDER_PLACE_COUNTER = 0
-            while ORDER_PLACE_COUNTER < settings.MAX_ORDER_PLACEMENT_RETRIES:
-                ORDER_PLACE_COUNTER += 1
-                try:
-                    order_id = self.__conn.place_order(
-                        variety = "regular", 
-                        exchange = "NSE", 
-                        tradingsymbol = tradingsymbol, 
-                        transaction_type = "SELL", 
-                        quantity = quantity, 
-                        product = "MIS", 
-                        order_type = "MARKET", 
-                        price = None
-                        )
-                except Exception as e:
-                    self.logger.error("Error placing order on zerodha ..", exc_info=True)
-                    continue
-
-                ORDER_STATUS_CHECK_ATTEMPTS = 0
-                order_status = self.__conn.order_history(order_id=order_id)[-1]['status']
-                while order_status not in ["COMPLETE", "CANCELLED", "REJECTED"] and ORDER_STATUS_CHECK_ATTEMPTS < 10:  # Wait till order reaches on of these states
-                    sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-                    ORDER_STATUS_CHECK_ATTEMPTS += 1
-                    order_status = self.__conn.order_history(order_id=order_id)[-1]['status']
-                
-                if order_status == "COMPLETE":  # Trade executed
-                    instrument_token = self.get_instrument_token(tradingsymbol)
-                    self.logger.info(f"SELL TRADE TRIGGERED\nOrder ID: {order_id}\nInstrument Token: {instrument_token}\nQuantity: {quantity}\nPrice: {price}")
-                    break
-                else:
-                    self.logger.error(f"Trade {order_status}. Retrying ..")
-            
-            if ORDER_PLACE_COUNTER >= settings.MAX_ORDER_PLACEMENT_RETRIES:
-                self.logger.critical("Order placment max retries exceeded. Application exiting..")
-                exit(1)
+            return self.basket_executor.execute(legs, self.place_paper_order, unwind=unwind)
+        for account in self.accounts[1:]:   # Every account executes, unwinds or retries the basket on its own
+            self.basket_executor.execute(legs, account.place_order, unwind=unwind).add_done_callback(
+                lambda x, account=account: self.on_linked_order_final(account, f"Basket {[leg.tradingsymbol for leg in legs]}", x)
+            )
+        return self.basket_executor.execute(legs, self.account.place_order, unwind=unwind)
 
-        excel_log = {
-            "ORDER ID": "PAPER_TRADE",
-            "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "ORDER TYPE": "SELL",
-            "INSTRUMENT TOKEN": instrument_token, 
-            "QUANTITY": quantity,
-            "TARGET": "NONE",
-            "STOPLOSS": "NONE",
-            "TRAILING SL": "NONE",
-            "BANKNIFTY FUT PRICE": price,
-            "PAPER TRADE": paper_trading
-            }
-        with open(settings.CSV_LOGS_FILE, "a") as file:
-            writer = csv.DictWriter(file, fieldnames=list(excel_log.keys()))
-            writer.writerows([excel_log])
-        
-        self.active_trade = None
+    def get_fill_price(self, order, instrument_token):
+        """
+        Returns the price the order was filled at, the LTP of the instrument for paper orders
+        """
+        price = order.get('average_price') or order.get('price')
+        return price if price else self.get_ltp(instrument_token)
 
-    def close_position(self):
+    def fetch_orders(self):
         """
-        Keeps running indefinetly, keeping track of all the active trade of the user. If target or SL is triggered
-        for that trade, position is closed off. 
+        Returns all the orders of the day of the main account from Kite, in the form of list of dictionaries
         """
-        while True:
-            trade = self.active_trade
-            ltp = self.live_data_dictionary[self.bank_nifty_fut_instrument_token]
+        return self.account.fetch_orders()
 
-            if ltp > trade['target'] or ltp <= trade['price'] - trade['stoploss'] or datetime.datetime.now().time() >= datetime.time(15, 30, 0, 0):
-                self.place_sell_order(
-                    tradingsymbol=self.get_trading_symbol(trade['instrument_token']),
-                    quantity=trade['quantity'],
-                    price=ltp,
-                    paper_trading=trade['paper_trade']
-                )
-                self.active_trade = []
-                if ltp > trade['target']:   # Target achieved
-                    self.logger.info(f"Target achieved for order_id: {trade['order_id']}\nTrading symbol: {self.get_trading_symbol(trade['instrument_token'])}\nQuanity: {trade['quantity']}\nPrice: {ltp}")
-                elif ltp <= trade['price'] - trade['stoploss']: # Stoploss triggered
-                    self.logger.info(f"Stoploss triggered for order_id: {trade['order_id']}\nTrading symbol: {self.get_trading_symbol(trade['instrument_token'])}\nQuanity: {trade['quantity']}\nPrice: {ltp}")
-                else:
-                    self.logger.info("Exiting position due to market closure")
-                return
+    def get_lot_size(self, instrument_token):
+        """
+        Returns lot size of the instrument token, 1 in case of failure
+        """
+        try:
+            return int(self.instrument_index.get_field(instrument_token, "lot_size"))
+        except Exception as e:
+            return 1
 
-            elif ltp > trade['price'] + trade['trailingSL']: # Move stoploss forward
-                self.logger.info("Moved Stoploss forward")
-                trade['price'] += trade['trailingSL']
+    def open_leg(self, strategy, instrument_token, tradingsymbol, order_id, transaction_type, quantity, price, date_time):
+        """
+        Adds an executed leg of the strategy to the positions view and the risk engine. Raises
+        ValueError if the price is not known. The instrument is kept subscribed on the ticker, so the
+        position gets its LTP whatever the strategy subscribed.
+        """
+        if price == None or price != price:
+            raise ValueError(f"Entry price of {tradingsymbol} of {strategy} is not known")
+        self.subscribe_instruments([instrument_token])
+        self.positions_view.open_position(strategy, instrument_token, tradingsymbol, order_id, transaction_type, quantity, price, date_time, self.get_ltp(instrument_token))
+        self.risk_engine.open_leg(strategy, instrument_token, transaction_type, quantity, price, self.get_lot_size(instrument_token))
 
-            sleep(settings.DATA_UPDATE_TIME)
+    def close_leg(self, strategy, instrument_token, price=None):
+        """
+        Removes an exited leg of the strategy from the positions view and the risk engine, price is its
+        exit fill price
+        """
+        self.positions_view.close_position(strategy, instrument_token)
+        self.risk_engine.close_leg(strategy, instrument_token, price)
 
-    def get_positions(self):
+    def publish_event(self, strategy, state, **details):
         """
-        Returns list of live positions
+        Pushes a state transition of the strategy (ENTERED TRADE REGION, ORDER PLACED ..) with its
+        details to the event stream clients
         """
-        if self.active_trade == None:
-            return []
-        else:
-            response = [{
-                "STRATEGY": "FIVE EMA",
-                "DATE TIME": self.active_trade['date_time'],
-                "ORDER_ID": self.active_trade['order_id'],
-                "TRADING SYMBOL": self.get_trading_symbol(self.active_trade['instrument_token']),
-                "BANKNIFTY FUT LTP": self.live_data_dictionary[self.bank_nifty_fut_instrument_token],
-                "QUANTITY": self.active_trade['quantity'],
-                "ENTRY PRICE": self.active_trade['price'],
-                "STATUS": "ACTIVE"
-            }]
-            return response
+        self.events.publish("strategy", {
+            "strategy": strategy, "state": state, "date_time": self.clock.now().strftime("%Y-%m-%d %H:%M:%S"), **details
+        })
 
     # =================================================================================================================
     # KITE Ticker
@@ -450,30 +500,110 @@ class Zerodha:
         """
         Called when new data is sent from the server. Updates the latest values of the tickers.
         """
+        if self.tick_recorder != None:
+            self.tick_recorder.record(ticks)
+        self.tick_store.on_ticks(ticks)    # Update the latest values of the tickers
+        self.positions_view.on_ticks(ticks)
+        self.risk_engine.on_ticks(ticks)
+        self.events.on_ticks(ticks)
         for instrument_data in ticks:
-            token = instrument_data['instrument_token']
-            ltp = instrument_data['last_price']        
-            self.live_data_dictionary[token] = ltp  # Update the latest value of the ticker
+            self.candle_aggregator.on_tick(instrument_data)
 
-    def on_connect(self, ws, response):
+        for instrument_data in ticks:   # Dispatch after all values are updated, so handlers see the whole batch
+            subscribers = self.tick_subscribers.get(instrument_data['instrument_token'])
+            if not subscribers:
+                continue
+            for callback in subscribers:
+                try:
+                    callback(instrument_data)
+                except Exception as e:
+                    self.logger.error("Error in tick subscriber ..", exc_info=True)
+
+    def get_ltp(self, instrument_token):
         """
-        Called as soon as the socket is connected for streaming. Starts streaming of BankNifty FUT
+        Returns the last traded price of the instrument token, None if no tick has arrived yet
+        """
+        return self.tick_store.ltp(instrument_token)
+
+    def get_ltps(self, instrument_tokens):
+        """
+        Returns the last traded prices of the instrument tokens as an array, NaN for tokens with no tick yet
+        """
+        return self.tick_store.ltps(instrument_tokens)
+
+    def get_quote(self, instrument_token):
+        """
+        Returns the latest tick of the instrument token with all its fields (TICK_DTYPE record), None
+        if no tick has arrived yet
+        """
+        return self.tick_store.latest(instrument_token)
+
+    def get_recent_ticks(self, instrument_token, seconds, out=None):
+        """
+        Returns the ticks of the instrument token received in the last seconds as a structured array,
+        copied into out (tick_store.buffer()) if passed so the call does not allocate
+        """
+        return self.tick_store.last(instrument_token, seconds, out)
+
+    def add_tick_subscriber(self, instrument_token, callback):
+        """
+        Registers callback(tick) to be called on every tick of the instrument token
         """
-        month = self.month_mapping[datetime.date.today().month]
-        year = (datetime.date.today().year)%100
-        tradingsymbol = f"BANKNIFTY{year}{month}FUT"
+        with self.tick_subscribers_lock:
+            subscribers = list(self.tick_subscribers.get(instrument_token, []))
+            subscribers.append(callback)
+            self.tick_subscribers[instrument_token] = subscribers   # Copy on write, ticker thread iterates without locking
+
+    def remove_tick_subscriber(self, instrument_token, callback):
+        """
+        Removes callback from the subscribers of the instrument token
+        """
+        with self.tick_subscribers_lock:
+            subscribers = [x for x in self.tick_subscribers.get(instrument_token, []) if x != callback]
+            if len(subscribers) == 0:
+                self.tick_subscribers.pop(instrument_token, None)
+            else:
+                self.tick_subscribers[instrument_token] = subscribers
+
+    def get_fut_token(self, underlying):
+        """
+        Returns instrument token of the current month FUT of the underlying, or of the next month once
+        the current month contract has expired
+        """
+        today = self.clock.now().date()
+        month = self.month_mapping[today.month]
+        year = (today.year)%100
+        tradingsymbol = f"{underlying}{year}{month}FUT"
         if self.check_trading_symbol(tradingsymbol) == True:
-            self.bank_nifty_fut_instrument_token = self.get_instrument_token(tradingsymbol)
-        else:
-            month = self.month_mapping[(datetime.date.today().month + 1)%12]
-            if datetime.date.today().month == 12:
-                year = year+1
-            tradingsymbol = f"BANKNIFTY{year}{month}FUT"
-            self.bank_nifty_fut_instrument_token = self.get_instrument_token(tradingsymbol)
+            return self.get_instrument_token(tradingsymbol)
+        month = self.month_mapping[today.month%12 + 1]
+        if today.month == 12:
+            year = year+1
+        tradingsymbol = f"{underlying}{year}{month}FUT"
+        return self.get_instrument_token(tradingsymbol)
+
+    def get_bank_nifty_fut_token(self):
+        """
+        Returns instrument token of the current month BankNifty FUT
+        """
+        return self.get_fut_token("BANKNIFTY")
 
+    def on_connect(self, ws, response):
+        """
+        Called as soon as the socket is connected for streaming. Starts streaming of BankNifty FUT
+        """
+        self.bank_nifty_fut_instrument_token = self.get_bank_nifty_fut_token()
+        self.positions_view.underlying_token = self.bank_nifty_fut_instrument_token
         ws.subscribe([self.bank_nifty_fut_instrument_token])
+        ws.set_mode(settings.TICKER_MODE, [self.bank_nifty_fut_instrument_token])
         self.logger.info("Socket connection successful. Started streaming ..")
 
+    def on_order_update(self, ws, data):
+        """
+        Called when the status of an order of the main account changes
+        """
+        self.account.order_tracker.on_order_update(data)
+
     def on_close(self, ws, code, reason):
         """
         Called when the socket is closed for streaming
@@ -494,6 +624,7 @@ class Zerodha:
         """
         self.logger.info(f"{instrument_tokens} Subscribed")
         self.__ticker.subscribe(instrument_tokens)
+        self.__ticker.set_mode(settings.TICKER_MODE, instrument_tokens)
 
     def unsubscribe_instruments(self, instrument_tokens:list):
         """
@@ -502,3 +633,22 @@ class Zerodha:
         self.logger.info(f"{instrument_tokens} unsubscribed")
         self.__ticker.unsubscribe(instrument_tokens)
 
+    def close(self):
+        """
+        Shuts the broker down before it is replaced by the one of the next day : closes the ticker,
+        stops the bar timers and the session events left on the scheduler, and flushes the tick file
+        unless the recorder was handed over to the new broker. Orders still pending keep resolving
+        through their trackers.
+        """
+        if self.__ticker != None:
+            # Callbacks are detached first, on_close would stop the reactor shared with the new ticker
+            self.__ticker.on_close = self.__ticker.on_error = None
+            self.__ticker.on_ticks = self.__ticker.on_order_update = self.__ticker.on_connect = None
+            self.__ticker.stop_retry()
+            self.__ticker.close()
+        self.candle_aggregator.stop()
+        self.scheduler.cancel_all()
+        if self.tick_recorder != None:
+            self.tick_recorder.close()
+        self.logger.info("Broker closed")
+
@@ -0,0 +1,145 @@
+# SYSTEM
+import datetime
+from collections import namedtuple
+
+# DATA
+import numpy as np
+import pandas as pd
+
+# Single strike of an option chain, token is -1 and symbol empty when that leg is not listed
+OptionStrike = namedtuple("OptionStrike", ["strike", "ce_token", "ce_symbol", "pe_token", "pe_symbol"])
+
+
+class OptionChain:
+    """
+    Options of one underlying and expiry, sorted by strike. All strike searches are binary searches
+    over the strike array and return tokens directly.
+    """
+    def __init__(self, underlying, expiry, strikes, ce_tokens, ce_symbols, pe_tokens, pe_symbols):
+        self.underlying = underlying
+        self.expiry = expiry    # datetime.date
+        self.strikes = strikes  # Sorted np.float64 array
+        self.ce_tokens = ce_tokens  # np.int64 array aligned with strikes, -1 if not listed
+        self.pe_tokens = pe_tokens
+        self.ce_symbols = ce_symbols    # list aligned with strikes, "" if not listed
+        self.pe_symbols = pe_symbols
+
+    def __len__(self):
+        return self.strikes.size
+
+    def get_strike(self, position):
+        """
+        Returns the OptionStrike at the position in the chain
+        """
+        return OptionStrike(
+            float(self.strikes[position]),
+            int(self.ce_tokens[position]), self.ce_symbols[position],
+            int(self.pe_tokens[position]), self.pe_symbols[position]
+        )
+
+    def nearest_position(self, price):
+        """
+        Returns position of the listed strike nearest to the price
+        """
+        position = int(np.searchsorted(self.strikes, price))
+        if position == 0:
+            return 0
+        if position == self.strikes.size:
+            return self.strikes.size - 1
+        if price - self.strikes[position - 1] < self.strikes[position] - price:
+            return position - 1
+        return position
+
+    def nearest(self, price):
+        """
+        Returns the OptionStrike nearest to the price, i.e. the ATM strike
+        """
+        return self.get_strike(self.nearest_position(price))
+
+    def around(self, price, n):
+        """
+        Returns (strikes, ce_tokens, pe_tokens) of the ATM strike and n strikes on either side of it
+        """
+        position = self.nearest_position(price)
+        start = max(position - n, 0)
+        end = min(position + n + 1, self.strikes.size)
+        return self.strikes[start:end], self.ce_tokens[start:end], self.pe_tokens[start:end]
+
+    def within(self, low, high):
+        """
+        Returns (strikes, ce_tokens, pe_tokens) of all the strikes in the band [low, high]
+        """
+        start = int(np.searchsorted(self.strikes, low, side='left'))
+        end = int(np.searchsorted(self.strikes, high, side='right'))
+        return self.strikes[start:end], self.ce_tokens[start:end], self.pe_tokens[start:end]
+
+
+class OptionChainIndex:
+    """
+    Option chains of every underlying and expiry in the instrument master
+    """
+    def __init__(self, instruments):
+        """
+        instruments : instrument master DataFrame or InstrumentSnapshot
+        """
+        self.chains = {}    # {(underlying, expiry) : OptionChain}
+        self.expiries = {}  # {underlying : sorted list of expiries}
+
+        instrument_type = np.asarray(instruments['instrument_type']).astype(str)
+        options = np.flatnonzero((instrument_type == "CE") | (instrument_type == "PE"))
+        if options.size == 0:
+            return
+
+        names = np.asarray(instruments['name']).astype(str)[options]
+        expiries = pd.to_datetime(pd.Series(np.asarray(instruments['expiry'])[options]), errors="coerce").values.astype("datetime64[D]")
+        strikes = np.asarray(instruments['strike'], dtype=np.float64)[options]
+        tokens = np.asarray(instruments['instrument_token'], dtype=np.int64)[options]
+        symbols = np.asarray(instruments['tradingsymbol']).astype(str)[options]
+        is_call = instrument_type[options] == "CE"
+
+        order = np.lexsort((strikes, expiries, names))  # Sorted by underlying, expiry and then strike
+        names, expiries, strikes = names[order], expiries[order], strikes[order]
+        tokens, symbols, is_call = tokens[order], symbols[order], is_call[order]
+
+        # Boundaries of every (underlying, expiry) group in the sorted arrays
+        changes = np.flatnonzero((names[1:] != names[:-1]) | (expiries[1:] != expiries[:-1])) + 1
+        starts = np.concatenate(([0], changes))
+        ends = np.concatenate((changes, [names.size]))
+
+        for start, end in zip(starts, ends):
+            if np.isnat(expiries[start]):
+                continue
+            underlying = str(names[start])
+            expiry = expiries[start].astype(datetime.date)
+            chain_strikes, positions = np.unique(strikes[start:end], return_inverse=True)
+            ce_tokens = np.full(chain_strikes.size, -1, dtype=np.int64)
+            pe_tokens = np.full(chain_strikes.size, -1, dtype=np.int64)
+            ce_symbols = [""]*chain_strikes.size
+            pe_symbols = [""]*chain_strikes.size
+            for offset in range(end - start):
+                position = positions[offset]
+                if is_call[start + offset]:
+                    ce_tokens[position] = tokens[start + offset]
+                    ce_symbols[position] = str(symbols[start + offset])
+                else:
+                    pe_tokens[position] = tokens[start + offset]
+                    pe_symbols[position] = str(symbols[start + offset])
+
+            self.chains[(underlying, expiry)] = OptionChain(underlying, expiry, chain_strikes, ce_tokens, ce_symbols, pe_tokens, pe_symbols)
+            self.expiries.setdefault(underlying, []).append(expiry)
+
+        for underlying in self.expiries:
+            self.expiries[underlying].sort()
+
+    def get_chain(self, underlying, expiry=None, today=None):
+        """
+        Returns the option chain of the underlying for the expiry. If no expiry is passed, the nearest
+        expiry that has not passed yet is used. Returns None if no such chain is listed.
+        """
+        if expiry == None:
+            today = today or datetime.date.today()
+            upcoming = [x for x in self.expiries.get(underlying, []) if x >= today]
+            if len(upcoming) == 0:
+                return None
+            expiry = upcoming[0]
+        return self.chains.get((underlying, expiry))
@@ -0,0 +1,112 @@
+# SYSTEM
+import datetime
+import threading
+import logging
+from concurrent.futures import Future
+
+# CUSTOM
+import settings
+
+ORDER_FINAL_STATUSES = ["COMPLETE", "CANCELLED", "REJECTED"]
+
+
+def completed_handle(order):
+    """
+    Returns an order handle which is already resolved with the order, used for paper and simulated trades
+    """
+    handle = Future()
+    handle.set_result(order)
+    return handle
+
+
+class OrderTracker:
+    """
+    Tracks placed orders till they reach a final status. Fed by the order updates pushed on the
+    ticker, with a single batched orders() poll covering all the pending orders as a fallback for
+    missed updates. Every tracked order has a future which is resolved with its final order.
+    """
+    def __init__(self, fetch_orders, clock, logger=None):
+        """
+        fetch_orders() returns all the orders of the day from the broker as a list of dictionaries
+        """
+        self.fetch_orders = fetch_orders
+        self.clock = clock
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.pending = {}   # {order_id : Future} orders which have not reached a final status
+        self.early_updates = {} # {order_id : (received_at, order)} final updates pushed before the order was tracked
+        self.lock = threading.Lock()
+        self.poll_timer = None
+
+    def track(self, order_id):
+        """
+        Returns the future of the order, resolved with the order (dictionary) once it is COMPLETE,
+        CANCELLED or REJECTED
+        """
+        with self.lock:
+            future = self.pending.get(order_id)
+            if future != None:
+                return future
+            future = Future()
+            early_update = self.early_updates.pop(order_id, None)
+            if early_update == None:
+                self.pending[order_id] = future
+                self.schedule_poll()
+        if early_update != None:
+            future.set_result(early_update[1])
+        return future
+
+    def on_order_update(self, order):
+        """
+        Resolves the order if the update has a final status. Called from the ticker thread.
+        """
+        if order.get('status') not in ORDER_FINAL_STATUSES:
+            return
+        with self.lock:
+            future = self.pending.pop(order['order_id'], None)
+            if future == None:  # Update pushed before place_order returned the order id, or of an order placed elsewhere
+                self.add_early_update(order)
+                return
+        future.set_result(order)
+
+    def add_early_update(self, order):
+        """
+        Keeps the final update till its order is tracked, expiring the updates older than
+        EARLY_ORDER_UPDATE_EXPIRY. Must be called with the lock held.
+        """
+        now = self.clock.now()
+        expired_before = now - datetime.timedelta(seconds=settings.EARLY_ORDER_UPDATE_EXPIRY)
+        for order_id in [x for x, (received_at, _) in self.early_updates.items() if received_at < expired_before]:
+            del self.early_updates[order_id]
+        self.early_updates[order['order_id']] = (now, order)
+
+    def schedule_poll(self):
+        """
+        Sets the fallback poll if orders are pending and no poll is set. Must be called with the lock held.
+        """
+        if self.poll_timer != None or len(self.pending) == 0:
+            return
+        when = self.clock.now() + datetime.timedelta(seconds=settings.ORDER_STATUS_POLL_INTERVAL)
+        self.poll_timer = self.clock.call_at(when, self.clock.spawn, self.poll)
+
+    def poll(self):
+        """
+        Checks all the pending orders with one orders() call
+        """
+        with self.lock:
+            self.poll_timer = None
+            if len(self.pending) == 0:
+                return
+        try:
+            orders = self.fetch_orders()
+        except Exception as e:
+            self.logger.error("Error in fetching orders ..", exc_info=True)
+            orders = []
+        for order in orders:
+            if order.get('status') not in ORDER_FINAL_STATUSES:
+                continue
+            with self.lock:
+                future = self.pending.pop(order['order_id'], None)  # Orders of the day not tracked are skipped
+            if future != None:
+                future.set_result(order)
+        with self.lock:
+            self.schedule_poll()
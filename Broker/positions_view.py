@@ -0,0 +1,123 @@
+# SYSTEM
+import json
+import uuid
+import threading
+
+
+class PositionsView:
+    """
+    Open positions of all the strategies with their live PnL, maintained by the order events and the
+    tick path instead of being built per request. Every change bumps the version and serializes the
+    payload once, readers get the prebuilt payload with its ETag and can wait for the next version.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.positions = {} # {(strategy, instrument_token) : position}
+        self.tokens = frozenset()   # Tokens of the open positions, replaced on change so the ticker thread reads it unlocked
+        self.underlying_token = None    # BankNifty FUT, its price is shown with every position
+        self.underlying_price = None
+        self.instance = uuid.uuid4().hex[:8]    # ETags of a restarted view never match the old ones
+        self.version = 0
+        self.etag = None
+        self.payload = None
+        with self.condition:
+            self.publish()
+
+    def publish(self):
+        """
+        Serializes the positions as the next version. Must be called with the condition held.
+        """
+        self.version += 1
+        self.etag = f'"{self.instance}-{self.version}"'
+        self.payload = json.dumps(list(self.positions.values())).encode()
+        self.condition.notify_all()
+
+    def set_pnl(self, position):
+        """
+        Updates the PnL of the position from its LTP
+        """
+        if position['LTP'] == None or position['ENTRY PRICE'] == None:
+            position['PNL'] = None
+            return
+        direction = 1 if position['TRANSACTION TYPE'] == "BUY" else -1
+        position['PNL'] = round(direction*(position['LTP'] - position['ENTRY PRICE'])*position['QUANTITY'], 2) + 0.0   # No -0.0
+
+    def open_position(self, strategy, instrument_token, tradingsymbol, order_id, transaction_type, quantity, entry_price, date_time, ltp=None):
+        """
+        Adds an executed position of the strategy
+        """
+        with self.condition:
+            position = {
+                "STRATEGY": strategy,
+                "DATE TIME": date_time,
+                "ORDER_ID": order_id,
+                "TRADING SYMBOL": tradingsymbol,
+                "INSTRUMENT TOKEN": instrument_token,
+                "TRANSACTION TYPE": transaction_type,
+                "QUANTITY": quantity,
+                "ENTRY PRICE": entry_price,
+                "LTP": ltp if ltp != None else entry_price,
+                "PNL": None,
+                "BANKNIFTY FUT LTP": self.underlying_price,
+                "STATUS": "ACTIVE"
+            }
+            self.set_pnl(position)
+            self.positions[(strategy, instrument_token)] = position
+            self.tokens = frozenset(x[1] for x in self.positions)
+            self.publish()
+
+    def close_position(self, strategy, instrument_token):
+        """
+        Removes the position of the strategy once it is exited
+        """
+        with self.condition:
+            if self.positions.pop((strategy, instrument_token), None) == None:
+                return
+            self.tokens = frozenset(x[1] for x in self.positions)
+            self.publish()
+
+    def on_ticks(self, ticks):
+        """
+        Updates LTP and PnL of the open positions. Called from the ticker thread, ticks of other
+        instruments cost a set lookup.
+        """
+        tokens = self.tokens
+        if len(tokens) == 0:   # Nothing to publish, only the underlying price is kept for the next position
+            for tick in ticks:
+                if tick['instrument_token'] == self.underlying_token:
+                    self.underlying_price = tick['last_price']
+            return
+        changed = False
+        with self.condition:
+            for tick in ticks:
+                token = tick['instrument_token']
+                if token == self.underlying_token and tick['last_price'] != self.underlying_price:
+                    self.underlying_price = tick['last_price']
+                    for position in self.positions.values():
+                        position['BANKNIFTY FUT LTP'] = self.underlying_price
+                    changed = True
+                if token not in tokens:
+                    continue
+                for position in self.positions.values():
+                    if position['INSTRUMENT TOKEN'] == token and position['LTP'] != tick['last_price']:
+                        position['LTP'] = tick['last_price']
+                        self.set_pnl(position)
+                        changed = True
+            if changed:
+                self.publish()
+
+    def snapshot(self):
+        """
+        Returns (etag, payload) of the current version
+        """
+        with self.condition:
+            return self.etag, self.payload
+
+    def wait_for_change(self, etag, timeout):
+        """
+        Waits till the version differs from the etag or the timeout (in sec) expires, and returns
+        (etag, payload) of the current version
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.etag != etag, timeout)
+            return self.etag, self.payload
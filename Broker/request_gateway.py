@@ -0,0 +1,136 @@
+# SYSTEM
+import threading
+import itertools
+import logging
+from time import time
+from concurrent.futures import Future
+
+# CUSTOM
+import settings
+
+# Lanes of the endpoints, lower goes first when requests are waiting for a connection
+ENDPOINT_PRIORITY = {"order": 0, "default": 1, "historical": 2}
+
+
+class TokenBucket:
+    """
+    Requests allowed on an endpoint, refilled continuously at rate per second up to the burst
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time()
+        self.blocked_until = 0  # Set when Kite answers 429 anyway
+
+    def wait_time(self, now):
+        """
+        Returns time (in sec) till a request can be sent, 0 if it can be sent now
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0 if self.tokens >= 1 else (1 - self.tokens)/self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, now, seconds):
+        self.tokens = 0
+        self.blocked_until = now + seconds
+
+
+class RequestGateway:
+    """
+    Single gateway for every Kite REST call of the broker. Each endpoint has a token bucket within
+    Kite's rate limits, at most KITE_MAX_CONCURRENT_REQUESTS calls are in flight (the size of the
+    connection pool) and waiting calls get a connection by priority, so orders never queue behind
+    historical data. Identical reads in flight are sent once and their result is shared.
+    """
+    def __init__(self, logger=None):
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.condition = threading.Condition()
+        self.buckets = {endpoint: TokenBucket(rate, burst) for endpoint, (rate, burst) in settings.KITE_RATE_LIMITS.items()}
+        self.waiting = []   # [(priority, sequence, endpoint)] tickets of calls waiting to be sent
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.in_flight_reads = {}   # {(endpoint, function, args, kwargs) : Future}
+
+    def get_bucket(self, endpoint):
+        return self.buckets.get(endpoint, self.buckets["default"])
+
+    def is_next(self, ticket, now):
+        """
+        Returns true if the ticket is the first in priority order among the waiting tickets whose
+        endpoint can send now. Must be called with the condition held.
+        """
+        ready = [x for x in self.waiting if self.get_bucket(x[2]).wait_time(now) == 0]
+        return min(ready) == ticket
+
+    def acquire(self, endpoint):
+        """
+        Blocks till a call to the endpoint may be sent
+        """
+        bucket = self.get_bucket(endpoint)
+        ticket = (ENDPOINT_PRIORITY.get(endpoint, ENDPOINT_PRIORITY["default"]), next(self.sequence), endpoint)
+        with self.condition:
+            self.waiting.append(ticket)
+            while True:
+                now = time()
+                delay = bucket.wait_time(now)
+                if delay == 0 and self.in_flight < settings.KITE_MAX_CONCURRENT_REQUESTS and self.is_next(ticket, now):
+                    break
+                self.condition.wait(delay if delay > 0 else None)  # Woken when a call is sent or finished
+            self.waiting.remove(ticket)
+            bucket.take()
+            self.in_flight += 1
+            self.condition.notify_all()
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def request(self, endpoint, function, *args, **kwargs):
+        """
+        Calls function(*args, **kwargs) of the Kite connection once the endpoint allows it and returns
+        its result. A 429 from Kite holds the endpoint for KITE_RATE_LIMIT_BACKOFF before the next call.
+        """
+        self.acquire(endpoint)
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if getattr(e, "code", None) == 429:
+                self.logger.error(f"Kite rate limit hit on {endpoint} endpoint, holding it for {settings.KITE_RATE_LIMIT_BACKOFF} sec")
+                with self.condition:
+                    self.get_bucket(endpoint).block(time(), settings.KITE_RATE_LIMIT_BACKOFF)
+            raise
+        finally:
+            self.release()
+
+    def read(self, endpoint, function, *args, **kwargs):
+        """
+        Same as request for calls without side effects. A call identical to one already in flight waits
+        for it and gets the same result, which must not be modified.
+        """
+        key = (endpoint, getattr(function, "__name__", repr(function)), args, tuple(sorted(kwargs.items())))
+        with self.condition:
+            future = self.in_flight_reads.get(key)
+            leader = future == None
+            if leader:
+                future = Future()
+                self.in_flight_reads[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = self.request(endpoint, function, *args, **kwargs)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.condition:
+                del self.in_flight_reads[key]
@@ -0,0 +1,209 @@
+# SYSTEM
+import threading
+import logging
+
+# DATA
+import numpy as np
+
+# CUSTOM
+import settings
+from Broker.clock import SystemClock
+
+SIDE = {"BUY": 1.0, "SELL": -1.0}
+
+
+class RiskEngine:
+    """
+    Open legs of all the strategies in arrays (token, side, quantity, entry, lot size, LTP), with
+    per leg, per strategy and portfolio MTM recomputed vectorially on every tick batch. The day's
+    portfolio MTM (realized + open) is checked against the portfolio stoploss and lock-in, a breach
+    halts new entries and calls the flatten handler of every strategy once.
+    """
+    def __init__(self, logger=None, clock=None, capacity=64):
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.clock = clock if clock != None else SystemClock()
+        self.lock = threading.Lock()
+        self.count = 0
+        self.allocate(capacity)
+        self.keys = []  # (strategy, instrument_token) of each leg, in array order
+        self.strategies = {}    # {strategy : id} ids index the per strategy sums
+        self.strategy_names = []
+        self.leg_tokens = np.empty(0, dtype=np.int64)  # Sorted unique tokens of the legs, their LTPs and leg -> unique index
+        self.token_ltps = np.empty(0)
+        self.token_index = np.empty(0, dtype=np.intp)
+
+        self.realized = 0.0 # PnL of the legs closed today
+        self.mtm = 0.0  # Portfolio MTM, realized + open
+        self.peak_mtm = 0.0
+        self.max_loss = 0.0 # Lowest portfolio MTM of the day
+        self.margin_at_risk = 0.0
+        self.lock_in_armed = False
+        self.halted = False # Set on a portfolio breach, strategies take no new entries
+        self.flatten_handlers = {}  # {strategy : callback(reason)}
+
+    def allocate(self, capacity):
+        """
+        Grows the leg arrays to capacity, keeping the open legs
+        """
+        arrays = {
+            "tokens": np.int64, "sides": np.float64, "quantities": np.float64, "entries": np.float64,
+            "lot_sizes": np.int64, "ltps": np.float64, "strategy_ids": np.intp, "leg_mtm": np.float64
+        }
+        for name, dtype in arrays.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if hasattr(self, name):
+                array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def index_tokens(self):
+        """
+        Rebuilds the unique token index of the open legs. Must be called with the lock held.
+        """
+        ltps = dict(zip(self.tokens[:self.count].tolist(), self.ltps[:self.count].tolist()))
+        self.leg_tokens, self.token_index = np.unique(self.tokens[:self.count], return_inverse=True)
+        self.token_ltps = np.array([ltps[x] for x in self.leg_tokens.tolist()], dtype=np.float64)
+
+    def add_flatten_handler(self, strategy, callback):
+        """
+        Registers callback(reason) which exits every open leg of the strategy on a portfolio breach
+        """
+        self.flatten_handlers[strategy] = callback
+
+    def open_leg(self, strategy, instrument_token, transaction_type, quantity, entry_price, lot_size=1):
+        """
+        Adds an executed leg of the strategy, quantity in units. Raises ValueError if the entry price
+        is not known, the MTM of every leg would be NaN.
+        """
+        if entry_price == None or entry_price != entry_price:
+            raise ValueError(f"Entry price of leg {instrument_token} of {strategy} is not known")
+        with self.lock:
+            if strategy not in self.strategies:
+                self.strategies[strategy] = len(self.strategy_names)
+                self.strategy_names.append(strategy)
+            if self.count == self.capacity:
+                self.allocate(2*self.capacity)
+            i = self.count
+            held = np.flatnonzero(self.tokens[:i] == instrument_token)  # Legs of a token share its LTP
+            self.tokens[i] = instrument_token
+            self.sides[i] = SIDE[transaction_type]
+            self.quantities[i] = quantity
+            self.entries[i] = entry_price
+            self.lot_sizes[i] = lot_size
+            self.ltps[i] = self.ltps[held[0]] if held.size > 0 else entry_price
+            self.strategy_ids[i] = self.strategies[strategy]
+            self.keys.append((strategy, instrument_token))
+            self.count += 1
+            self.index_tokens()
+            self.update()
+
+    def close_leg(self, strategy, instrument_token, exit_price=None):
+        """
+        Removes the leg once it is exited, its PnL at the exit price (LTP if not passed) is realized
+        """
+        with self.lock:
+            if (strategy, instrument_token) not in self.keys:
+                return
+            i = self.keys.index((strategy, instrument_token))
+            exit_price = exit_price if exit_price != None else self.ltps[i]
+            self.realized += float(self.sides[i]*(exit_price - self.entries[i])*self.quantities[i])
+
+            last = self.count - 1   # Last leg takes the place of the closed one
+            for array in [self.tokens, self.sides, self.quantities, self.entries, self.lot_sizes, self.ltps, self.strategy_ids]:
+                array[i] = array[last]
+            self.keys[i] = self.keys[last]
+            self.keys.pop()
+            self.count -= 1
+            self.index_tokens()
+            self.update()
+
+    def on_ticks(self, ticks):
+        """
+        Updates the LTPs of the legs from the tick batch and recomputes the MTM. Called from the
+        ticker thread.
+        """
+        if self.count == 0:
+            return
+        tokens = np.fromiter((x['instrument_token'] for x in ticks), dtype=np.int64, count=len(ticks))
+        prices = np.fromiter((x['last_price'] for x in ticks), dtype=np.float64, count=len(ticks))
+        with self.lock:
+            if self.count == 0:
+                return
+            position = np.minimum(np.searchsorted(self.leg_tokens, tokens), self.leg_tokens.size - 1)
+            matched = self.leg_tokens[position] == tokens
+            if not matched.any():
+                return
+            self.token_ltps[position[matched]] = prices[matched]    # Later ticks of a token in the batch win
+            self.ltps[:self.count] = self.token_ltps[self.token_index]
+            breach = self.update()
+        if breach != None:
+            self.flatten(breach)
+
+    def update(self):
+        """
+        Recomputes MTM, max loss and margin at risk of the open legs and checks the portfolio rules.
+        Returns the reason of a new breach, None otherwise. Must be called with the lock held.
+        """
+        n = self.count
+        quantities, ltps = self.quantities[:n], self.ltps[:n]
+        self.leg_mtm[:n] = self.sides[:n]*(ltps - self.entries[:n])*quantities
+        self.mtm = self.realized + float(self.leg_mtm[:n].sum())
+        self.peak_mtm = max(self.peak_mtm, self.mtm)
+        self.max_loss = min(self.max_loss, self.mtm)
+        self.margin_at_risk = float((quantities*ltps).sum())*settings.RISK_SHOCK_PERCENT/100    # Loss if every leg moves the shock against it
+
+        if self.halted or n == 0:
+            return None
+        if settings.PORTFOLIO_STOP_LOSS != None and self.mtm <= -settings.PORTFOLIO_STOP_LOSS:
+            return "PORTFOLIO STOPLOSS"
+        if settings.PORTFOLIO_LOCK_IN_TRIGGER != None and self.mtm >= settings.PORTFOLIO_LOCK_IN_TRIGGER:
+            self.lock_in_armed = True
+        if self.lock_in_armed and self.mtm <= settings.PORTFOLIO_LOCK_IN:
+            return "PORTFOLIO LOCK IN"
+        return None
+
+    def flatten(self, reason):
+        """
+        Halts new entries and exits every strategy with open legs, off the calling thread
+        """
+        with self.lock:
+            if self.halted:
+                return
+            self.halted = True
+            strategies = set(x[0] for x in self.keys)
+        self.logger.critical(f"{reason} hit at portfolio MTM {self.mtm:.2f}, flattening {sorted(strategies)}")
+        for strategy in strategies:
+            handler = self.flatten_handlers.get(strategy)
+            if handler == None:
+                self.logger.critical(f"No flatten handler for {strategy}, its legs stay open")
+                continue
+            self.clock.spawn(handler, reason)
+
+    def strategy_mtm(self):
+        """
+        Returns {strategy : MTM of its open legs}
+        """
+        with self.lock:
+            n = self.count
+            sums = np.bincount(self.strategy_ids[:n], weights=self.leg_mtm[:n], minlength=len(self.strategy_names))
+            return dict(zip(self.strategy_names, sums.tolist()))
+
+    def snapshot(self):
+        """
+        Returns the portfolio risk figures as a dictionary
+        """
+        strategies = self.strategy_mtm()
+        with self.lock:
+            return {
+                "mtm": round(self.mtm, 2),
+                "realized": round(self.realized, 2),
+                "unrealized": round(self.mtm - self.realized, 2),
+                "peak_mtm": round(self.peak_mtm, 2),
+                "max_loss": round(self.max_loss, 2),
+                "margin_at_risk": round(self.margin_at_risk, 2),
+                "open_legs": self.count,
+                "open_lots": int((self.quantities[:self.count]/self.lot_sizes[:self.count]).sum()),
+                "strategies": {k: round(v, 2) for k, v in strategies.items()},
+                "lock_in_armed": self.lock_in_armed,
+                "halted": self.halted
+            }
@@ -0,0 +1,118 @@
+# SYSTEM
+import datetime
+import threading
+import logging
+
+# CUSTOM
+import settings
+
+
+class ScheduledEvent:
+    """
+    Session event of the scheduler, can be cancelled till it fires (for daily events, for all the coming days)
+    """
+    def __init__(self, when, callback, args, time_of_day=None):
+        self.when = when    # Next datetime at which the event fires
+        self.callback = callback
+        self.args = args
+        self.time_of_day = time_of_day  # Set for daily events
+        self.timer = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.timer != None:
+            self.timer.cancel()
+
+
+class SessionScheduler:
+    """
+    Central scheduler of session events (market open, entry and exit times, day rollover). Events are
+    timers of the broker clock, so they fire at the exact timestamp from the single timer thread (or in
+    virtual time under simulation) instead of every strategy polling the time in its own thread.
+    Callbacks run on the timer thread and must not block, long running work should be spawned on the clock.
+    """
+    def __init__(self, clock, logger=None):
+        self.clock = clock
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.events = set() # Events which have not fired yet (daily events till cancelled)
+        self.lock = threading.Lock()    # Guards the events
+
+    def is_trading_day(self, day):
+        return day.weekday() in settings.TRADING_WEEKDAYS
+
+    def next_time(self, time_of_day, after=None):
+        """
+        Returns the first datetime at the time of day on a trading day, at or after the datetime (now by default)
+        """
+        after = after or self.clock.now()
+        day = after.date()
+        while True:
+            when = datetime.datetime.combine(day, time_of_day)
+            if when >= after and self.is_trading_day(day):
+                return when
+            day += datetime.timedelta(days=1)
+
+    def at(self, when, callback, *args):
+        """
+        Calls callback(*args) once at the datetime. Returns the event, which can be cancelled.
+        """
+        event = ScheduledEvent(when, callback, args)
+        self.arm(event)
+        return event
+
+    def daily(self, time_of_day, callback, *args):
+        """
+        Calls callback(*args) at the time of day on every trading day, starting today if the time has
+        not passed yet. Returns the event, which can be cancelled.
+        """
+        event = ScheduledEvent(self.next_time(time_of_day), callback, args, time_of_day)
+        self.arm(event)
+        return event
+
+    def arm(self, event):
+        """
+        Sets the timer of the event for its next datetime
+        """
+        with self.lock:
+            self.events = {x for x in self.events if x.cancelled == False}
+            self.events.add(event)
+            event.timer = self.clock.call_at(event.when, self.fire, event)
+
+    def move_to(self, scheduler):
+        """
+        Hands the pending events over to another scheduler (of the broker of the new day). The event
+        objects are kept, so whoever holds them can still cancel them.
+        """
+        with self.lock:
+            events, self.events = self.events, set()
+        for event in events:
+            if event.cancelled == False:
+                event.timer.cancel()
+                scheduler.arm(event)
+
+    def cancel_all(self):
+        """
+        Cancels every pending event
+        """
+        with self.lock:
+            events, self.events = self.events, set()
+        for event in events:
+            event.cancel()
+
+    def fire(self, event):
+        """
+        Runs the event callback, daily events are set for the next trading day first
+        """
+        if event.cancelled:
+            return
+        if event.time_of_day != None:
+            event.when = self.next_time(event.time_of_day, event.when + datetime.timedelta(microseconds=1))
+            self.arm(event)
+        else:
+            with self.lock:
+                self.events.discard(event)
+        try:
+            event.callback(*event.args)
+        except Exception as e:
+            self.logger.error(f"Error in scheduled event {getattr(event.callback, '__name__', event.callback)} ..", exc_info=True)
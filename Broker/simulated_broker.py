@@ -0,0 +1,262 @@
+# SYSTEM
+import os
+import datetime
+import threading
+import argparse
+from time import time
+
+# DATA
+import numpy as np
+import pandas as pd
+
+# CUSTOM
+import settings
+from Broker.main_broker import Zerodha
+from Broker.instrument_index import InstrumentIndex
+from Broker.instrument_snapshot import InstrumentSnapshot
+from Broker.option_chain import OptionChainIndex
+from Broker.candle_cache import CandleCache, INTERVAL_MINUTES
+from Broker.clock import VirtualClock
+from Broker.order_tracker import completed_handle
+from Broker.tick_recorder import read_tick_file
+
+TICK_COLUMNS = ["exchange_timestamp", "instrument_token", "last_price"]  # Required columns of recorded ticks, volume_traded is optional
+
+
+def load_ticks(path):
+    """
+    Loads recorded ticks (exchange_timestamp, instrument_token, last_price[, volume_traded]) from a csv
+    file or a tick recorder file (.bin), in exchange time order
+    """
+    if path.endswith(".bin"):
+        records = read_tick_file(path)
+        ticks = pd.DataFrame({x: records[x] for x in records.dtype.names})
+        missing = ticks['exchange_timestamp'].isna()   # Not sent in ltp/quote mode
+        ticks.loc[missing, 'exchange_timestamp'] = ticks.loc[missing, 'received_at']
+        return ticks.sort_values('exchange_timestamp', kind='stable').reset_index(drop=True)
+    ticks = pd.read_csv(path, parse_dates=['exchange_timestamp'])
+    if getattr(ticks['exchange_timestamp'].dt, 'tz', None) != None:
+        ticks['exchange_timestamp'] = ticks['exchange_timestamp'].dt.tz_localize(None)
+    return ticks
+
+
+def load_recorded_instruments(instruments):
+    """
+    Returns the instrument master from a DataFrame, an InstrumentSnapshot, a snapshot directory or
+    an instruments csv file
+    """
+    if isinstance(instruments, (pd.DataFrame, InstrumentSnapshot)):
+        return instruments
+    if os.path.isdir(instruments):
+        return InstrumentSnapshot(instruments)
+    return pd.read_csv(instruments)
+
+
+class SimulatedBroker(Zerodha):
+    """
+    Broker with the same surface as Zerodha which replays recorded ticks and candles under a virtual
+    clock instead of connecting to Kite. Orders are filled at the last recorded price of the
+    instrument and kept in memory. The strategies are run unchanged, time moves only as fast as
+    they can consume the replayed ticks.
+    """
+    def __init__(self, instruments, ticks, candles_dir=None, start=None, journal_file=settings.SIMULATION_JOURNAL_FILE):
+        """
+        instruments : instrument master DataFrame, InstrumentSnapshot, snapshot directory or csv file
+        ticks : DataFrame or structured array of recorded ticks (see TICK_COLUMNS), in time order
+        candles_dir : recorded historical candles, same layout as the candle cache
+        start : virtual time to start from, first tick time by default
+        journal_file : trade journal of the replay, kept apart from the live journal
+        """
+        self.tick_times = np.asarray(ticks['exchange_timestamp']).astype('datetime64[us]')
+        self.tick_tokens = np.asarray(ticks['instrument_token'], dtype=np.int64)
+        self.tick_prices = np.asarray(ticks['last_price'], dtype=np.float64)
+        names = ticks.columns if isinstance(ticks, pd.DataFrame) else ticks.dtype.names
+        self.tick_volumes = np.asarray(ticks['volume_traded'], dtype=np.int64) if 'volume_traded' in names else None
+        if start == None:
+            start = self.tick_times[0].astype(datetime.datetime) if self.tick_times.size > 0 else datetime.datetime.now()
+
+        os.makedirs(settings.LOGS_FOLDER, exist_ok=True)
+        self.init_state(VirtualClock(start), journal_file)
+        self.candle_cache = CandleCache(None, candles_dir, self.logger) if candles_dir != None else None   # Read only
+        self.instrument_index = InstrumentIndex(load_recorded_instruments(instruments))
+        self.option_chains = OptionChainIndex(self.instrument_index.source)
+
+        # SIMULATION VARIABLES
+        self.subscribed_tokens = set()  # Tokens whose ticks are replayed, same as the ticker subscription
+        self.orders = []    # Filled orders - [{order_id, status, date_time, tradingsymbol, instrument_token, transaction_type, quantity, price}]
+        self.orders_lock = threading.Lock()
+
+        self.candle_aggregator.start()
+        self.bank_nifty_fut_instrument_token = self.get_bank_nifty_fut_token()
+        self.positions_view.underlying_token = self.bank_nifty_fut_instrument_token
+        self.subscribe_instruments([self.bank_nifty_fut_instrument_token])
+
+    # =================================================================================================================
+    # HISTORICAL DATA
+    def fetch_historical_data_from_kite(self, instrument_token, interval, from_datetime, to_datetime):
+        """
+        There is no Kite connection in simulation, historical data comes from the recorded candles only
+        """
+        return []
+
+    def fetch_historical_data(self, instrument_token, interval="5minute", from_date=None, to_date=None):
+        """
+        Returns the recorded candles of the instrument token (current day by default) which had
+        closed by the virtual time, in the form of list of dictionaries
+        """
+        if self.candle_cache == None:
+            return []
+        now = self.clock.now()
+        from_date = from_date or now.date()
+        to_date = min(to_date or now.date(), now.date())
+        duration = datetime.timedelta(minutes=INTERVAL_MINUTES.get(interval, 24*60))
+
+        candles = []
+        day = from_date
+        while day <= to_date:
+            entry = self.candle_cache.load_day((instrument_token, interval, day))
+            if entry != None:
+                candles.extend(dict(x) for x in entry['bars'] if x['date'] + duration <= now)
+            day += datetime.timedelta(days=1)
+        return candles
+
+    # =================================================================================================================
+    # ORDERS
+    def fetch_orders(self):
+        """
+        Returns all the simulated orders
+        """
+        return list(self.orders)
+
+    def get_recorded_price(self, instrument_token):
+        """
+        Returns the last recorded price of the instrument till the virtual time, whether subscribed
+        or not, None if it has no ticks yet
+        """
+        recorded = np.flatnonzero((self.tick_tokens == instrument_token) & (self.tick_times <= np.datetime64(self.clock.now())))
+        return float(self.tick_prices[recorded[-1]]) if recorded.size > 0 else None
+
+    def fill_order(self, tradingsymbol, transaction_type, quantity, price):
+        """
+        Fills the order at the last recorded price of the instrument (price passed if it has no ticks)
+        and returns the order
+        """
+        instrument_token = self.get_instrument_token(tradingsymbol)
+        fill_price = self.get_recorded_price(instrument_token)
+        with self.orders_lock:
+            order = {
+                "order_id": f"SIMULATED_{len(self.orders) + 1}",
+                "status": "COMPLETE",
+                "date_time": self.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "tradingsymbol": tradingsymbol,
+                "instrument_token": instrument_token,
+                "transaction_type": transaction_type,
+                "quantity": quantity,
+                "price": fill_price if fill_price != None else price
+            }
+            self.orders.append(order)
+        self.logger.info(f"{transaction_type} TRADE TRIGGERED\nOrder ID: {order['order_id']}\nInstrument Token: {instrument_token}\nQuantity: {quantity}\nPrice: {order['price']}")
+        return order
+
+    def place_order(self, tradingsymbol, transaction_type, quantity, max_attempts=None):
+        """
+        Fills market order in simulation. Returns the order handle, already resolved.
+        """
+        return completed_handle(self.fill_order(tradingsymbol, transaction_type, quantity, None))
+
+    def place_paper_order(self, tradingsymbol, transaction_type, quantity, max_attempts=None):
+        """
+        Paper orders are filled the same way, so they show up in the simulated orders
+        """
+        return self.place_order(tradingsymbol, transaction_type, quantity, max_attempts)
+
+    def place_basket(self, legs, paper_trading=False, unwind=True):
+        """
+        Fills the legs one after another in leg order, fills are instant in simulation so there is no
+        skew between legs and the replay stays deterministic
+        """
+        return self.basket_executor.execute(legs, self.place_order, concurrent=False, unwind=unwind)
+
+    # =================================================================================================================
+    # REPLAY
+    def subscribe_instruments(self, instrument_tokens:list):
+        """
+        Subscribe list of instrument_tokens provided
+        """
+        self.logger.info(f"{instrument_tokens} Subscribed")
+        self.subscribed_tokens.update(instrument_tokens)
+
+    def unsubscribe_instruments(self, instrument_tokens:list):
+        """
+        Unsubscribe the list of instrument_tokens provided
+        """
+        self.logger.info(f"{instrument_tokens} unsubscribed")
+        self.subscribed_tokens.difference_update(instrument_tokens)
+
+    def get_tick(self, position):
+        """
+        Returns the recorded tick at the position in the form sent by the Kite ticker
+        """
+        tick = {
+            "instrument_token": int(self.tick_tokens[position]),
+            "last_price": float(self.tick_prices[position]),
+            "exchange_timestamp": self.tick_times[position].astype(datetime.datetime)
+        }
+        if self.tick_volumes is not None:
+            tick['volume_traded'] = int(self.tick_volumes[position])
+        return tick
+
+    def replay(self, *targets, end=None):
+        """
+        Runs targets (strategy run functions) on clock threads and replays every recorded tick to
+        them in time order. Ticks with the same timestamp are sent as one batch, only for the
+        subscribed tokens. The virtual clock then runs till end (market close of the last tick day
+        by default) and is stopped, which ends every strategy still waiting on it.
+        """
+        for target in targets:
+            self.clock.spawn(target)
+        self.clock.settle()
+
+        boundaries = np.flatnonzero(self.tick_times[1:] != self.tick_times[:-1]) + 1
+        starts = np.concatenate(([0], boundaries)) if self.tick_times.size > 0 else []
+        ends = np.concatenate((boundaries, [self.tick_times.size])) if self.tick_times.size > 0 else []
+        for start, stop in zip(starts, ends):
+            self.clock.advance_to(self.tick_times[start].astype(datetime.datetime))
+            ticks = [self.get_tick(x) for x in range(start, stop) if self.tick_tokens[x] in self.subscribed_tokens]
+            if len(ticks) > 0:
+                self.on_ticks(None, ticks)
+            self.clock.settle()
+
+        if end == None:
+            end = datetime.datetime.combine(self.clock.now().date(), settings.MARKET_CLOSE_TIME) + datetime.timedelta(minutes=1)
+        self.clock.advance_to(end)
+        self.candle_aggregator.stop()
+        self.clock.stop()
+        return self.orders
+
+
+if __name__ == "__main__":
+    # python -m Broker.simulated_broker <instruments> <ticks.csv> --candles <dir> --strategy five_ema
+    from Strategy.five_ema import FiveEMA
+    from Strategy.short_straddle import ShortStraddle
+    from Strategy.strategy_runtime import StrategyRuntime
+
+    parser = argparse.ArgumentParser(description="Replay a recorded trading day through the strategies")
+    parser.add_argument("instruments", help="Instruments csv file or snapshot directory")
+    parser.add_argument("ticks", help="Recorded ticks csv file or tick recorder file (.bin)")
+    parser.add_argument("--candles", default=None, help="Recorded historical candles, candle cache layout")
+    parser.add_argument("--strategy", choices=["five_ema", "short_straddle", "all"], default="all")
+    args = parser.parse_args()
+
+    broker = SimulatedBroker(args.instruments, load_ticks(args.ticks), args.candles)
+    runtime = StrategyRuntime(broker)
+    names = []
+    if args.strategy in ["five_ema", "all"]:
+        names.append(runtime.add(FiveEMA(runtime)).name)
+    if args.strategy in ["short_straddle", "all"]:
+        names.append(runtime.add(ShortStraddle(runtime)).name)
+
+    start_time = time()
+    orders = broker.replay(lambda: runtime.run(*names))
+    print(f"Replay of {broker.tick_times.size} ticks completed in {time() - start_time:.2f} sec")
+    print(pd.DataFrame(orders).to_string())
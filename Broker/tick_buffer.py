@@ -0,0 +1,161 @@
+# SYSTEM
+import threading
+from time import sleep
+
+# DATA
+import numpy as np
+
+# CUSTOM
+import settings
+from Broker.clock import SystemClock
+from Broker.tick_recorder import TICK_DTYPE, tick_record
+
+
+class TickRing:
+    """
+    Last ticks (TICK_DTYPE) of one instrument token in a preallocated ring. There is a single writer,
+    the ticker thread. Readers copy under a sequence lock, the sequence is odd while a tick is being
+    written, and retry if it moved during their copy, so the writer is never blocked.
+    """
+    def __init__(self, capacity):
+        self.records = np.zeros(capacity, dtype=TICK_DTYPE)
+        self.capacity = capacity
+        self.count = 0  # Ticks written since the ring was created
+        self.sequence = 0
+
+    def write(self, record):
+        self.sequence += 1
+        self.records[self.count % self.capacity] = record
+        self.count += 1
+        self.sequence += 1
+
+    def read_begin(self):
+        """
+        Returns the sequence once no write is in progress
+        """
+        sequence = self.sequence
+        while sequence % 2 == 1:
+            sleep(0)    # Let the writer finish
+            sequence = self.sequence
+        return sequence
+
+    def latest(self, out):
+        """
+        Copies the latest tick into out[0], returns false if no tick has arrived yet
+        """
+        while True:
+            sequence = self.read_begin()
+            count = self.count
+            if count == 0:
+                return False
+            out[0] = self.records[(count - 1) % self.capacity]
+            if self.sequence == sequence:
+                return True
+
+    def since(self, from_time, out):
+        """
+        Copies the ticks received at or after from_time (np.datetime64) into out, oldest first, and
+        returns their number
+        """
+        while True:
+            sequence = self.read_begin()
+            count = self.count
+            available = min(count, self.capacity)
+
+            # Binary search over the logical positions, oldest first
+            low, high = count - available, count
+            while low < high:
+                middle = (low + high) // 2
+                if self.records['received_at'][middle % self.capacity] < from_time:
+                    low = middle + 1
+                else:
+                    high = middle
+            n = count - low
+
+            start, end = low % self.capacity, low % self.capacity + n
+            if end <= self.capacity:
+                out[:n] = self.records[start:end]
+            else:
+                out[:self.capacity - start] = self.records[start:]
+                out[self.capacity - start:n] = self.records[:end - self.capacity]
+            if self.sequence == sequence:
+                return n
+
+
+class TickStore:
+    """
+    Tick rings of every instrument token received, the latest TICK_BUFFER_SIZE ticks with all
+    their fields. Written by the ticker thread only, read from any thread without locking.
+    """
+    def __init__(self, clock=None, capacity=settings.TICK_BUFFER_SIZE):
+        self.clock = clock if clock != None else SystemClock()
+        self.capacity = capacity
+        self.rings = {} # {instrument_token : TickRing}
+        self.scratch = threading.local()    # Single tick buffer of every reader thread
+
+    def on_ticks(self, ticks):
+        """
+        Writes a batch of ticks as sent by the Kite ticker. Called from the ticker thread.
+        """
+        received_at = np.datetime64(self.clock.now(), 'us')
+        for tick in ticks:
+            ring = self.rings.get(tick['instrument_token'])
+            if ring == None:
+                ring = TickRing(self.capacity)
+                self.rings[tick['instrument_token']] = ring
+            ring.write(tick_record(tick, received_at))
+
+    def get_scratch(self):
+        if not hasattr(self.scratch, 'tick'):
+            self.scratch.tick = np.zeros(1, dtype=TICK_DTYPE)
+        return self.scratch.tick
+
+    def buffer(self):
+        """
+        Returns an array which can hold a full ring, to be reused with last()
+        """
+        return np.zeros(self.capacity, dtype=TICK_DTYPE)
+
+    def latest(self, instrument_token):
+        """
+        Returns the latest tick (TICK_DTYPE record) of the token, None if it has no ticks yet
+        """
+        ring = self.rings.get(instrument_token)
+        out = self.get_scratch()
+        if ring == None or not ring.latest(out):
+            return None
+        return out[0].copy()
+
+    def ltp(self, instrument_token):
+        """
+        Returns the last traded price of the token, None if it has no ticks yet
+        """
+        ring = self.rings.get(instrument_token)
+        out = self.get_scratch()
+        if ring == None or not ring.latest(out):
+            return None
+        return float(out['last_price'][0])
+
+    def ltps(self, instrument_tokens):
+        """
+        Returns the last traded prices of the tokens as an array, NaN for tokens with no ticks yet
+        """
+        out = self.get_scratch()
+        prices = np.full(len(instrument_tokens), np.nan)
+        for position, instrument_token in enumerate(np.asarray(instrument_tokens).tolist()):
+            ring = self.rings.get(instrument_token)
+            if ring != None and ring.latest(out):
+                prices[position] = out['last_price'][0]
+        return prices
+
+    def last(self, instrument_token, seconds, out=None):
+        """
+        Returns the ticks of the token received in the last seconds, oldest first. They are copied
+        into out (see buffer()) and a view of it is returned, a new array if out is not passed.
+        """
+        out = out if out is not None else self.buffer()
+        ring = self.rings.get(instrument_token)
+        if ring == None:
+            return out[:0]
+        from_time = np.datetime64(self.clock.now(), 'us') - np.timedelta64(int(seconds*1000000), 'us')
+        return out[:ring.since(from_time, out)]
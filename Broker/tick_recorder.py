@@ -0,0 +1,185 @@
+# SYSTEM
+import os
+import datetime
+import logging
+import threading
+
+# DATA
+import numpy as np
+
+# CUSTOM
+import settings
+from Broker.clock import SystemClock
+
+# Fixed width record of one tick, 64 bytes
+TICK_DTYPE = np.dtype([
+    ("received_at", "<M8[us]"),         # Clock time the tick batch arrived, records are in this order
+    ("exchange_timestamp", "<M8[us]"),  # NaT if not sent (ltp/quote mode)
+    ("instrument_token", "<i8"),
+    ("last_price", "<f8"),
+    ("volume_traded", "<i8"),
+    ("oi", "<i8"),
+    ("bid", "<f8"),                     # Best bid/ask from the market depth, NaN if not sent
+    ("ask", "<f8"),
+])
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("record_size", "<i8"), ("count", "<i8")])
+HEADER_SIZE = 64
+MAGIC = b"TICKS001"
+
+
+def get_tick_file(directory, day):
+    return os.path.join(directory, f"ticks_{day.strftime('%Y%m%d')}.bin")
+
+
+def read_tick_file(path):
+    """
+    Returns all the records of a tick file as a read only structured array (TICK_DTYPE) mapped over
+    the file, nothing is copied. Records appended after the call are not included.
+    """
+    header = np.memmap(path, dtype=HEADER_DTYPE, mode='r', shape=(1,))
+    if header['magic'][0] != MAGIC or header['record_size'][0] != TICK_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a tick file of this version")
+    count = int(header['count'][0])
+    if count == 0:
+        return np.empty(0, dtype=TICK_DTYPE)
+    return np.memmap(path, dtype=TICK_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def read_ticks(from_datetime, to_datetime, directory=settings.TICK_DATA_DIR):
+    """
+    Returns the ticks received in [from_datetime, to_datetime) as a structured array (TICK_DTYPE).
+    Within one day it is a view over the mapped file, ranges spanning days are concatenated.
+    Filter tokens with records[np.isin(records['instrument_token'], tokens)].
+    """
+    days = []
+    day = from_datetime.date()
+    while day <= to_datetime.date():
+        path = get_tick_file(directory, day)
+        if os.path.isfile(path):
+            records = read_tick_file(path)
+            start, end = np.searchsorted(records['received_at'], [np.datetime64(from_datetime, 'us'), np.datetime64(to_datetime, 'us')])
+            days.append(records[start:end])
+        day += datetime.timedelta(days=1)
+
+    if len(days) == 0:
+        return np.empty(0, dtype=TICK_DTYPE)
+    return days[0] if len(days) == 1 else np.concatenate(days)
+
+
+def best_price(tick, side):
+    """
+    Returns the best price of the side ("buy"/"sell") of the market depth, NaN if not available
+    """
+    levels = (tick.get('depth') or {}).get(side) or []
+    if len(levels) == 0 or levels[0].get('price', 0) == 0:
+        return np.nan
+    return levels[0]['price']
+
+
+def tick_record(tick, received_at):
+    """
+    Returns the tick sent by the Kite ticker as a TICK_DTYPE record (tuple)
+    """
+    return (
+        received_at, tick.get('exchange_timestamp'), tick['instrument_token'], tick['last_price'],
+        tick.get('volume_traded', 0), tick.get('oi', 0), best_price(tick, 'buy'), best_price(tick, 'sell')
+    )
+
+
+class TickRecorder:
+    """
+    Appends every tick received to a per day file of fixed width records (TICK_DTYPE) through a
+    memory map. The file grows by TICK_RECORDER_GROW_RECORDS at a time and the record count in its
+    header is updated after every batch, so the file can be read while it is being written. One
+    recorder is kept per process and handed over to the broker of the next day, as two recorders
+    appending to the same file would overwrite each other.
+    """
+    def __init__(self, directory, logger=None, clock=None):
+        self.directory = directory
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.clock = clock if clock != None else SystemClock()
+        self.day = None
+        self.header = None
+        self.records = None
+        self.count = 0
+        self.capacity = 0
+        self.lock = threading.Lock()    # Tickers of the old and new broker both record while the broker is replaced
+        os.makedirs(self.directory, exist_ok=True)
+
+    def open_day(self, day):
+        """
+        Maps the file of the day, records of an existing file are appended to
+        """
+        self.close_day()
+        path = get_tick_file(self.directory, day)
+        if not os.path.isfile(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, "wb") as file:
+                file.truncate(HEADER_SIZE)
+            self.header = np.memmap(path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+            self.header['magic'] = MAGIC
+            self.header['record_size'] = TICK_DTYPE.itemsize
+            self.header['count'] = 0
+        else:
+            self.header = np.memmap(path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+        self.day = day
+        self.path = path
+        self.count = int(self.header['count'][0])
+        self.map_records((os.path.getsize(path) - HEADER_SIZE) // TICK_DTYPE.itemsize)
+
+    def map_records(self, capacity):
+        """
+        Grows the file to hold capacity records and maps them
+        """
+        if self.records is not None:
+            self.records.flush()
+            self.records = None
+        capacity = max(capacity, self.count)
+        if capacity == self.count:
+            capacity += settings.TICK_RECORDER_GROW_RECORDS
+        with open(self.path, "r+b") as file:
+            file.truncate(HEADER_SIZE + capacity*TICK_DTYPE.itemsize)
+        self.records = np.memmap(self.path, dtype=TICK_DTYPE, mode='r+', offset=HEADER_SIZE, shape=(capacity,))
+        self.capacity = capacity
+
+    def record(self, ticks):
+        """
+        Appends a batch of ticks as sent by the Kite ticker. Called from the ticker thread.
+        """
+        try:
+            with self.lock:
+                received_at = self.clock.now()
+                if self.day != received_at.date():
+                    self.open_day(received_at.date())
+                n = len(ticks)
+                if self.count + n > self.capacity:
+                    self.map_records(self.count + n + settings.TICK_RECORDER_GROW_RECORDS)
+
+                received_at = np.datetime64(received_at, 'us')
+                self.records[self.count:self.count + n] = [tick_record(x, received_at) for x in ticks]
+                self.count += n
+                self.header['count'] = self.count   # Published after the records are written
+        except Exception as e:
+            self.logger.error("Error in recording ticks ..", exc_info=True)
+
+    def close(self):
+        """
+        Flushes the file of the current day and trims it to the records written. Called by the last
+        owner only, on shutdown.
+        """
+        with self.lock:
+            self.close_day()
+
+    def close_day(self):
+        """
+        Flushes the file of the current day and trims it to the records written
+        """
+        if self.records is None:
+            return
+        self.records.flush()
+        self.header.flush()
+        self.records = None
+        self.header = None
+        with open(self.path, "r+b") as file:
+            file.truncate(HEADER_SIZE + self.count*TICK_DTYPE.itemsize)
+        self.day = None
+        self.capacity = 0
@@ -0,0 +1,184 @@
+# SYSTEM
+import os
+import queue
+import sqlite3
+import threading
+import logging
+from time import time
+
+# CUSTOM
+import settings
+
+# Columns of a fill, every other column of the table is optional
+FILL_COLUMNS = [
+    "date_time", "strategy", "order_id", "basket_id", "leg", "tradingsymbol", "instrument_token",
+    "transaction_type", "quantity", "price", "underlying_price", "target", "stoploss", "trailing_sl",
+    "paper_trade", "reason"
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date_time TEXT NOT NULL,            -- Clock time of the fill, %Y-%m-%d %H:%M:%S
+    strategy TEXT NOT NULL,
+    order_id TEXT,                      -- PAPER_TRADE for paper orders
+    basket_id TEXT,                     -- Groups the legs of a multi-leg order
+    leg INTEGER,                        -- Position of the leg in its basket
+    tradingsymbol TEXT NOT NULL,
+    instrument_token INTEGER,
+    transaction_type TEXT NOT NULL,     -- BUY / SELL
+    quantity INTEGER NOT NULL,
+    price REAL,                         -- Fill price, LTP at the fill for paper orders
+    underlying_price REAL,              -- BankNifty FUT price at the fill
+    target REAL,
+    stoploss REAL,
+    trailing_sl REAL,
+    paper_trade INTEGER NOT NULL,
+    reason TEXT                         -- Why a position was closed
+);
+CREATE INDEX IF NOT EXISTS fills_date_time ON fills (date_time);
+CREATE INDEX IF NOT EXISTS fills_strategy ON fills (strategy, date_time);
+CREATE INDEX IF NOT EXISTS fills_order_id ON fills (order_id);
+CREATE INDEX IF NOT EXISTS fills_tradingsymbol ON fills (tradingsymbol, date_time);
+"""
+
+
+class TradeJournal:
+    """
+    Journal of every fill of the strategies in an SQLite store (WAL mode). Fills are queued by the
+    trading threads and written by a background thread in batches, a fill is on disk at most
+    TRADE_JOURNAL_FLUSH_INTERVAL after it is recorded. Order placement never waits on the disk.
+    """
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.queue = queue.Queue()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = self.connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+        self.thread = threading.Thread(target=self.run, name="TradeJournal", daemon=True)
+        self.thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=settings.TRADE_JOURNAL_BUSY_TIMEOUT)
+        connection.execute("PRAGMA synchronous=NORMAL")  # Durable across crashes of the process in WAL mode
+        return connection
+
+    def record(self, **fill):
+        """
+        Queues a fill (FILL_COLUMNS, date_time, strategy, tradingsymbol, transaction_type, quantity
+        and paper_trade are required) to be written. Returns immediately.
+        """
+        unknown = set(fill) - set(FILL_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown trade journal columns {unknown}")
+        self.queue.put(fill)
+
+    def run(self):
+        """
+        Writes the queued fills, waiting at most the flush interval to batch them
+        """
+        connection = self.connect()
+        while True:
+            batch = [self.queue.get()]
+            deadline = time() + settings.TRADE_JOURNAL_FLUSH_INTERVAL
+            while len(batch) < settings.TRADE_JOURNAL_BATCH_SIZE:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.write(connection, batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def write(self, connection, batch):
+        """
+        Inserts the batch of fills in one transaction
+        """
+        rows = [tuple(fill.get(x) for x in FILL_COLUMNS) for fill in batch]
+        try:
+            with connection:
+                connection.executemany(f"INSERT INTO fills ({', '.join(FILL_COLUMNS)}) VALUES ({', '.join('?'*len(FILL_COLUMNS))})", rows)
+        except Exception as e:
+            self.logger.critical(f"Error writing fills to the trade journal, fills lost : {batch}", exc_info=True)
+
+    def flush(self):
+        """
+        Blocks till every fill recorded so far is written
+        """
+        self.queue.join()
+
+    def filter_clause(self, from_date=None, to_date=None, strategy=None, tradingsymbol=None, paper_trade=None, before_id=None):
+        """
+        Returns the WHERE clause and its parameters for the fill filters
+        """
+        conditions, params = [], []
+        if from_date != None:
+            conditions.append("date_time >= ?")
+            params.append(from_date.strftime("%Y-%m-%d"))
+        if to_date != None:
+            conditions.append("date_time < date(?, '+1 day')")
+            params.append(to_date.strftime("%Y-%m-%d"))
+        if strategy != None:
+            conditions.append("strategy = ?")
+            params.append(strategy)
+        if tradingsymbol != None:
+            conditions.append("tradingsymbol = ?")
+            params.append(tradingsymbol)
+        if paper_trade != None:
+            conditions.append("paper_trade = ?")
+            params.append(int(paper_trade))
+        if before_id != None:   # Fills before the cursor fill in (date_time, id) order
+            conditions.append("(date_time, id) < (SELECT date_time, id FROM fills WHERE id = ?)")
+            params.append(before_id)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def get_fills(self, from_date=None, to_date=None, strategy=None):
+        """
+        Returns the fills between the dates (inclusive, all by default) of the strategy (all by
+        default) in the order they were recorded, in the form of list of dictionaries
+        """
+        where, params = self.filter_clause(from_date, to_date, strategy)
+        connection = self.connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            return [dict(x) for x in connection.execute(f"SELECT * FROM fills {where} ORDER BY id", params)]
+        finally:
+            connection.close()
+
+    def iter_fills(self, limit, from_date=None, to_date=None, strategy=None, tradingsymbol=None, paper_trade=None, before_id=None):
+        """
+        Yields up to limit fills matching the filters as dictionaries, newest first. Pages are walked by
+        passing the id of the last fill yielded as before_id. Every filter has an index in (date_time, id)
+        order, so a page is an index seek and its cost does not grow with the history. Rows are read from
+        the database as they are yielded.
+        """
+        where, params = self.filter_clause(from_date, to_date, strategy, tradingsymbol, paper_trade, before_id)
+        connection = self.connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            for row in connection.execute(f"SELECT * FROM fills {where} ORDER BY date_time DESC, id DESC LIMIT ?", params + [limit]):
+                yield dict(row)
+        finally:
+            connection.close()
+
+
+journals = {}   # {path : TradeJournal} one writer thread per journal file for all the broker instances
+journals_lock = threading.Lock()
+
+
+def get_journal(path=settings.TRADE_JOURNAL_FILE, logger=None):
+    """
+    Returns the trade journal of the file, opening it on first use
+    """
+    with journals_lock:
+        if path not in journals:
+            journals[path] = TradeJournal(path, logger)
+        return journals[path]
@@ -0,0 +1,144 @@
+# SYSTEM
+import os
+import logging
+
+# CUSTOM
+import settings
+
+
+class StrategyLogger(logging.LoggerAdapter):
+    """
+    Logger of a strategy instance, messages are prefixed with the instance name so that all the
+    instances of a strategy share its logger and log file
+    """
+    def process(self, msg, kwargs):
+        return f"[{self.extra['name']}] {msg}", kwargs
+
+
+def get_strategy_logger(logger_name, file_name):
+    """
+    Creates a logger with stream and file handlers once, and returns it
+    """
+    logger = logging.getLogger(logger_name)
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.DEBUG)
+    c_handler = logging.StreamHandler()
+    f_handler = logging.FileHandler(os.path.join(settings.LOGS_FOLDER, file_name))
+    c_handler.setLevel(logging.DEBUG)
+    f_handler.setLevel(logging.DEBUG)
+    c_format = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
+    f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    c_handler.setFormatter(c_format)
+    f_handler.setFormatter(f_format)
+    logger.addHandler(c_handler)
+    logger.addHandler(f_handler)
+    logger.info("Logger initialized")
+    return logger
+
+
+class BaseStrategy:
+    """
+    Interface of the strategies hosted by the StrategyRuntime. Every callback of every instance runs
+    on the single runtime loop, one at a time, so a strategy keeps plain state without locks but must
+    never block : orders come back as on_order_update, timers as on_session_event and blocking broker
+    calls are made with run_blocking. An instance costs its state and subscriptions only, no threads.
+    """
+    LOGGER_NAME = 'Strategy Logger'
+    LOG_FILE = "Strategy.log"
+
+    def __init__(self, runtime, name, params=None):
+        self.runtime = runtime
+        self.name = name    # Unique, the strategy of the positions, fills and risk of the instance
+        self.params = params or {}
+        self.active = False # Set by the runtime between on_start and on_stop
+        self.session_events = []    # Scheduled events cancelled when the instance is stopped
+        self.logger = StrategyLogger(get_strategy_logger(self.LOGGER_NAME, self.LOG_FILE), {"name": name})
+
+    @property
+    def broker(self):
+        return self.runtime.broker  # Broker of the day, replaced by the runtime at day start
+
+    # =================================================================================================================
+    # CALLBACKS
+    def on_start(self):
+        """
+        Called when the instance is started
+        """
+
+    def on_stop(self):
+        """
+        Called when the instance is stopped, after which its session events are cancelled. Tick and
+        bar subscriptions are kept, so open positions can still be managed.
+        """
+
+    def on_session_event(self, event):
+        """
+        Called when an event scheduled with schedule_daily or schedule_at fires
+        """
+
+    def on_bar(self, instrument_token, timeframe, bar):
+        """
+        Called when a bar of a subscribed series closes
+        """
+
+    def on_tick(self, tick):
+        """
+        Called on every tick of a subscribed instrument token
+        """
+
+    def on_order_update(self, tag, result, error):
+        """
+        Called once an order or basket placed with the tag is final : result is the order (orders of
+        the legs for a basket), error the exception if it failed
+        """
+
+    def on_flatten(self, reason):
+        """
+        Called on a portfolio breach of the risk engine, every open position of the instance must be exited
+        """
+
+    # =================================================================================================================
+    # RUNTIME SERVICES
+    def subscribe_ticks(self, instrument_token):
+        self.runtime.subscribe_ticks(self, instrument_token)
+
+    def unsubscribe_ticks(self, instrument_token):
+        self.runtime.unsubscribe_ticks(self, instrument_token)
+
+    def subscribe_bars(self, instrument_token, timeframe):
+        self.runtime.subscribe_bars(self, instrument_token, timeframe)
+
+    def unsubscribe_bars(self, instrument_token, timeframe):
+        self.runtime.unsubscribe_bars(self, instrument_token, timeframe)
+
+    def schedule_daily(self, time_of_day, event):
+        """
+        Fires on_session_event(event) at the time of day on every trading day till the instance is stopped
+        """
+        self.session_events.append(self.runtime.schedule_daily(self, time_of_day, event))
+
+    def schedule_at(self, when, event, persistent=False):
+        """
+        Fires on_session_event(event) once at the datetime. Returns the scheduled event, which is
+        cancelled when the instance is stopped unless persistent (e.g. exit of an open position).
+        """
+        scheduled = self.runtime.schedule_at(self, when, event)
+        if persistent == False:
+            self.session_events.append(scheduled)
+        return scheduled
+
+    def place_order(self, tag, tradingsymbol, transaction_type, quantity, paper_trading=False):
+        self.runtime.place_order(self, tag, tradingsymbol, transaction_type, quantity, paper_trading)
+
+    def place_basket(self, tag, legs, paper_trading=False, unwind=True):
+        self.runtime.place_basket(self, tag, legs, paper_trading, unwind)
+
+    def run_blocking(self, then, function, *args, **kwargs):
+        """
+        Runs function(*args, **kwargs) off the loop and calls then(result, error) on the loop with its outcome
+        """
+        self.runtime.run_blocking(then, function, *args, **kwargs)
+
+    def publish_event(self, state, **details):
+        self.broker.publish_event(self.name, state, **details)
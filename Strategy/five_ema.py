@@ -1,185 +1,411 @@
 # SYSTEM
-import logging
-import os
 import datetime
-import threading
-from time import sleep
 
 #DATA
-import pandas_ta as ta
 import json
 
-# CUSTOM 
-from Broker.main_broker import Zerodha
+# CUSTOM
+from Strategy.base_strategy import BaseStrategy
 import settings
 
 
-class FiveEMA:
-    def __init__(self, broker:Zerodha):
-        self.__broker = broker
-        if self.__broker == None:
-            exit(1)
-        self.logger = self.get_logger()
+class FiveEMA(BaseStrategy):
+    """
+    5EMA on the candles of the underlying FUT. A candle entirely above the EMA is the trigger candle,
+    a later close below its low buys the ATM PE. The trade is exited on target, stoploss (trailed
+    forward) or market close, checked on every tick of the FUT. The PE is subscribed on the ticker
+    while it is held, for its fill price and MTM.
+    """
+    LOGGER_NAME = 'FiveEMA Logger'
+    LOG_FILE = "FiveEMA.log"
+
+    def __init__(self, runtime, name="FIVE EMA", params=None):
+        super().__init__(runtime, name, params)
+        self.underlying = self.params.get("underlying", "BANKNIFTY")
+        self.timeframe = self.params.get("timeframe", 5)    # Candle timeframe in minutes
+        self.ema_length = self.params.get("ema_length", 5)
+        self.session_start = self.params.get("session_start", datetime.time(9, 16, 0, 0))
+        self.session_end = self.params.get("session_end", datetime.time(14, 30, 0, 0))
 
-        self.month_mapping = {1:"JAN", 2:"FEB", 3:"MAR", 4:"APR", 5:"MAY", 6:"JUN", 7:"JUL", 8:"AUG", 9:"SEP", 10:"OCT", 11:"NOV", 12:"DEC"}
         self.last_fetched_record_time = None
-        self.strategy_active_flag = False
+        self.token = None   # Instrument token of the underlying FUT
+        self.bars_subscribed = False
+        self.ema = None
 
         self.trade_region = False
         self.trigger_candle = None
+        self.last_candle = None
+        self.action_properties = {}
+
+        # TRADE
+        self.in_trade = False   # Set from the entry order till the exit order is placed
+        self.trade = None   # Trade that needs to be closed with SL or target - {date_time, order_id, instrument_token, tradingsymbol, quantity, target, stoploss, trailingSL, price, paper_trade}
+        self.entry = None   # Entry order being placed
+        self.unpriced_fill = None   # Entry order filled without a price (paper trade), the leg is opened on the next PE tick
+        self.exit = None    # {price, reason} of the exit order being placed
+        self.exiting = False    # Set once exit of the trade has been triggered
+        self.exit_attempts = 0  # Sell orders of the trade that failed, the next one is placed after a backoff
+        self.market_close_event = None  # Exits the trade at market closure
 
+    def get_atm_pe(self, price):
+        """
+        Returns selected ATM PE for the price passed, -1 in case of failure. The strike is picked from
+        the option chain of the FUT expiry.
+        """
+        expiry = self.broker.get_expiry(self.token)
+        chain = self.broker.get_option_chain(self.underlying, expiry)
+        if chain == None:
+            return -1
+
+        atm = chain.nearest(price)
+        if atm.pe_token == -1:
+            self.logger.error(f"No PE listed for strike {atm.strike}")
+            return -1
+        return atm.pe_symbol
+
+    # =================================================================================================================
+    # SESSION
+    def on_start(self):
+        """
+        Candles are processed as they close from the session start (of the next trading day if the
+        session is over) till the session end, unless explicitely stopped
+        """
+        self.logger.info("5EMA strategy started...")
         try:
             with open(settings.ACTION_PROPERTIES_FILE) as file:
                 self.action_properties = json.load(file)
             self.logger.info("Action properties successfully loaded")
         except Exception as e:
             self.logger.critical("Action properties file cannot be found. Application exiting.\n")
-    
-    def get_logger(self):
-        """
-        Creates a logger with stream and file handlers, and returns it. 
-        """
-        logger = logging.getLogger('FiveEMA Logger')
-        logger.setLevel(logging.DEBUG)
-        c_handler = logging.StreamHandler()
-        f_handler = logging.FileHandler(os.path.join(settings.LOGS_FOLDER, "FiveEMA.log"))
-        c_handler.setLevel(logging.DEBUG)
-        f_handler.setLevel(logging.DEBUG)
-        c_format = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
-        f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        c_handler.setFormatter(c_format)
-        f_handler.setFormatter(f_format)
-        logger.addHandler(c_handler)
-        logger.addHandler(f_handler)
-        logger.info("Logger initialized")
-        return logger
-
-    def get_ema(self, market_data):
-        """
-        Returns EMA field in the dataframe provided
-        """
-        no_of_records_fetched = market_data.shape[0]
-        no_of_records_fetched = min(no_of_records_fetched, 5)
-        market_data['EMA'] = ta.ema(market_data['close'], length=no_of_records_fetched)
 
-    def get_atm_pe(self, price):
+        scheduler = self.broker.scheduler
+        now = self.broker.clock.now()
+        start = scheduler.next_time(self.session_start, now)
+        end = scheduler.next_time(self.session_end, now)
+        if end < start: # Session already in progress
+            start = now
+        else:
+            end = scheduler.next_time(self.session_end, start)
+        self.logger.info("Waiting for market to start ...")
+        self.schedule_at(start, "SESSION START")
+        self.schedule_at(end, "SESSION END")
+
+    def on_stop(self):
         """
-        Returns selected BankNifty ATM PE for the price passed
+        Stops processing candles, a running trade is still managed till it is exited
         """
-        if price%100 >= 50:
-            price = ((price//100)+1)*100
-        else:
-            price = (price//100)*100
+        if self.bars_subscribed == True:
+            self.unsubscribe_bars(self.token, self.timeframe)
+            self.bars_subscribed = False
+        self.logger.info("5EMA strategy stopped")
 
-        bnf_fut = self.__broker.get_trading_symbol(self.__broker.bank_nifty_fut_instrument_token)[:-3]
-        tradingsymbol = f"{bnf_fut}{int(price)}PE"
-        return tradingsymbol
+    def on_session_event(self, event):
+        if event == "SESSION START":
+            self.on_session_start()
+        elif event == "SESSION END":
+            self.runtime.stop(self.name)
+            self.logger.info("Five EMA strategy stopped till next day. Market Closing.")
+        elif event == "MARKET CLOSE":
+            self.exit_trade(self.broker.get_ltp(self.token), "MARKET CLOSE")
+        elif event == "RETRY EXIT" and self.trade != None:
+            trade = self.trade
+            self.place_order("EXIT", trade['tradingsymbol'], "SELL", trade['quantity'], trade['paper_trade'])
 
-    def get_positions(self):
+    def on_session_start(self):
         """
-        Returns the current positions
+        Subscribes the FUT candles, from here on every closed candle is processed. The EMA is warmed
+        (historical fetch) off the loop.
         """
-        return self.__broker.get_positions()
+        if self.active == False:
+            return
+        self.logger.info("Market in progress ...")
+        self.token = self.broker.get_fut_token(self.underlying)
+        self.run_blocking(self.on_ema_ready, self.broker.get_indicator, self.token, self.timeframe, "EMA", length=self.ema_length)
 
-    def update_broker_instance(self, broker):
+    def on_ema_ready(self, ema, error):
         """
-        Updates new broker instance
+        Subscribes the candles once the EMA is subscribed, so it is updated before a bar reaches the strategy
         """
-        self.__broker = broker
+        if error != None or self.active == False:
+            return
+        self.ema = ema
+        self.subscribe_bars(self.token, self.timeframe) # Candles are built from the live ticks
+        self.bars_subscribed = True
 
-    def run_5ema(self):
+    def on_bar(self, instrument_token, timeframe, bar):
         """
-        Run 5EMA strategy unless explicitely stopped
-        """    
-        self.logger.info("5EMA strategy started...")
-        self.strategy_active_flag = True
+        Called when a new candle closes
+        """
+        if self.active == False:
+            return
+        self.process_candle(bar)
+
+    # =================================================================================================================
+    # TRADE
+    def enter_trade(self, order):
+        """
+        Places the buy order and starts tracking the trade on the ticks of the FUT
+        """
+        self.entry = order
+        self.exiting = False
+        self.broker.subscribe_instruments([order['instrument_token']])  # PE ticks, for its fill price and MTM
+        self.place_order("ENTRY", order['tradingsymbol'], "BUY", order['quantity'], order['paper_trading'])
+        self.subscribe_ticks(self.token)
+        market_close = datetime.datetime.combine(self.broker.clock.now().date(), settings.MARKET_CLOSE_TIME)
+        self.market_close_event = self.schedule_at(market_close, "MARKET CLOSE", persistent=True)
+
+    def on_order_update(self, tag, order, error):
+        if tag == "ENTRY":
+            self.on_entry_complete(order, error)
+        elif tag == "EXIT":
+            self.on_exit_complete(order, error)
+
+    def on_entry_complete(self, order, error):
+        """
+        Makes the executed buy order the trade, journalled once its fill price is known
+        """
+        entry, self.entry = self.entry, None
+        if error != None:
+            self.logger.critical(f"Buy order failed, no trade taken\n{error}")
+            self.in_trade = False
+            self.stop_tracking()
+            self.release_option(entry['instrument_token'])
+            return
+        broker = self.broker
+        instrument_token = entry['instrument_token']
+        self.logger.info(f"BUY TRADE TRIGGERED\nOrder ID: {order['order_id']}\nInstrument Token: {instrument_token}\nQuantity: {entry['quantity']}\nTarget: {entry['target']}\nStoploss: {entry['stoploss']}\nTrailingSL: {entry['trailingSL']}\nPrice: {entry['price']}")
+
+        self.trade = {
+            "date_time": broker.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "order_id": order['order_id'],
+            "instrument_token": instrument_token,
+            "tradingsymbol": entry['tradingsymbol'],
+            "quantity": entry['quantity'],
+            "target": entry['target'],
+            "stoploss": entry['stoploss'],
+            "trailingSL": entry['trailingSL'],
+            "price": entry['price'],
+            "underlying_price": entry['price'],
+            "paper_trade": entry['paper_trading'],
+            "priced": False # Set once the fill is journalled and the leg opened
+            }
+
+        fill_price = order.get('average_price') or order.get('price')    # Paper fills carry no price
+        if not fill_price:  # The LTP may be stale from an earlier trade, the next PE tick prices the fill
+            self.logger.info("Paper fill, waiting for the next PE tick for its price ..")
+            self.unpriced_fill = order
+            self.subscribe_ticks(instrument_token)
+            return
+        self.open_trade_leg(order, fill_price)
+
+    def open_trade_leg(self, order, fill_price):
+        """
+        Journals the buy fill and adds the bought PE to the positions and the risk engine at its fill price
+        """
+        trade = self.trade
+        trade['priced'] = True
+        self.broker.journal.record(
+            date_time=trade['date_time'], strategy=self.name, order_id=order['order_id'],
+            tradingsymbol=trade['tradingsymbol'], instrument_token=trade['instrument_token'], transaction_type="BUY", quantity=trade['quantity'],
+            price=fill_price, underlying_price=trade['underlying_price'],
+            target=trade['target'], stoploss=trade['stoploss'], trailing_sl=trade['trailingSL'], paper_trade=trade['paper_trade']
+        )
+        self.broker.open_leg(self.name, trade['instrument_token'], trade['tradingsymbol'], order['order_id'], "BUY", trade['quantity'], fill_price, trade['date_time'])
+
+    def on_option_tick(self, tick):
+        """
+        Prices a paper fill at the first PE tick after it
+        """
+        order, self.unpriced_fill = self.unpriced_fill, None
+        self.unsubscribe_ticks(tick['instrument_token'])
+        if order != None and self.exiting == False:
+            self.open_trade_leg(order, tick['last_price'])
+
+    def release_option(self, instrument_token):
+        """
+        Unsubscribes the PE from the ticker once no strategy holds it
+        """
+        if instrument_token not in self.broker.positions_view.tokens:
+            self.broker.unsubscribe_instruments([instrument_token])
 
-        while True:
-            self.logger.info("Waiting for market to start ...")
-            while datetime.datetime.now().time() <= datetime.time(9, 16, 0, 0) or datetime.datetime.now().time() >= datetime.time(14, 30, 0, 0):
-                sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-                if self.strategy_active_flag == False:
+    def on_tick(self, tick):
+        """
+        Checks target, stoploss and trailing stoploss of the trade on every FUT tick
+        """
+        trade = self.trade
+        if trade != None and tick['instrument_token'] == trade['instrument_token'] and self.unpriced_fill != None:
+            self.on_option_tick(tick)
+            return
+        if trade == None or self.exiting == True or tick['instrument_token'] != self.token:
+            return
+        ltp = tick['last_price']
+
+        if ltp > trade['target']:   # Target achieved
+            self.exit_trade(ltp, "TARGET")
+        elif ltp <= trade['price'] - trade['stoploss']: # Stoploss triggered
+            self.exit_trade(ltp, "STOPLOSS")
+        elif ltp > trade['price'] + trade['trailingSL']: # Move stoploss forward
+            self.logger.info("Moved Stoploss forward")
+            trade['price'] += trade['trailingSL']
+
+    def on_flatten(self, reason):
+        """
+        Exits the trade on a portfolio breach of the risk engine
+        """
+        self.exit_trade(self.broker.get_ltp(self.token), reason)
+
+    def stop_tracking(self):
+        self.unsubscribe_ticks(self.token)
+        if self.market_close_event != None:
+            self.market_close_event.cancel()
+            self.market_close_event = None
+
+    def exit_trade(self, ltp, reason):
+        """
+        Stops tracking the trade and places the sell order at the given price. Only the first call
+        has any effect.
+        """
+        trade = self.trade
+        if trade == None or self.exiting == True:
+            return
+        self.exiting = True
+        self.stop_tracking()
+        if self.unpriced_fill != None:  # Exited before the entry was priced, the leg was never opened
+            self.unpriced_fill = None
+            self.unsubscribe_ticks(trade['instrument_token'])
+
+        self.in_trade = False
+        self.exit = {"price": ltp, "reason": reason}
+        self.exit_attempts = 0
+        self.place_order("EXIT", trade['tradingsymbol'], "SELL", trade['quantity'], trade['paper_trade'])
+        if reason == "TARGET":
+            self.logger.info(f"Target achieved for order_id: {trade['order_id']}\nTrading symbol: {trade['tradingsymbol']}\nQuanity: {trade['quantity']}\nPrice: {ltp}")
+        elif reason == "STOPLOSS":
+            self.logger.info(f"Stoploss triggered for order_id: {trade['order_id']}\nTrading symbol: {trade['tradingsymbol']}\nQuanity: {trade['quantity']}\nPrice: {ltp}")
+        elif reason == "MARKET CLOSE":
+            self.logger.info("Exiting position due to market closure")
+        else:
+            self.logger.info(f"Exiting position, {reason}")
+
+    def on_exit_complete(self, order, error):
+        """
+        Journals the executed sell order and clears the trade
+        """
+        if error != None:
+            self.retry_exit(error)
+            return
+        broker = self.broker
+        trade, exit = self.trade, self.exit
+        self.logger.info(f"SELL TRADE TRIGGERED\nOrder ID: {order['order_id']}\nInstrument Token: {trade['instrument_token']}\nQuantity: {trade['quantity']}\nPrice: {exit['price']}")
+
+        fill_price = broker.get_fill_price(order, trade['instrument_token'])
+        if trade['priced'] == False:    # Exited before the first PE tick, neither fill has a price
+            self.logger.error("Trade exited before the PE had a price, fills not journalled")
+        elif fill_price == None:
+            self.logger.error("PE price not available, sell fill not journalled")
+        else:
+            broker.journal.record(
+                date_time=broker.clock.now().strftime("%Y-%m-%d %H:%M:%S"), strategy=self.name, order_id=order['order_id'],
+                tradingsymbol=trade['tradingsymbol'], instrument_token=trade['instrument_token'], transaction_type="SELL", quantity=trade['quantity'],
+                price=fill_price, underlying_price=exit['price'], paper_trade=trade['paper_trade'], reason=exit['reason']
+            )
+        broker.close_leg(self.name, trade['instrument_token'], fill_price)
+        self.release_option(trade['instrument_token'])
+        self.trade, self.exit = None, None
+
+    def retry_exit(self, error):
+        """
+        The position is still open after a failed sell order, it is sold again after a backoff
+        (doubled on every failure) till the order goes through
+        """
+        trade = self.trade
+        delay = min(settings.EXIT_RETRY_INTERVAL * 2**self.exit_attempts, settings.EXIT_RETRY_MAX_INTERVAL)
+        self.exit_attempts += 1
+        self.logger.critical(f"Sell order failed, position is still open. Selling again in {delay} sec\n{error}")
+        self.publish_event("EXIT FAILED", tradingsymbol=trade['tradingsymbol'], reason=self.exit['reason'], attempts=self.exit_attempts, retry_in=delay)
+        self.schedule_at(self.broker.clock.now() + datetime.timedelta(seconds=delay), "RETRY EXIT", persistent=True)
+
+    # =================================================================================================================
+    # STRATEGY
+    def process_candle(self, new_bar):
+        """
+        Runs the strategy on a closed candle
+        """
+        latest_record_time = new_bar['date']
+        self.last_fetched_record_time = latest_record_time
+        self.logger.info(f"TIME : {self.broker.clock.now()}\nNew Candle Closed\n Candle TimeStamp : {latest_record_time}")
+
+        new_candle = dict(new_bar)
+        new_candle['EMA'] = self.ema.value
+        if new_candle['EMA'] == None:   # Less than 5 candles seen yet
+            self.logger.info("EMA warming up, waiting for next candle ..")
+            return
+
+        # STRATEGY
+        # ===========================================================
+        if self.trade_region == False:  # If I am currently out of the trade region
+            if self.in_trade == True:   # Trade is already running
+                self.last_candle = new_candle
+            elif new_candle['low'] > new_candle['EMA']:
+                self.logger.info("Entered Trade Region")
+                self.logger.info(f"Current Candle Low : {new_candle['low']} | Current EMA : {new_candle['EMA']}")
+                self.trigger_candle = new_candle    # New trigger candle
+                self.last_candle = new_candle   # Last candle
+                self.trade_region = True    # Moved into the trade region
+                self.publish_event("ENTERED TRADE REGION", low=new_candle['low'], ema=new_candle['EMA'])
+            else:
+                self.logger.info("Candle below EMA, out of trade region")
+                self.logger.info(f"Current Candle Low : {new_candle['low']} | Current EMA : {new_candle['EMA']}")
+
+        else:   # If I am currently in the trade region
+            if new_candle['close'] < self.trigger_candle['low']:    # Execute order
+                self.logger.info("Order Executing")
+                self.logger.info(f"Current Candle Close : {new_candle['close']} | Trigger Candle Low : {self.trigger_candle['low']}")
+
+                # Fetch all the action properties
+                lot_size = self.action_properties['lot_size']
+                qty = self.action_properties['quantity']
+                target = self.action_properties['target']
+                stoploss = min(float(self.action_properties['stoploss']), float(self.trigger_candle['high'] - new_candle['close']))
+                trailingSL = self.action_properties['trailing_stoploss']
+                paper_trading = True if self.action_properties['paper_trading'] == 1 else False
+
+                if self.broker.risk_engine.halted == True:
+                    self.logger.error("Portfolio risk limit hit, order skipped")
+                    self.trade_region = False
+                    self.last_candle = new_candle
                     return
-            self.logger.info("Market in progress ...")
-
-            while True: # Run this strategy unless stopped otherwise
-                self.logger.info("Waiting for the next candle ...")
-                mins = datetime.datetime.now().time().minute
-                nearest_interval = ((mins//5 + 1)*5)%60
-                while(datetime.datetime.now().time().minute != nearest_interval):    # Wait till the nearest 5 min interval
-                    sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-
-                if datetime.datetime.now().time() >= datetime.time(14, 30, 0, 0):  # Market Ended, so stop the strategy
-                    self.strategy_active_flag = False
-                    self.logger.info("Five EMA strategy stopped till next day. Market Closing.")
-                    break
-                
-                while True:
-                    if self.strategy_active_flag == 0:  # Strategy stopped by external event
-                        return
-
-                    market_data = self.__broker.fetch_BNF_historical_data()
-                    latest_record_time = market_data['date'].iloc[-1]
-
-                    if latest_record_time != self.last_fetched_record_time:  # New data available now
-                        self.last_fetched_record_time = latest_record_time
-                        break
-                    sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-
-                self.logger.info(f"TIME : {datetime.datetime.now()}\nNew Candle Fetched\n Candle TimeStamp : {latest_record_time}")
-
-                self.get_ema(market_data)   # Get values of EMA
-                new_candle = market_data.iloc[-1]
-
-                # STRATEGY
-                # ===========================================================
-                if self.trade_region == False:  # If I am currently out of the trade region
-                    if self.__broker.is_active_trade == True:   # Trade is already running
-                        self.last_candle = new_candle
-                    elif new_candle['low'] > new_candle['EMA']:
-                        self.logger.info("Entered Trade Region")
-                        self.logger.info(f"Current Candle Low : {new_candle['low']} | Current EMA : {new_candle['EMA']}")
-                        self.trigger_candle = new_candle    # New trigger candle
-                        self.last_candle = new_candle   # Last candle
-                        self.trade_region = True    # Moved into the trade region
-                    else:
-                        self.logger.info("Candle below EMA, out of trade region")
-                        self.logger.info(f"Current Candle Low : {new_candle['low']} | Current EMA : {new_candle['EMA']}")
-
-                else:   # If I am currently in the trade region
-                    if new_candle['close'] < self.trigger_candle['low']:    # Execute order
-                        self.logger.info("Order Executing")
-                        self.logger.info(f"Current Candle Close : {new_candle['close']} | Trigger Candle Low : {self.trigger_candle['low']}")
-                        
-                        # Fetch all the action properties
-                        lot_size = self.action_properties['lot_size']
-                        qty = self.action_properties['quantity']
-                        target = self.action_properties['target']
-                        stoploss = min(float(self.action_properties['stoploss']), float(self.trigger_candle['high'] - new_candle['close']))
-                        trailingSL = self.action_properties['trailing_stoploss']
-                        paper_trading = True if self.action_properties['paper_trading'] == 1 else False
-                        
-                        tradingsymbol = self.get_atm_pe(new_candle['close'])    # ATM PE TRADING SYMBOL
-
-                        self.__broker.place_buy_order(
-                            tradingsymbol = tradingsymbol,
-                            quantity = lot_size * qty,
-                            target = new_candle['close'] + min(target, 3*stoploss), 
-                            stoploss = stoploss,
-                            trailingSL = trailingSL,
-                            price = new_candle['close'],
-                            paper_trading=paper_trading
-                        )
-                        self.close_position_thread = threading.Thread(target=self.__broker.close_position)
-                        self.close_position_thread.start()
-
-                        self.trade_region = False   # Come out of trade region
-
-                    elif new_candle['close'] > self.trigger_candle['low']:  # Shift to new trigger candle
-                        if new_candle['low'] > new_candle['EMA'] and new_candle['low'] > self.last_candle['low']:
-                            self.logger.info("Trigger candle shifted")
-                            self.logger.info(f"Low : {new_candle['low']} EMA : {new_candle['EMA']} Last Low : {self.last_candle['low']}")
-                            self.trigger_candle = new_candle
-                        else:
-                            self.logger.info("EMA touching candle, Waiting for next one ..")
+
+                tradingsymbol = self.get_atm_pe(new_candle['close'])    # ATM PE TRADING SYMBOL
+                if tradingsymbol == -1:
+                    self.logger.error("ATM PE not found, order skipped")
+                    self.trade_region = False
                     self.last_candle = new_candle
+                    return
+
+                instrument_token = self.broker.get_instrument_token(tradingsymbol)
+                self.in_trade = True    # Set before the order is placed, so the next candle sees the trade
+                order = {
+                    "tradingsymbol": tradingsymbol,
+                    "instrument_token": instrument_token,
+                    "quantity": lot_size * qty,
+                    "target": new_candle['close'] + min(target, 3*stoploss),
+                    "stoploss": stoploss,
+                    "trailingSL": trailingSL,
+                    "price": new_candle['close'],
+                    "paper_trading": paper_trading
+                }
+                self.enter_trade(order)
+                self.publish_event("ORDER PLACED", **order)
+
+                self.trade_region = False   # Come out of trade region
+
+            elif new_candle['close'] > self.trigger_candle['low']:  # Shift to new trigger candle
+                if new_candle['low'] > new_candle['EMA'] and new_candle['low'] > self.last_candle['low']:
+                    self.logger.info("Trigger candle shifted")
+                    self.logger.info(f"Low : {new_candle['low']} EMA : {new_candle['EMA']} Last Low : {self.last_candle['low']}")
+                    self.trigger_candle = new_candle
+                    self.publish_event("TRIGGER SHIFTED", low=new_candle['low'], ema=new_candle['EMA'])
+                else:
+                    self.logger.info("EMA touching candle, Waiting for next one ..")
+            self.last_candle = new_candle
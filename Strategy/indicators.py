@@ -0,0 +1,210 @@
+# SYSTEM
+import threading
+from collections import deque
+
+# DATA
+import pandas as pd
+
+
+class Indicator:
+    """
+    Base of all streaming indicators. Every update is O(1) and consumes one closed bar
+    ({date, open, high, low, close, volume}). value is None till the indicator is warmed up.
+    Values match the batch pandas_ta values of the same bars.
+    """
+    def __init__(self):
+        self.value = None
+        self.last_date = None   # Date of the last bar consumed, repeated bars are ignored
+
+    def update(self, bar):
+        """
+        Updates the indicator with a closed bar and returns the latest value
+        """
+        if self.last_date != None and bar['date'] <= self.last_date:
+            return self.value
+        self.last_date = bar['date']
+        self.value = self.calculate(bar)
+        return self.value
+
+    def warm(self, bars):
+        """
+        Updates the indicator with a list of closed bars (or a dataframe of them), oldest first
+        """
+        if isinstance(bars, pd.DataFrame):
+            bars = bars.to_dict('records')
+        for bar in bars:
+            self.update(bar)
+        return self.value
+
+    def calculate(self, bar):
+        raise NotImplementedError
+
+
+class WilderAverage:
+    """
+    Streaming form of pandas_ta rma - adjusted exponential mean with alpha 1/length, which gives
+    values once length observations are available
+    """
+    def __init__(self, length):
+        self.length = length
+        self.decay = 1 - 1.0/length
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.count = 0
+
+    def update(self, x):
+        self.numerator = x + self.decay*self.numerator
+        self.denominator = 1 + self.decay*self.denominator
+        self.count += 1
+        return self.numerator/self.denominator if self.count >= self.length else None
+
+
+class SMA(Indicator):
+    """
+    Simple moving average of close, same as pandas_ta.sma
+    """
+    def __init__(self, length=10):
+        super().__init__()
+        self.length = length
+        self.window = deque()
+        self.total = 0.0
+
+    def calculate(self, bar):
+        self.window.append(bar['close'])
+        self.total += bar['close']
+        if len(self.window) > self.length:
+            self.total -= self.window.popleft()
+        return self.total/self.length if len(self.window) == self.length else None
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average of close, same as pandas_ta.ema (seeded with the SMA of the first
+    length closes)
+    """
+    def __init__(self, length=10):
+        super().__init__()
+        self.length = length
+        self.alpha = 2.0/(length + 1)
+        self.count = 0
+        self.seed_total = 0.0
+
+    def calculate(self, bar):
+        self.count += 1
+        if self.count < self.length:
+            self.seed_total += bar['close']
+            return None
+        if self.count == self.length:
+            return (self.seed_total + bar['close'])/self.length
+        return self.alpha*bar['close'] + (1 - self.alpha)*self.value
+
+
+class ATR(Indicator):
+    """
+    Average true range, same as pandas_ta.atr (rma of true range)
+    """
+    def __init__(self, length=14):
+        super().__init__()
+        self.length = length
+        self.average = WilderAverage(length)
+        self.prev_close = None
+
+    def calculate(self, bar):
+        prev_close = self.prev_close
+        self.prev_close = bar['close']
+        if prev_close == None:  # True range of the first bar is not defined
+            return None
+        true_range = max(bar['high'] - bar['low'], abs(bar['high'] - prev_close), abs(prev_close - bar['low']))
+        return self.average.update(true_range)
+
+
+class RSI(Indicator):
+    """
+    Relative strength index of close, same as pandas_ta.rsi
+    """
+    def __init__(self, length=14):
+        super().__init__()
+        self.length = length
+        self.gain_average = WilderAverage(length)
+        self.loss_average = WilderAverage(length)
+        self.prev_close = None
+
+    def calculate(self, bar):
+        prev_close = self.prev_close
+        self.prev_close = bar['close']
+        if prev_close == None:
+            return None
+        change = bar['close'] - prev_close
+        gain = self.gain_average.update(max(change, 0.0))
+        loss = self.loss_average.update(max(-change, 0.0))
+        if gain == None:
+            return None
+        if gain + loss == 0:
+            return float("nan")
+        return 100*gain/(gain + loss)
+
+
+class VWAP(Indicator):
+    """
+    Volume weighted average of the typical price, anchored to the start of every day, same as pandas_ta.vwap
+    """
+    def __init__(self):
+        super().__init__()
+        self.day = None
+        self.price_volume = 0.0
+        self.volume = 0.0
+
+    def calculate(self, bar):
+        day = pd.Timestamp(bar['date']).date()
+        if day != self.day:
+            self.day = day
+            self.price_volume = 0.0
+            self.volume = 0.0
+        typical_price = (bar['high'] + bar['low'] + bar['close'])/3
+        self.price_volume += typical_price*bar['volume']
+        self.volume += bar['volume']
+        return self.price_volume/self.volume if self.volume > 0 else None
+
+
+INDICATORS = {"SMA": SMA, "EMA": EMA, "ATR": ATR, "RSI": RSI, "VWAP": VWAP}
+
+
+class IndicatorEngine:
+    """
+    Shared registry of streaming indicators keyed by (instrument_token, timeframe, name, params).
+    Strategies asking for the same indicator get the same instance, which is updated once per bar.
+    """
+    def __init__(self):
+        self.indicators = {}    # {(instrument_token, timeframe, name, params) : Indicator}
+        self.indicators_by_series = {}  # {(instrument_token, timeframe) : [Indicator]}
+        self.lock = threading.Lock()
+
+    def has_series(self, instrument_token, timeframe):
+        """
+        Returns true if any indicator is computed for the series
+        """
+        return (instrument_token, timeframe) in self.indicators_by_series
+
+    def get_indicator(self, instrument_token, timeframe, name, warmup_bars=None, **params):
+        """
+        Returns the indicator for the series, creating it and warming it with the bars if it does not exist
+        """
+        key = (instrument_token, timeframe, name, tuple(sorted(params.items())))
+        with self.lock:
+            indicator = self.indicators.get(key)
+            if indicator == None:
+                indicator = INDICATORS[name](**params)
+                if warmup_bars is not None:
+                    indicator.warm(warmup_bars)
+                self.indicators[key] = indicator
+                self.indicators_by_series.setdefault((instrument_token, timeframe), []).append(indicator)
+            return indicator
+
+    def on_bar_close(self, instrument_token, timeframe, bar):
+        """
+        Updates every indicator of the series with the closed bar
+        """
+        with self.lock:
+            indicators = list(self.indicators_by_series.get((instrument_token, timeframe), []))
+        for indicator in indicators:
+            indicator.update(bar)
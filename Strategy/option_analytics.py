@@ -0,0 +1,210 @@
+# SYSTEM
+import datetime
+
+# DATA
+import numpy as np
+
+# CUSTOM
+import settings
+
+SQRT_2PI = np.sqrt(2*np.pi)
+DAYS_IN_YEAR = 365
+IV_BOUNDS = (1e-4, 5.0) # Bracket of the implied volatility solver (annual)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5*x*x)/SQRT_2PI
+
+
+def norm_cdf(x):
+    """
+    Cumulative standard normal distribution of an array, Hart's double precision approximation
+    (as given by West, 2005), accurate to about 1e-14. Evaluated in place, the cost of the small
+    chain arrays is in the number of numpy calls rather than their size.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x)
+    numerator = 0.0352624965998911*z
+    for c in [0.700383064443688, 6.37396220353165, 33.912866078383, 112.079291497871, 221.213596169931]:
+        numerator += c
+        numerator *= z
+    numerator += 220.206867912376
+    denominator = 0.0883883476483184*z
+    for c in [1.75566716318264, 16.064177579207, 86.7807322029461, 296.564248779674, 637.333633378831, 793.826512519948]:
+        denominator += c
+        denominator *= z
+    denominator += 440.413735824752
+    tail = np.exp(-0.5*z*z)
+    tail *= numerator
+    tail /= denominator
+    if z.size > 0 and z.max() >= 7.07106781186547:   # Continued fraction for the far tail
+        fraction = z + 1/(z + 2/(z + 3/(z + 4/(z + 0.65))))
+        tail = np.where(z < 7.07106781186547, tail, np.exp(-0.5*z*z)/fraction/2.506628274631)
+        tail[z > 37] = 0.0
+    return np.where(x > 0, 1 - tail, tail)
+
+
+def black_d1(forward, strikes, t, sigma):
+    sd = sigma*np.sqrt(t)
+    return (np.log(forward/strikes) + 0.5*sd*sd)/sd, sd
+
+
+def black_price(forward, strikes, t, sigma, is_call, rate=0.0):
+    """
+    Black-76 prices of European options on the forward. Arguments are arrays (or scalars) which
+    broadcast, t in years, sigma annual, is_call True for CE and False for PE.
+    """
+    discount = np.exp(-rate*t)
+    d1, sd = black_d1(forward, strikes, t, sigma)
+    call = discount*(forward*norm_cdf(d1) - strikes*norm_cdf(d1 - sd))
+    return np.where(is_call, call, call - discount*(forward - strikes))    # Put from put-call parity
+
+
+def black_greeks(forward, strikes, t, sigma, is_call, rate=0.0):
+    """
+    Returns {delta, gamma, theta, vega} arrays of the options (arguments as black_price). Delta and
+    gamma are per unit move of the forward, theta per calendar day and vega per vol point (1%).
+    NaN where sigma is NaN.
+    """
+    discount = np.exp(-rate*t)
+    d1, sd = black_d1(forward, strikes, t, sigma)
+    pdf = norm_pdf(d1)
+    price = black_price(forward, strikes, t, sigma, is_call, rate)
+    delta = np.where(is_call, discount*norm_cdf(d1), -discount*norm_cdf(-d1))
+    gamma = discount*pdf/(forward*sd)
+    vega = discount*forward*pdf*np.sqrt(t)
+    theta = -discount*forward*pdf*sigma/(2*np.sqrt(t)) + rate*price
+    return {"delta": delta, "gamma": gamma, "theta": theta/DAYS_IN_YEAR, "vega": vega/100}
+
+
+def implied_volatility(prices, forward, strikes, t, is_call, rate=0.0, tolerance=1e-8, max_iterations=100):
+    """
+    Black-76 implied volatilities of the option prices, all the options solved together till the
+    volatility changes by less than the tolerance. ITM options are solved as the OTM option of their
+    strike (price less intrinsic value, by put-call parity), which is far better conditioned. Each
+    iteration takes the Newton step where it stays inside the bisection bracket of the option and
+    bisects otherwise, so every option converges. NaN where the price is not available or outside
+    the no-arbitrage bounds.
+    """
+    prices, forward, strikes, t, is_call = np.broadcast_arrays(
+        np.asarray(prices, dtype=np.float64), np.asarray(forward, dtype=np.float64),
+        np.asarray(strikes, dtype=np.float64), np.asarray(t, dtype=np.float64), np.asarray(is_call, dtype=bool)
+    )
+    discount = np.exp(-rate*t)
+    intrinsic = discount*np.maximum(np.where(is_call, forward - strikes, strikes - forward), 0)
+    prices = prices - intrinsic
+    is_call = strikes >= forward
+    upper = discount*np.where(is_call, forward, strikes)
+    valid = np.isfinite(prices) & (prices > 0) & (prices < upper) & (t > 0)
+
+    low = np.full(prices.shape, IV_BOUNDS[0])
+    high = np.full(prices.shape, IV_BOUNDS[1])
+    with np.errstate(divide='ignore', invalid='ignore'):    # Initial guess, Brenner-Subrahmanyam approximation
+        sigma = np.clip(np.sqrt(2*np.pi/t)*prices/forward, *IV_BOUNDS)
+    active = np.flatnonzero(valid)
+    for _ in range(max_iterations):
+        if active.size == 0:
+            break
+        s = sigma[active]
+        f, k, tt, c = forward[active], strikes[active], t[active], is_call[active]
+        d1, sd = black_d1(f, k, tt, s)
+        price = black_price(f, k, tt, s, c, rate)
+        difference = price - prices[active]
+        high[active] = np.where(difference > 0, s, high[active])   # Price increases with volatility
+        low[active] = np.where(difference < 0, s, low[active])
+        vega = discount[active]*f*norm_pdf(d1)*np.sqrt(tt)
+        with np.errstate(divide='ignore', invalid='ignore'):    # Newton on log of the price, far OTM prices fall exponentially with volatility
+            newton = s - np.log(price/prices[active])*price/vega
+        inside = (price > 0) & (vega > 0) & (newton > low[active]) & (newton < high[active])
+        step = np.where(inside, newton, 0.5*(low[active] + high[active]))
+        done = (np.abs(step - s) < tolerance) | (difference == 0) | (high[active] - low[active] < tolerance)
+        sigma[active] = np.where(difference == 0, s, step)
+        active = active[~done]
+    return np.where(valid, sigma, np.nan)
+
+
+def implied_forward(strikes, call_prices, put_prices, t, rate=0.0, guess=None):
+    """
+    Forward of the expiry from put-call parity, F = K + e^(rt) (C - P), the median over the 3 strikes
+    nearest to the guess which have both prices. Returns the guess if no strike has both.
+    """
+    both = np.flatnonzero(np.isfinite(call_prices) & np.isfinite(put_prices))
+    if both.size == 0:
+        return guess
+    if guess != None:
+        both = both[np.argsort(np.abs(strikes[both] - guess))[:3]]
+    return float(np.median(strikes[both] + np.exp(rate*t)*(call_prices[both] - put_prices[both])))
+
+
+class ChainAnalytics:
+    """
+    IV and greeks of every strike of an option chain from the LTPs of its options, solved for the
+    whole chain at once so it can be refreshed several times per second. The forward is implied from
+    put-call parity, weekly expiries need no futures of their own. Arrays are aligned with the strikes
+    of the chain and NaN where the option has no price.
+    """
+    def __init__(self, chain, rate=settings.RISK_FREE_RATE):
+        self.chain = chain
+        self.rate = rate
+        self.expiry_time = datetime.datetime.combine(chain.expiry, settings.MARKET_CLOSE_TIME)
+        self.updated_at = None
+        self.forward = None
+        self.t = None   # Time to expiry in years
+        empty = {x: np.full(len(chain), np.nan) for x in ["ltp", "iv", "delta", "gamma", "theta", "vega"]}
+        self.ce = dict(empty)
+        self.pe = dict(empty)
+        self.iv = np.full(len(chain), np.nan)   # Smile, IV of the OTM option of every strike
+
+    def refresh(self, ce_ltps, pe_ltps, underlying_price, now):
+        """
+        Recomputes the analytics from the LTPs of the CE and PE of every strike (NaN if not known).
+        underlying_price is the forward guess, e.g. the futures price. Returns False if no forward
+        could be found.
+        """
+        strikes = self.chain.strikes
+        self.t = max((self.expiry_time - now).total_seconds(), 60)/(DAYS_IN_YEAR*24*3600)
+        forward = implied_forward(strikes, ce_ltps, pe_ltps, self.t, self.rate, underlying_price)
+        if forward == None:
+            return False
+        self.forward = forward
+        n = strikes.size    # CE and PE solved together, [CE strikes, PE strikes]
+        ltps = np.concatenate([ce_ltps, pe_ltps]).astype(np.float64)
+        all_strikes = np.concatenate([strikes, strikes])
+        is_call = np.arange(2*n) < n
+        iv = implied_volatility(ltps, forward, all_strikes, self.t, is_call, self.rate)
+        greeks = black_greeks(forward, all_strikes, self.t, iv, is_call, self.rate)
+        greeks.update({"ltp": ltps, "iv": iv})
+        self.ce = {k: v[:n] for k, v in greeks.items()}
+        self.pe = {k: v[n:] for k, v in greeks.items()}
+        self.iv = np.where(strikes >= forward, self.ce['iv'], self.pe['iv'])
+        self.updated_at = now
+        return True
+
+    def position_by_delta(self, delta):
+        """
+        Returns position of the strike whose CE (delta > 0) or PE (delta < 0) delta is nearest to the
+        delta, None if no delta is known
+        """
+        deltas = self.ce['delta'] if delta > 0 else self.pe['delta']
+        if np.isnan(deltas).all():
+            return None
+        return int(np.nanargmin(np.abs(deltas - delta)))
+
+    def delta_neutral_position(self):
+        """
+        Returns position of the strike whose straddle (CE + PE) has the smallest net delta, None if
+        no strike has both deltas
+        """
+        net = np.abs(self.ce['delta'] + self.pe['delta'])
+        if np.isnan(net).all():
+            return None
+        return int(np.nanargmin(net))
+
+    def atm_iv(self):
+        """
+        Returns IV of the strike nearest to the forward, None if not known
+        """
+        if self.forward == None:
+            return None
+        iv = self.iv[self.chain.nearest_position(self.forward)]
+        return None if np.isnan(iv) else float(iv)
@@ -1,81 +1,80 @@
 # SYSTEM
-import logging
-import os
 import datetime
-import threading
-from time import sleep
-import csv
+import uuid
 
-#DATA
-import json
-
-# CUSTOM 
+# CUSTOM
 import settings
-from Broker.main_broker import Zerodha
+from Strategy.base_strategy import BaseStrategy
+from Broker.basket_executor import BasketLeg
+
 
+class ShortStraddle(BaseStrategy):
+    """
+    Sells the ATM straddle of the underlying at the entry time of every trading day and buys it back
+    on target or stoploss of either leg, or at the exit time
+    """
+    LOGGER_NAME = 'Short Straddle Logger'
+    LOG_FILE = "ShortStraddle.log"
 
-class ShortStraddle:
-    def __init__(self, broker:Zerodha):
-        self.__broker = broker
-        if self.__broker == None:
-            exit(1)
-        self.logger = self.get_logger()
+    def __init__(self, runtime, name="SHORT STRADDLE", params=None):
+        super().__init__(runtime, name, params)
+        self.underlying = self.params.get("underlying", "BANKNIFTY")
+        self.lot_size = self.params.get("lot_size", 25)
+        self.paper_trading = self.params.get("paper_trading", True)   # Legs are sent as paper orders
+        self.entry_time = self.params.get("entry_time", datetime.time(9, 17, 0, 0))
+        self.exit_time = self.params.get("exit_time", datetime.time(14, 55, 0, 0))
 
         self.running_trades = [None, None] # [{STRATEGY, DATE TIME, ORDER_ID, TRADING_SYMBOL, BANKNIFTY FUT LTP, QUANTITY, ENTRY PRICE, STATUS}]
+        self.straddle_legs = None  # [[ce_token, atm_ce], [pe_token, atm_pe]] of the running straddle
+        self.straddle_strike = None
+        self.underlying_token = None    # Instrument token of the underlying FUT, resolved at entry time
+        self.entry = None   # (atm, bnf_price, chain_tokens) of the straddle being entered
+        self.exits = []  # [(legs, reasons)] of the exit baskets placed, in order
+        self.failed_exits = []  # [(legs, reasons)] of the exit baskets that could not be placed, placed again after a backoff
+        self.exit_attempts = 0  # Consecutive exit baskets that could not be placed
 
-        self.month_mapping = {1:"JAN", 2:"FEB", 3:"MAR", 4:"APR", 5:"MAY", 6:"JUN", 7:"JUL", 8:"AUG", 9:"SEP", 10:"OCT", 11:"NOV", 12:"DEC"}
-
-        month = self.month_mapping[datetime.date.today().month]
-        year = (datetime.date.today().year)%100
-        tradingsymbol = f"BANKNIFTY{year}{month}FUT"
-        if self.__broker.check_trading_symbol(tradingsymbol) == True:
-            self.bank_nifty_fut_instrument_token = self.__broker.get_instrument_token(tradingsymbol)
-        else:
-            month = self.month_mapping[(datetime.date.today().month + 1)%12]
-            if datetime.date.today().month == 12:
-                year = year+1
-            tradingsymbol = f"BANKNIFTY{year}{month}FUT"
-            self.bank_nifty_fut_instrument_token = self.__broker.get_instrument_token(tradingsymbol)
-
-        # Create Excel Order Log
-        if not os.path.isfile(settings.SHORT_STRADDLE_ORDER_LOG_FILE):
-            with open(settings.SHORT_STRADDLE_ORDER_LOG_FILE, "a") as file:
-                field_names = ["ORDER ID", "DATE TIME", "INSTRUMENT TOKEN", "ORDER TYPE", "QUANTITY", "BNF PRICE", "ATM PRICE"]
-                writer = csv.DictWriter(file, fieldnames=field_names)
-                writer.writeheader()
-    
-    def get_logger(self):
-        """
-        Creates a logger with stream and file handlers, and returns it. 
-        """
-        logger = logging.getLogger('Short Straddle Logger')
-        logger.setLevel(logging.DEBUG)
-        c_handler = logging.StreamHandler()
-        f_handler = logging.FileHandler(os.path.join(settings.LOGS_FOLDER, "ShortStraddle.log"))
-        c_handler.setLevel(logging.DEBUG)
-        f_handler.setLevel(logging.DEBUG)
-        c_format = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
-        f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        c_handler.setFormatter(c_format)
-        f_handler.setFormatter(f_format)
-        logger.addHandler(c_handler)
-        logger.addHandler(f_handler)
-        logger.info("Logger initialized")
-        return logger
+    def get_chain(self):
+        """
+        Returns the option chain of the expiry of the underlying FUT, None in case of failure
+        """
+        expiry = self.broker.get_expiry(self.underlying_token)
+        return self.broker.get_option_chain(self.underlying, expiry)
 
     def get_atm(self, price):
         """
-        Returns selected BankNifty ATM PE for the price passed
+        Returns selected ATM strike (OptionStrike with CE/PE tokens and symbols) for the price passed,
+        None in case of failure
+        """
+        chain = self.get_chain()
+        if chain == None:
+            return None
+
+        atm = chain.nearest(price)
+        if atm.ce_token == -1 or atm.pe_token == -1:
+            self.logger.error(f"Both CE and PE are not listed for strike {atm.strike}")
+            return None
+        return atm
+
+    def get_delta_neutral_strike(self, atm, bnf_price, chain_tokens):
+        """
+        Returns the strike around the ATM whose straddle has the smallest net delta, from the IV and
+        greeks of the chain. The other strikes subscribed for it (chain_tokens) are unsubscribed.
+        Falls back to the ATM strike if the greeks are not available.
         """
-        if price%100 >= 50:
-            price = ((price//100)+1)*100
-        else:
-            price = (price//100)*100
+        strike = atm
+        analytics = self.broker.get_chain_analytics(self.underlying, bnf_price, self.broker.get_expiry(self.underlying_token))
+        position = analytics.delta_neutral_position() if analytics != None else None
+        if position == None:
+            self.logger.error("Straddle greeks not available, ATM strike taken")
+        elif analytics.chain.ce_tokens[position] != -1 and analytics.chain.pe_tokens[position] != -1:
+            strike = analytics.chain.get_strike(position)
+            self.logger.info(f"Delta neutral strike {strike.strike}, net delta {analytics.ce['delta'][position] + analytics.pe['delta'][position]:.3f}, ATM IV {analytics.atm_iv()}")
 
-        bnf_fut = self.__broker.get_trading_symbol(self.bank_nifty_fut_instrument_token)[:-3]
-        tradingsymbol_PE = f"{bnf_fut}{int(price)}PE"
-        tradingsymbol_CE = f"{bnf_fut}{int(price)}CE"
-        return tradingsymbol_CE, tradingsymbol_PE
+        held = self.broker.positions_view.tokens
+        unused = [x for x in chain_tokens if x not in (strike.ce_token, strike.pe_token) and x not in held]
+        if unused:
+            self.broker.unsubscribe_instruments(unused)
+        return strike
 
     def get_positions(self):
         """
@@ -86,9 +85,12 @@ class ShortStraddle:
     def close_position(self, ind=[], reason=[2, 2]):
         """
         ind : [[ce_token, atm_ce], [pe_token, atm_pe]]
-        reason : 0 - Target, 1 - Stoploss, 2 - Time Trigger
+        reason : 0 - Target, 1 - Stoploss, 2 - Time Trigger, 3 - Portfolio Risk, 4 - Net Delta
         """
-        reason_mapping = {0: "Target Reached", 1:"Stoploss Triggered", 2:"Time Trigger"}
+        reason_mapping = {0: "Target Reached", 1:"Stoploss Triggered", 2:"Time Trigger", 3:"Portfolio Risk Exit", 4:"Net Delta Exit"}
+
+        reasons = [reason_mapping[x] for x in reason]
+        self.place_exit(ind, reasons)
 
         for counter in range(len(ind)):
             item = ind[counter]
@@ -96,162 +98,261 @@ class ShortStraddle:
             ORDER ID : PAPER TRADE
             ORDER TYPE : BUY
             TRADING SYMBOL : {item[1]}
-            BANKNIFTY FUT PRICE : {self.__broker.live_data_dictionary[self.bank_nifty_fut_instrument_token]}
-            ENTRY PRICE : {self.__broker.live_data_dictionary[item[0]]}
+            BANKNIFTY FUT PRICE : {self.broker.get_ltp(self.underlying_token)}
+            ENTRY PRICE : {self.broker.get_ltp(item[0])}
             QUANTITY : 1
             REASON : {reason_mapping[reason[counter]]}
             """)
 
-    def update_broker_instance(self, broker):
-        """
-        Updates new broker instance
-        """
-        self.__broker = broker
-
-    def run_short_straddle(self):
-        """
-        Run short straddle strategy unless explicitely stopped
-        """    
-        self.logger.info("5EMA strategy started...")
-        self.strategy_active_flag = True
-        lot_size = 25
-
-        while True:
-            self.logger.info("Waiting for market to start ...")
-            while datetime.datetime.now().time() <= datetime.time(9, 16, 0, 0) or datetime.datetime.now().time() >= datetime.time(15, 30, 0, 0):
-                sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-                if self.strategy_active_flag == False:
-                    return
-
-            self.logger.info("Market in progress ...")
-
-            while True: # Run this strategy unless stopped otherwise
-                while datetime.datetime.now().time() <= datetime.time(9, 17, 0):
-                    sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-                
-                if datetime.datetime.now().time() > datetime.time(9, 18, 0):
-                    break
-                
-                self.logger.info("Strategy executed, time : 09:17")
-                bnf_price = self.__broker.live_data_dictionary[self.bank_nifty_fut_instrument_token]
-                atm_ce, atm_pe = self.get_atm(bnf_price)
-                ce_token = self.__broker.get_instrument_token(atm_ce)
-                pe_token = self.__broker.get_instrument_token(atm_pe)
-                self.__broker.subscribe_instruments([ce_token, pe_token])
-                sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-
-                # =================================================================================================
-                # Execute orders
-                #  [{STRATEGY, DATE TIME, ORDER_ID, TRADING_SYMBOL, BANKNIFTY FUT LTP, QUANTITY, ENTRY PRICE, STATUS}]
-                self.logger.info(f"""
-                ORDER ID : PAPER TRADE
-                ORDER TYPE : SELL
-                TRADING SYMBOL : {atm_ce}
-                BANKNIFTY FUT PRICE : {bnf_price}
-                ENTRY PRICE : {self.__broker.live_data_dictionary[ce_token]}
-                QUANTITY : 1
-                """)
-
-                self.logger.info(f"""
-                ORDER ID : PAPER TRADE
-                ORDER TYPE : SELL
-                TRADING SYMBOL : {atm_pe}
-                BANKNIFTY FUT PRICE : {bnf_price}
-                ENTRY PRICE : {self.__broker.live_data_dictionary[pe_token]}
-                QUANTITY : 1
-                """)
-
-                d = {"STRATEGY": "SHORT STRADDLE", "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "ORDER ID": "PAPER TRADE", "BANKNIFTY FUT LTP": bnf_price, "QUANTITY": "1", 
-                "ENTRY PRICE": self.__broker.live_data_dictionary[ce_token], "STATUS": "ACTIVE",
-                "TRADING SYMBOL": atm_ce
-                }
-                self.running_trades[0] = d
-                d = {"STRATEGY": "SHORT STRADDLE", "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "ORDER ID": "PAPER TRADE", "BANKNIFTY FUT LTP": bnf_price, "QUANTITY": "1", 
-                "ENTRY PRICE": self.__broker.live_data_dictionary[pe_token], "STATUS": "ACTIVE",
-                "TRADING SYMBOL": atm_pe
-                }
-
-                # =========================================================================================================
-                # EXCEL UPLOAD
-                # "ORDER ID", "DATE TIME", "INSTRUMENT TOKEN", "ORDER TYPE", "QUANTITY", "BNF PRICE", "ATM PRICE"
-                excel_log_ce = {
-                    "ORDER ID": "PAPER_TRADE",
-                    "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "ORDER TYPE": "SELL",
-                    "INSTRUMENT TOKEN": atm_ce, 
-                    "QUANTITY": 1*lot_size,
-                    "BNF PRICE": bnf_price,
-                    "ATM PRICE": self.__broker.live_data_dictionary[ce_token]
-                    }
-                excel_log_pe = {
-                    "ORDER ID": "PAPER_TRADE",
-                    "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "ORDER TYPE": "SELL",
-                    "INSTRUMENT TOKEN": atm_ce, 
-                    "QUANTITY": 1*lot_size,
-                    "BNF PRICE": bnf_price,
-                    "ATM PRICE": self.__broker.live_data_dictionary[pe_token]
-                    }
-                with open(settings.SHORT_STRADDLE_ORDER_LOG_FILE, "a") as file:
-                    writer = csv.DictWriter(file, fieldnames=list(excel_log_ce.keys()))
-                    writer.writerows([excel_log_ce, excel_log_pe])
-
-
-                self.running_trades[1] = d
-                while datetime.datetime.now().time() <= datetime.time(14, 55, 0, 0):
-                    ce_ltp = self.__broker.live_data_dictionary[ce_token]
-                    pe_ltp = self.__broker.live_data_dictionary[pe_token]
-                    if self.running_trades[0] != None and ce_ltp <= self.running_trades[0]['ENTRY PRICE'] - 2500/lot_size:   # CE TARGET REACHED
-                        self.close_position(ind=[[ce_token, atm_ce], [pe_token, atm_pe]], reason=[0, 0])
-                        self.running_trades = [None, None]
-                        
-                    elif self.running_trades[0] != None and ce_ltp >= self.running_trades[0]['ENTRY PRICE'] + 2500/lot_size: # CE STOPLOSS TRIGGERED
-                        self.close_position(ind=[[ce_token, atm_ce], [pe_token, atm_pe]], reason=[1, 1])
-                        self.running_trades = [None, None]
-
-                    if self.running_trades[1] != None and pe_ltp <= self.running_trades[1]['ENTRY PRICE'] - 2500/lot_size:   # PE TARGET TRIGGERED
-                        self.close_position(ind=[[pe_token, atm_pe], [ce_token, atm_ce]], reason=[0, 0])
-                        self.running_trades = [None, None]
-
-                    elif self.running_trades[1] != None and pe_ltp >= self.running_trades[1]['ENTRY PRICE'] + 2500/lot_size: # PE STOPLOSS TRIGGERED
-                        self.close_position(ind=[[pe_token, atm_pe], [ce_token, atm_ce]], reason=[1, 1])
-                        self.running_trades = [None, None]
-
-                    if self.running_trades == [None, None]:
-                        self.logger.info("Short straddle trade completed for today")
-                        break
-
-                    sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-
-                excel_log_ce = {
-                    "ORDER ID": "PAPER_TRADE",
-                    "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "ORDER TYPE": "BUY",
-                    "INSTRUMENT TOKEN": atm_ce, 
-                    "QUANTITY": 1*lot_size,
-                    "BNF PRICE": bnf_price,
-                    "ATM PRICE": self.__broker.live_data_dictionary[ce_token]
-                    }
-                excel_log_pe = {
-                    "ORDER ID": "PAPER_TRADE",
-                    "DATE TIME": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "ORDER TYPE": "BUY",
-                    "INSTRUMENT TOKEN": atm_ce, 
-                    "QUANTITY": 1*lot_size,
-                    "BNF PRICE": bnf_price,
-                    "ATM PRICE": self.__broker.live_data_dictionary[pe_token]
-                    }
-                with open(settings.SHORT_STRADDLE_ORDER_LOG_FILE, "a") as file:
-                    writer = csv.DictWriter(file, fieldnames=list(excel_log_ce.keys()))
-                    writer.writerows([excel_log_ce, excel_log_pe])
-
-                if self.running_trades[0] != None:
-                    self.close_position(ind=[[ce_token, atm_ce], [pe_token, atm_pe]], reason=[2, 2])
-                break
-
-            self.logger.info("Waiting for market to end")
-            while datetime.datetime.now().time() <= datetime.time(15, 30, 0, 0):
-                sleep(settings.SLEEP_TIME_BETWEEN_ATTEMPTS)
-            
+    def place_exit(self, ind, reasons):
+        """
+        Buys both legs back together as one basket. It is never unwound, a rejected leg is bought back
+        again and stays open in the positions and the risk engine till then.
+        """
+        legs = [BasketLeg(item[1], "BUY", self.lot_size) for item in ind]
+        self.exits.append((ind, reasons))
+        self.place_basket("EXIT", legs, self.paper_trading, unwind=False)
+        self.publish_event("EXIT ORDER PLACED", legs=[item[1] for item in ind], reasons=reasons)
+
+    def retry_exit(self, legs, reasons, error):
+        """
+        The legs are still open after the exit basket could not be placed, it is placed again after a
+        backoff (doubled on every failure) till it goes through
+        """
+        delay = min(settings.EXIT_RETRY_INTERVAL * 2**self.exit_attempts, settings.EXIT_RETRY_MAX_INTERVAL)
+        self.exit_attempts += 1
+        self.logger.critical(f"Straddle exit could not be placed, legs are still open. Placing again in {delay} sec : {error}")
+        self.publish_event("EXIT FAILED", legs=[x[1] for x in legs], reasons=reasons, attempts=self.exit_attempts, retry_in=delay)
+        self.failed_exits.append((legs, reasons))
+        self.schedule_at(self.broker.clock.now() + datetime.timedelta(seconds=delay), "RETRY EXIT", persistent=True)
+
+    def on_tick(self, tick):
+        """
+        Tick handler for the CE and PE legs. Closes the straddle as soon as target or stoploss of
+        either leg is hit.
+        """
+        if self.running_trades == [None, None] or self.straddle_legs == None:
+            return
+        [ce_token, atm_ce], [pe_token, atm_pe] = self.straddle_legs
+        ce_ltp = self.broker.get_ltp(ce_token)
+        pe_ltp = self.broker.get_ltp(pe_token)
+        if ce_ltp == None or pe_ltp == None:
+            return
+        lot_size = self.lot_size
+
+        if self.running_trades[0] != None and ce_ltp <= self.running_trades[0]['ENTRY PRICE'] - 2500/lot_size:   # CE TARGET REACHED
+            self.close_position(ind=[[ce_token, atm_ce], [pe_token, atm_pe]], reason=[0, 0])
+            self.running_trades = [None, None]
+
+        elif self.running_trades[0] != None and ce_ltp >= self.running_trades[0]['ENTRY PRICE'] + 2500/lot_size: # CE STOPLOSS TRIGGERED
+            self.close_position(ind=[[ce_token, atm_ce], [pe_token, atm_pe]], reason=[1, 1])
+            self.running_trades = [None, None]
+
+        if self.running_trades[1] != None and pe_ltp <= self.running_trades[1]['ENTRY PRICE'] - 2500/lot_size:   # PE TARGET TRIGGERED
+            self.close_position(ind=[[pe_token, atm_pe], [ce_token, atm_ce]], reason=[0, 0])
+            self.running_trades = [None, None]
+
+        elif self.running_trades[1] != None and pe_ltp >= self.running_trades[1]['ENTRY PRICE'] + 2500/lot_size: # PE STOPLOSS TRIGGERED
+            self.close_position(ind=[[pe_token, atm_pe], [ce_token, atm_ce]], reason=[1, 1])
+            self.running_trades = [None, None]
+
+        if self.running_trades[0] != None and settings.STRADDLE_MAX_NET_DELTA != None:
+            net_delta = self.get_net_delta()
+            if net_delta != None and abs(net_delta) > settings.STRADDLE_MAX_NET_DELTA:   # NET DELTA EXIT
+                self.logger.info(f"Straddle net delta {net_delta:.3f} beyond {settings.STRADDLE_MAX_NET_DELTA}")
+                self.close_position(ind=[[ce_token, atm_ce], [pe_token, atm_pe]], reason=[4, 4])
+                self.running_trades = [None, None]
+
+        if self.running_trades == [None, None]:
+            self.logger.info("Short straddle trade completed for today")
+            self.finish_straddle()
+
+    def get_net_delta(self):
+        """
+        Returns net delta (per unit, CE + PE) of the long straddle of the running strike, the sold
+        straddle has the opposite. None if not available.
+        """
+        bnf_price = self.broker.get_ltp(self.underlying_token)
+        analytics = self.broker.get_chain_analytics(self.underlying, bnf_price, self.broker.get_expiry(self.underlying_token))
+        if analytics == None or self.straddle_strike == None:
+            return None
+        position = analytics.chain.nearest_position(self.straddle_strike)
+        net_delta = analytics.ce['delta'][position] + analytics.pe['delta'][position]
+        return None if net_delta != net_delta else float(net_delta)  # NaN if either leg has no IV
+
+    def on_start(self):
+        """
+        The straddle is sold at the entry time of every trading day and bought back on target or
+        stoploss of either leg, or at the exit time, unless explicitely stopped
+        """
+        self.logger.info("Short straddle strategy started...")
+        self.schedule_daily(self.entry_time, "ENTRY")
+        self.schedule_daily(self.exit_time, "EXIT")  # Time exit
+
+    def on_session_event(self, event):
+        if event == "ENTRY":
+            self.on_entry_time()
+        elif event == "ENTER":
+            self.enter_straddle()
+        elif event == "EXIT":
+            self.finish_straddle()
+        elif event == "RETRY EXIT":
+            self.place_exit(*self.failed_exits.pop(0))
+
+    def on_entry_time(self):
+        """
+        Picks the ATM strike and subscribes its legs, the straddle is sold once their prices have arrived.
+        With STRADDLE_STRIKE_SELECTION DELTA the strikes around the ATM are subscribed as well and the
+        delta neutral one is sold.
+        """
+        self.logger.info(f"Strategy executed, time : {self.entry_time.strftime('%H:%M')}")
+        if self.broker.risk_engine.halted == True:
+            self.logger.error("Portfolio risk limit hit, short straddle skipped for today")
+            return
+        self.underlying_token = self.broker.get_fut_token(self.underlying)
+        bnf_price = self.broker.get_ltp(self.underlying_token)
+        if bnf_price == None:
+            self.logger.error("BankNifty FUT price not available, short straddle skipped for today")
+            return
+        atm = self.get_atm(bnf_price)
+        if atm == None:
+            self.logger.error("ATM strike not found, short straddle skipped for today")
+            return
+        chain_tokens = []
+        if settings.STRADDLE_STRIKE_SELECTION == "DELTA":
+            strikes, ce_tokens, pe_tokens = self.get_chain().around(bnf_price, settings.STRADDLE_CHAIN_STRIKES)
+            chain_tokens = [x for x in ce_tokens.tolist() + pe_tokens.tolist() if x != -1]
+        self.broker.subscribe_instruments(chain_tokens if chain_tokens else [atm.ce_token, atm.pe_token])
+        self.entry = (atm, bnf_price, chain_tokens)
+        self.schedule_at(self.broker.clock.now() + datetime.timedelta(seconds=settings.SLEEP_TIME_BETWEEN_ATTEMPTS), "ENTER")
+
+    def on_order_update(self, tag, orders, error):
+        if tag == "ENTRY":
+            self.on_straddle_entered(orders, error)
+        elif tag == "EXIT":
+            legs, reasons = self.exits.pop(0)
+            self.on_straddle_exited(orders, error, legs, reasons)
+
+    def on_straddle_exited(self, orders, error, legs, reasons):
+        """
+        Journals the bought back legs of the straddle
+        """
+        if error != None:   # Rejected legs are bought back again by the basket, this is a failure to place it at all
+            self.retry_exit(legs, reasons, error)
+            return
+        self.exit_attempts = 0
+        self.journal_legs(orders, legs, "BUY", self.broker.get_ltp(self.underlying_token), reasons)
+        for order, [token, symbol] in zip(orders, legs):
+            self.broker.close_leg(self.name, token, self.broker.get_fill_price(order, token))
+        self.publish_event("EXITED", legs=[x[1] for x in legs], reasons=reasons)
+
+    def journal_legs(self, orders, legs, transaction_type, bnf_price, reasons=[None, None], prices=None):
+        """
+        Records the filled legs ([[token, symbol]]) of a straddle basket in the trade journal, at the
+        fill prices of the orders unless the prices already taken for them are passed
+        """
+        basket_id = uuid.uuid4().hex
+        date_time = self.broker.clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        prices = prices or [self.broker.get_fill_price(order, token) for order, [token, symbol] in zip(orders, legs)]
+        for leg, (order, [token, symbol]) in enumerate(zip(orders, legs)):
+            self.broker.journal.record(
+                date_time=date_time, strategy=self.name, order_id=order['order_id'], basket_id=basket_id, leg=leg,
+                tradingsymbol=symbol, instrument_token=token, transaction_type=transaction_type, quantity=self.lot_size,
+                price=prices[leg], underlying_price=bnf_price,
+                paper_trade=self.paper_trading, reason=reasons[leg]
+            )
+
+    def enter_straddle(self):
+        """
+        Sells both legs of the ATM strike (or of the delta neutral strike, if chain_tokens were
+        subscribed for it) together as one basket
+        """
+        atm, bnf_price, chain_tokens = self.entry
+        if chain_tokens:
+            atm = self.get_delta_neutral_strike(atm, bnf_price, chain_tokens)
+            self.entry = (atm, bnf_price, [])
+        legs = [BasketLeg(atm.ce_symbol, "SELL", self.lot_size), BasketLeg(atm.pe_symbol, "SELL", self.lot_size)]
+        self.place_basket("ENTRY", legs, self.paper_trading)
+        self.publish_event("ORDER PLACED", legs=[atm.ce_symbol, atm.pe_symbol], bnf_price=bnf_price)
+
+    def on_straddle_entered(self, orders, error):
+        """
+        Logs the sold legs of the straddle and starts tracking them on their ticks
+        """
+        atm, bnf_price, _ = self.entry
+        self.entry = None
+        atm_ce, atm_pe = atm.ce_symbol, atm.pe_symbol
+        ce_token, pe_token = atm.ce_token, atm.pe_token
+        if error != None:
+            self.logger.error(f"Straddle entry failed, short straddle skipped for today : {error}")
+            self.broker.unsubscribe_instruments([ce_token, pe_token])
+            return
+        ce_order, pe_order = orders
+        ce_price = self.broker.get_fill_price(ce_order, ce_token)  # Targets and stoplosses are measured from the fills
+        pe_price = self.broker.get_fill_price(pe_order, pe_token)
+
+        # =================================================================================================
+        # Log orders
+        #  [{STRATEGY, DATE TIME, ORDER_ID, TRADING_SYMBOL, BANKNIFTY FUT LTP, QUANTITY, ENTRY PRICE, STATUS}]
+        self.logger.info(f"""
+        ORDER ID : {ce_order['order_id']}
+        ORDER TYPE : SELL
+        TRADING SYMBOL : {atm_ce}
+        BANKNIFTY FUT PRICE : {bnf_price}
+        ENTRY PRICE : {ce_price}
+        QUANTITY : 1
+        """)
+
+        self.logger.info(f"""
+        ORDER ID : {pe_order['order_id']}
+        ORDER TYPE : SELL
+        TRADING SYMBOL : {atm_pe}
+        BANKNIFTY FUT PRICE : {bnf_price}
+        ENTRY PRICE : {pe_price}
+        QUANTITY : 1
+        """)
+
+        date_time = self.broker.clock.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.running_trades[0] = {"STRATEGY": self.name, "DATE TIME": date_time,
+        "ORDER ID": ce_order['order_id'], "BANKNIFTY FUT LTP": bnf_price, "QUANTITY": "1",
+        "ENTRY PRICE": ce_price, "STATUS": "ACTIVE",
+        "TRADING SYMBOL": atm_ce
+        }
+        self.running_trades[1] = {"STRATEGY": self.name, "DATE TIME": date_time,
+        "ORDER ID": pe_order['order_id'], "BANKNIFTY FUT LTP": bnf_price, "QUANTITY": "1",
+        "ENTRY PRICE": pe_price, "STATUS": "ACTIVE",
+        "TRADING SYMBOL": atm_pe
+        }
+
+        self.journal_legs(orders, [[ce_token, atm_ce], [pe_token, atm_pe]], "SELL", bnf_price, prices=[ce_price, pe_price])
+        for order, token, symbol, price in [(ce_order, ce_token, atm_ce, ce_price), (pe_order, pe_token, atm_pe, pe_price)]:
+            self.broker.open_leg(self.name, token, symbol, order['order_id'], "SELL", self.lot_size, price, date_time)
+        self.publish_event("ENTERED", legs=[atm_ce, atm_pe], bnf_price=bnf_price)
+
+        # Exits are handled on the ticks of the legs and by the time exit event
+        self.straddle_legs = [[ce_token, atm_ce], [pe_token, atm_pe]]
+        self.straddle_strike = atm.strike
+        self.subscribe_ticks(ce_token)
+        self.subscribe_ticks(pe_token)
+
+    def on_flatten(self, reason):
+        """
+        Closes the running straddle on a portfolio breach of the risk engine
+        """
+        self.logger.critical(f"Closing the straddle, {reason}")
+        self.finish_straddle(reason=3)
+
+    def finish_straddle(self, reason=2):
+        """
+        Stops tracking the running straddle and closes the legs still open (time exit by default,
+        reason codes of close_position)
+        """
+        if self.straddle_legs == None:
+            return
+        [ce_token, atm_ce], [pe_token, atm_pe] = self.straddle_legs
+        self.straddle_legs = None
+        if self.running_trades[0] != None:
+            self.close_position(ind=[[ce_token, atm_ce], [pe_token, atm_pe]], reason=[reason, reason])
+            self.running_trades = [None, None]
+        self.unsubscribe_ticks(ce_token)
+        self.unsubscribe_ticks(pe_token)
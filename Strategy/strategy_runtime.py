@@ -0,0 +1,251 @@
+# SYSTEM
+import threading
+import logging
+from collections import deque
+
+
+class EventLoop:
+    """
+    Calls run one at a time, in the order they were posted, on a single clock thread. The thread
+    waits on the clock, so under a VirtualClock the replay waits for the loop to drain like for any
+    strategy thread.
+    """
+    def __init__(self, clock, logger, name):
+        self.clock = clock
+        self.logger = logger
+        self.name = name
+        self.queue = deque()    # (callback, args), appended from any thread
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        if self.thread == None:
+            self.thread = self.clock.spawn(self.run)
+
+    def post(self, callback, *args):
+        """
+        Queues callback(*args) to be run on the loop, can be called from any thread
+        """
+        self.queue.append((callback, args))
+        self.wakeup.set()
+
+    def run(self):
+        while self.stopped == False:
+            if not self.queue:
+                self.wakeup.clear()
+                if not self.queue:  # Nothing posted between the check and the clear
+                    self.clock.wait(self.wakeup)
+                continue
+            callback, args = self.queue.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                self.logger.error(f"Error in {self.name} loop callback {getattr(callback, '__name__', callback)} ..", exc_info=True)
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+
+
+class StrategyRuntime:
+    """
+    Hosts any number of strategy instances (BaseStrategy) on one event loop, one tick bus and one
+    broker. The broker feeds a single subscriber per token and per bar series, fanned out on the loop
+    to the instances subscribed. Orders are placed on their own loop, other blocking broker calls
+    (historical fetches) run on a worker loop, so an order never queues behind a slow fetch. Their
+    outcome comes back on the strategy loop. Adding an instance adds no threads and no polling.
+    """
+    def __init__(self, broker, logger=None):
+        self.broker = broker
+        self.logger = logger if logger != None else logging.getLogger('Zerodha Logger')
+        self.loop = EventLoop(broker.clock, self.logger, "strategy")
+        self.orders = EventLoop(broker.clock, self.logger, "orders")    # Order placement, never behind the worker
+        self.worker = EventLoop(broker.clock, self.logger, "worker")    # REST calls never hold up the strategy loop
+        self.strategies = {}    # {name : BaseStrategy}
+        self.tick_routes = {}   # {instrument_token : [BaseStrategy]} copy on write, read from the ticker thread
+        self.bar_routes = {}    # {(instrument_token, timeframe) : [BaseStrategy]}
+        self.lock = threading.Lock()    # Guards the routes
+
+    # =================================================================================================================
+    # INSTANCES
+    def add(self, strategy):
+        """
+        Adds a strategy instance, started later with start
+        """
+        if strategy.name in self.strategies:
+            raise ValueError(f"Strategy instance {strategy.name} already exists")
+        self.strategies[strategy.name] = strategy
+        self.add_flatten_handler(strategy)
+        return strategy
+
+    def add_flatten_handler(self, strategy):
+        self.broker.risk_engine.add_flatten_handler(strategy.name, lambda reason: self.loop.post(strategy.on_flatten, reason))
+
+    def run(self, *names):
+        """
+        Starts the loops and the named instances. Returns immediately.
+        """
+        self.loop.start()
+        self.orders.start()
+        self.worker.start()
+        for name in names:
+            self.start(name)
+
+    def start(self, name):
+        self.loop.post(self.start_strategy, self.strategies[name])
+
+    def stop(self, name):
+        self.loop.post(self.stop_strategy, self.strategies[name])
+
+    def is_active(self, name):
+        return self.strategies[name].active == True
+
+    def start_strategy(self, strategy):
+        if strategy.active == True:
+            return
+        strategy.active = True
+        strategy.on_start()
+
+    def stop_strategy(self, strategy):
+        if strategy.active == False:
+            return
+        strategy.active = False
+        strategy.on_stop()
+        for event in strategy.session_events:
+            event.cancel()
+        strategy.session_events = []
+
+    def update_broker(self, broker):
+        """
+        Moves the instances to the broker of the new day, with their tick and bar subscriptions
+        """
+        self.broker = broker
+        with self.lock:
+            for instrument_token in self.tick_routes:
+                broker.add_tick_subscriber(instrument_token, self.on_tick)
+            if len(self.tick_routes) > 0:   # The new ticker starts with the FUT only
+                broker.subscribe_instruments(list(self.tick_routes))
+            for (instrument_token, timeframe) in self.bar_routes:
+                self.worker.post(broker.subscribe_candles, instrument_token, timeframe, self.on_bar)
+        for strategy in self.strategies.values():
+            self.add_flatten_handler(strategy)
+
+    # =================================================================================================================
+    # TICK AND BAR BUS
+    def subscribe_ticks(self, strategy, instrument_token):
+        """
+        Routes the ticks of the token to the strategy. The token must be subscribed on the ticker.
+        """
+        with self.lock:
+            routes = self.tick_routes.get(instrument_token, [])
+            if strategy in routes:
+                return
+            self.tick_routes[instrument_token] = routes + [strategy]
+            if len(routes) == 0:
+                self.broker.add_tick_subscriber(instrument_token, self.on_tick)
+
+    def unsubscribe_ticks(self, strategy, instrument_token):
+        with self.lock:
+            routes = [x for x in self.tick_routes.get(instrument_token, []) if x is not strategy]
+            if len(routes) > 0:
+                self.tick_routes[instrument_token] = routes
+            elif self.tick_routes.pop(instrument_token, None) != None:
+                self.broker.remove_tick_subscriber(instrument_token, self.on_tick)
+
+    def on_tick(self, tick):
+        """
+        Tick subscriber of the broker, called from the ticker thread
+        """
+        self.loop.post(self.dispatch_tick, tick)
+
+    def dispatch_tick(self, tick):
+        for strategy in self.tick_routes.get(tick['instrument_token'], []):
+            try:
+                strategy.on_tick(tick)
+            except Exception as e:
+                strategy.logger.error("Error in tick handler ..", exc_info=True)
+
+    def subscribe_bars(self, strategy, instrument_token, timeframe):
+        """
+        Routes the closed bars of the token and timeframe (in min) to the strategy. The series is
+        subscribed on the broker (seeded with a historical fetch) on the worker.
+        """
+        key = (instrument_token, timeframe)
+        with self.lock:
+            routes = self.bar_routes.get(key, [])
+            if strategy in routes:
+                return
+            self.bar_routes[key] = routes + [strategy]
+            if len(routes) == 0:
+                self.worker.post(self.broker.subscribe_candles, instrument_token, timeframe, self.on_bar)
+
+    def unsubscribe_bars(self, strategy, instrument_token, timeframe):
+        key = (instrument_token, timeframe)
+        with self.lock:
+            routes = [x for x in self.bar_routes.get(key, []) if x is not strategy]
+            if len(routes) > 0:
+                self.bar_routes[key] = routes
+            elif self.bar_routes.pop(key, None) != None:
+                self.broker.unsubscribe_candles(instrument_token, timeframe, self.on_bar)
+
+    def on_bar(self, instrument_token, timeframe, bar):
+        """
+        Bar subscriber of the broker, called when a bar closes
+        """
+        self.loop.post(self.dispatch_bar, instrument_token, timeframe, bar)
+
+    def dispatch_bar(self, instrument_token, timeframe, bar):
+        for strategy in self.bar_routes.get((instrument_token, timeframe), []):
+            try:
+                strategy.on_bar(instrument_token, timeframe, bar)
+            except Exception as e:
+                strategy.logger.error("Error in bar handler ..", exc_info=True)
+
+    # =================================================================================================================
+    # SESSION EVENTS
+    def schedule_daily(self, strategy, time_of_day, event):
+        return self.broker.scheduler.daily(time_of_day, self.loop.post, strategy.on_session_event, event)
+
+    def schedule_at(self, strategy, when, event):
+        return self.broker.scheduler.at(when, self.loop.post, strategy.on_session_event, event)
+
+    # =================================================================================================================
+    # ORDERS
+    def place_order(self, strategy, tag, tradingsymbol, transaction_type, quantity, paper_trading=False):
+        """
+        Places the order on the orders loop, strategy.on_order_update(tag, order, error) is called on
+        the loop once it is final
+        """
+        self.orders.post(self.submit, strategy, tag, lambda: (self.broker.place_paper_order if paper_trading == True else self.broker.place_order)(
+            tradingsymbol, transaction_type, quantity
+        ))
+
+    def place_basket(self, strategy, tag, legs, paper_trading=False, unwind=True):
+        """
+        Places the basket on the orders loop, strategy.on_order_update(tag, orders, error) is called on
+        the loop once it is final. Exit baskets are placed with unwind False.
+        """
+        self.orders.post(self.submit, strategy, tag, lambda: self.broker.place_basket(legs, paper_trading=paper_trading, unwind=unwind))
+
+    def submit(self, strategy, tag, place):
+        try:
+            handle = place()
+        except Exception as e:
+            self.logger.error(f"Error placing {tag} order of {strategy.name} ..", exc_info=True)
+            self.loop.post(strategy.on_order_update, tag, None, e)
+            return
+        handle.add_done_callback(lambda x: self.loop.post(strategy.on_order_update, tag, x.result() if x.exception() == None else None, x.exception()))
+
+    def run_blocking(self, then, function, *args, **kwargs):
+        """
+        Runs function(*args, **kwargs) on the worker and then(result, error) on the loop
+        """
+        def call():
+            try:
+                result, error = function(*args, **kwargs), None
+            except Exception as e:
+                self.logger.error(f"Error in {getattr(function, '__name__', function)} ..", exc_info=True)
+                result, error = None, e
+            self.loop.post(then, result, error)
+        self.worker.post(call)
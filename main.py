@@ -1,3 +1,22 @@
-from API.api_connect import app
+import sys
+import settings
 
-app.run('0.0.0.0', port=12345)
+# python main.py            : API server with the trading engine in the same process
+# python main.py engine     : trading engine process, publishing to the API processes
+# python main.py api        : API server processes of the engine process (gunicorn)
+# The engine and API processes authenticate with the key in ALGOTRADER_ENGINE_KEY
+mode = sys.argv[1] if len(sys.argv) > 1 else "embedded"
+
+if mode in ["engine", "api"] and len(settings.ENGINE_AUTHKEY) == 0:
+    sys.exit("Set ALGOTRADER_ENGINE_KEY to the same secret for the engine and API processes")
+
+if mode == "engine":
+    from API.trading_engine import TradingEngine
+    TradingEngine().serve()
+elif mode == "api":
+    settings.ENGINE_MODE = "remote"
+    from API.api_server import serve
+    serve()
+else:
+    from API.api_connect import app
+    app.run('0.0.0.0', port=12345)
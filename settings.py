@@ -1,5 +1,6 @@
 import os
 import json
+import datetime
 
 # GLOBAL PATHS
 # ===========================================================================================
@@ -8,12 +9,19 @@ BROKER_DIR = os.path.join(BASE_DIR, "Broker")
 STRATEGY_DIR = os.path.join(BASE_DIR, "Strategy")
 
 BROKER_CREDENTIALS_FILE = os.path.join(BROKER_DIR, "credentials.json")
+BROKER_ACCOUNTS_FILE = os.path.join(BROKER_DIR, "accounts.json")  # Linked accounts sent every order of the main account, [{user_id, password, totp_code, api_key, api_secret, multiplier}]
 INSTRUMENTS_FILE = os.path.join(BROKER_DIR, "instruments.csv")
+INSTRUMENTS_SNAPSHOT_DIR = os.path.join(BROKER_DIR, "instruments_snapshot")
 ACTION_PROPERTIES_FILE = os.path.join(STRATEGY_DIR, "properties.json")
 
 LOGS_FOLDER = os.path.join(BASE_DIR, "Logs")
-CSV_LOGS_FILE = os.path.join(LOGS_FOLDER, "order_log.csv")
-SHORT_STRADDLE_ORDER_LOG_FILE = os.path.join(BASE_DIR, "short_straddle_orders.csv")
+
+DATA_FOLDER = os.path.join(BASE_DIR, "Data")
+CANDLE_CACHE_DIR = os.path.join(DATA_FOLDER, "candles")
+BACKTEST_RESULTS_FOLDER = os.path.join(DATA_FOLDER, "backtests")
+TICK_DATA_DIR = os.path.join(DATA_FOLDER, "ticks")
+TRADE_JOURNAL_FILE = os.path.join(DATA_FOLDER, "trade_journal.db")
+SIMULATION_JOURNAL_FILE = os.path.join(DATA_FOLDER, "simulation_journal.db")
 
 # CREATING CREDENTIAL FILE TEMPLATES
 # ===========================================================================================
@@ -38,6 +46,97 @@ MAX_FETCH_INSTRUMENT_FILE_ATTEMPT_COUNT = 3 # Number of attempts made to fetch a
 MAX_ORDER_PLACEMENT_RETRIES = 5 # Number of attempts to place the order
 MAX_ORDER_CANCELLATION_RETRIES = 5  # Number of attempts to cancel an order
 HISTORICAL_DATA_FETCH_MAX_RETRY = 10    # Number of retries to fetch historical data
+ORDER_STATUS_POLL_INTERVAL = 3  # Time (in sec) after which pending orders are checked with one orders() call, in case their update was missed on the ticker
+BASKET_EXIT_RETRY_INTERVAL = 5  # Time (in sec) after which failed legs of an exit basket are placed again, exit baskets are never unwound
+EXIT_RETRY_INTERVAL = 5 # Time (in sec) after which an exit order (or basket) that failed is placed again, doubled on every failure
+EXIT_RETRY_MAX_INTERVAL = 60    # Longest time (in sec) between attempts of a failing exit
+EARLY_ORDER_UPDATE_EXPIRY = 60   # Time (in sec) a final update pushed before its order id was tracked is kept, updates of orders placed elsewhere expire
 
 TICKER_RETRY_TIMEOUT = 5    # Time (in sec) till we will wait for ticker to start
-DATA_UPDATE_TIME = 3    # Time after which live data is updated
\ No newline at end of file
+TICKER_MODE = "full"    # Streaming mode of subscribed instruments, full carries exchange timestamp, OI and depth for the tick recorder
+TICK_BUFFER_SIZE = 4096 # Latest ticks kept in memory for every instrument token (64 bytes each)
+DATA_UPDATE_TIME = 3    # Time after which live data is updated
+
+MARKET_OPEN_TIME = datetime.time(9, 15, 0, 0)   # Session open, bars of every timeframe are aligned to it
+MARKET_CLOSE_TIME = datetime.time(15, 30, 0, 0) # Session close
+TRADING_WEEKDAYS = [0, 1, 2, 3, 4]  # Monday to Friday, daily session events are not fired on other days
+CANDLE_CLOSE_GRACE_TIME = 0.2   # Time (in sec) after a bar boundary for which in-flight ticks are still added to the bar
+
+# INSTRUMENT SNAPSHOT
+# ===========================================================================================
+INSTRUMENT_SNAPSHOT_FILTER = True   # Keep only the instruments we trade in the daily snapshot
+INSTRUMENT_SNAPSHOT_UNDERLYINGS = ["BANKNIFTY"]    # NFO futures/options kept when filtering (NSE equities are always kept)
+
+# HISTORICAL CANDLE CACHE
+# ===========================================================================================
+CANDLE_CACHE_SETTLE_TIME = 300  # Time (in sec) after market close from which a fetched day is treated as complete
+HISTORICAL_DATA_MAX_DAYS_PER_REQUEST = {"minute": 60, "3minute": 100, "5minute": 100, "10minute": 100, "15minute": 200, "30minute": 200, "60minute": 400, "day": 2000}  # Kite limits per request
+
+# KITE REQUESTS
+# ===========================================================================================
+KITE_RATE_LIMITS = {"order": (8, 2), "historical": (2, 1), "default": (8, 2)}   # (requests per sec, burst) of every endpoint, rate + burst stays within Kite's limits (orders 10/sec, historical 3/sec, others 10/sec)
+KITE_MAX_CONCURRENT_REQUESTS = 4    # Kite calls in flight at once, same as the connection pool size
+KITE_HTTP_POOL = {"pool_connections": 1, "pool_maxsize": KITE_MAX_CONCURRENT_REQUESTS, "max_retries": 0}  # Keep-alive connection pool of the Kite session (requests HTTPAdapter params)
+KITE_RATE_LIMIT_BACKOFF = 1 # Time (in sec) an endpoint is held after Kite answers 429
+
+# TICK RECORDER
+# ===========================================================================================
+TICK_RECORDING = True   # Record every tick received to the per day tick files
+TICK_RECORDER_GROW_RECORDS = 1000000    # Records (64 bytes each) the day file grows by when it is full
+
+# TRADE JOURNAL
+# ===========================================================================================
+TRADE_JOURNAL_FLUSH_INTERVAL = 0.5  # Time (in sec) a recorded fill may wait to be batched before it is written
+TRADE_JOURNAL_BATCH_SIZE = 500  # Maximum fills written in one transaction
+TRADE_JOURNAL_BUSY_TIMEOUT = 10 # Time (in sec) to wait for the journal database lock
+TRADEBOOK_PAGE_SIZE = 200   # Fills returned per /tradebook page by default
+TRADEBOOK_MAX_PAGE_SIZE = 1000  # Largest page a /tradebook request can ask for
+POSITIONS_LONG_POLL_TIMEOUT = 30 # Longest time (in sec) a /positions long-poll is held waiting for a change
+
+# EVENT STREAM
+# ===========================================================================================
+STREAM_PUBLISH_INTERVAL = 0.5   # Time (in sec) between pushes of changed positions and LTPs to /stream clients
+STREAM_CLIENT_QUEUE_SIZE = 1000 # Strategy events a /stream client may fall behind by before it is disconnected
+STREAM_HEARTBEAT_INTERVAL = 15  # Time (in sec) after which an idle /stream connection gets a keepalive comment
+STREAM_RECENT_EVENTS = 256  # Strategy events kept for the engine snapshot and replayed to reconnecting /stream clients, a client may miss at most this many
+
+# RISK
+# ===========================================================================================
+PORTFOLIO_STOP_LOSS = 10000 # Portfolio MTM loss (in Rs) of the day at which every strategy is flattened, None to disable
+PORTFOLIO_LOCK_IN_TRIGGER = 6000    # Portfolio MTM profit (in Rs) which arms the lock-in, None to disable
+PORTFOLIO_LOCK_IN = 3000    # Profit (in Rs) locked in once armed, every strategy is flattened if the MTM falls to it
+RISK_SHOCK_PERCENT = 10 # Adverse move (in % of LTP) of every open leg for the margin at risk
+
+# OPTION ANALYTICS
+# ===========================================================================================
+RISK_FREE_RATE = 0.07   # Annual rate for the option pricing
+OPTION_ANALYTICS_REFRESH = 0.25 # Time (in sec) for which the IV and greeks of a chain are reused before they are recomputed
+STRADDLE_STRIKE_SELECTION = "FUTURES"   # FUTURES : strike nearest to the futures price, DELTA : strike whose straddle has the smallest net delta
+STRADDLE_CHAIN_STRIKES = 5  # Strikes on either side of the ATM subscribed for the delta selection
+STRADDLE_MAX_NET_DELTA = None   # Straddle is closed when the net delta (per unit) of its legs exceeds this, None to disable
+
+# STRATEGY RUNTIME
+# ===========================================================================================
+STRATEGY_INSTANCES = [  # Strategy instances hosted by the trading engine, names must be unique. Instances with autostart False are started and stopped with /make_bot_active
+    {"name": "FIVE EMA", "strategy": "FiveEMA", "autostart": False, "params": {"underlying": "BANKNIFTY", "timeframe": 5, "ema_length": 5}},
+    {"name": "SHORT STRADDLE", "strategy": "ShortStraddle", "autostart": True, "params": {"underlying": "BANKNIFTY", "lot_size": 25, "paper_trading": True}}
+]
+
+# ENGINE
+# ===========================================================================================
+ENGINE_MODE = "embedded"    # embedded : trading engine runs in the API process, remote : in its own process (python main.py engine)
+ENGINE_SNAPSHOT_NAME = "algotrader_engine"  # Shared memory segment of the engine snapshot
+ENGINE_SNAPSHOT_SIZE = 4*1024*1024  # Bytes of the snapshot segment
+ENGINE_SNAPSHOT_INTERVAL = 0.1  # Time (in sec) between checks for changes to publish
+ENGINE_SNAPSHOT_HEARTBEAT = 1   # Time (in sec) after which an unchanged snapshot is published again
+ENGINE_SNAPSHOT_STALE = 5   # Time (in sec) without a snapshot after which the API considers the engine down
+ENGINE_COMMAND_ADDRESS = ("localhost", 12346)   # Command channel of the engine process
+ENGINE_AUTHKEY = os.environ.get("ALGOTRADER_ENGINE_KEY", "").encode()  # Shared by the engine and API processes, must be set in remote engine mode
+API_BIND = "0.0.0.0:12345"  # Address of the API server in remote engine mode
+API_WORKER_PROCESSES = 4    # Gunicorn worker processes in remote engine mode
+API_WORKER_THREADS = 32 # Threads of every worker, each /stream client and /positions long-poll holds one
+API_WORKER_TIMEOUT = 60 # Time (in sec) a silent worker is restarted after
+
+# SIMULATION
+# ===========================================================================================
+SIMULATION_SETTLE_TIMEOUT = 5   # Time (in real sec) a woken thread may run before the replay stops waiting for it to park on the clock
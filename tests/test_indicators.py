@@ -0,0 +1,87 @@
+# SYSTEM
+import os
+import sys
+
+# DATA
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Strategy.indicators import SMA, EMA, ATR, RSI, VWAP
+
+ta = pytest.importorskip("pandas_ta")
+
+
+def make_bars(days=3, bars_per_day=75, seed=7):
+    """
+    Random walk 5 minute bars of several sessions
+    """
+    rng = np.random.default_rng(seed)
+    dates = []
+    for day in pd.bdate_range("2026-10-12", periods=days):
+        dates.extend(day + pd.Timedelta(hours=9, minutes=15) + pd.Timedelta(minutes=5)*np.arange(bars_per_day))
+    close = 45000 + np.cumsum(rng.normal(0, 20, len(dates)))
+    open_ = close + rng.normal(0, 5, len(dates))
+    high = np.maximum(open_, close) + rng.uniform(0, 15, len(dates))
+    low = np.minimum(open_, close) - rng.uniform(0, 15, len(dates))
+    volume = rng.integers(1000, 50000, len(dates)).astype(float)
+    return pd.DataFrame({"date": dates, "open": open_, "high": high, "low": low, "close": close, "volume": volume})
+
+
+def stream(indicator, bars):
+    """
+    Feeds the bars one at a time and returns the value after every bar, NaN while not warmed up
+    """
+    values = [indicator.update(bar) for bar in bars.to_dict('records')]
+    return np.array([np.nan if x == None else x for x in values], dtype=float)
+
+
+def assert_matches(streamed, batch):
+    batch = np.asarray(batch, dtype=float)
+    warmed = np.flatnonzero(~np.isnan(batch))
+    assert warmed.size > 0
+    # Same warm up as the batch values, and equal from there on
+    assert np.isnan(streamed[:warmed[0]]).all()
+    np.testing.assert_allclose(streamed[warmed[0]:], batch[warmed[0]:], rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("length", [5, 10, 20])
+def test_sma(length):
+    bars = make_bars()
+    assert_matches(stream(SMA(length), bars), ta.sma(bars['close'], length=length, talib=False))
+
+
+@pytest.mark.parametrize("length", [5, 10, 20])
+def test_ema(length):
+    bars = make_bars()
+    assert_matches(stream(EMA(length), bars), ta.ema(bars['close'], length=length, talib=False))
+
+
+@pytest.mark.parametrize("length", [5, 14])
+def test_atr(length):
+    bars = make_bars()
+    assert_matches(stream(ATR(length), bars), ta.atr(bars['high'], bars['low'], bars['close'], length=length, talib=False))
+
+
+@pytest.mark.parametrize("length", [5, 14])
+def test_rsi(length):
+    bars = make_bars()
+    assert_matches(stream(RSI(length), bars), ta.rsi(bars['close'], length=length, talib=False))
+
+
+def test_vwap():
+    bars = make_bars()
+    indexed = bars.set_index(pd.DatetimeIndex(bars['date']))
+    batch = ta.vwap(indexed['high'], indexed['low'], indexed['close'], indexed['volume'], anchor="D")
+    assert_matches(stream(VWAP(), bars), batch.to_numpy())
+
+
+def test_warm_matches_streaming():
+    # Warming with the closed bars of the day and then streaming gives the same value as streaming all of them
+    bars = make_bars()
+    warmed = EMA(5)
+    warmed.warm(bars.iloc[:100])
+    for bar in bars.iloc[100:].to_dict('records'):
+        warmed.update(bar)
+    np.testing.assert_allclose(warmed.value, stream(EMA(5), bars)[-1])